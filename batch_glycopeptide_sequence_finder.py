@@ -0,0 +1,306 @@
+"""
+batch_glycopeptide_sequence_finder.py
+
+Runs the glycopeptide sequence finder over every FASTA file in a directory using a persistent pool of worker
+processes. The workers only import the dependency-light core (glycopeptide_sequence_finder_core.py, no pandas) and
+receive the glycan library compiled once in the main process (GlycanLibrary). Every FASTA file is split into work
+units of a fixed number of protein records, the units of the largest files are queued first, and idle workers take
+the next unit from the shared queue, so a single large proteome is spread over all cores instead of one. The FASTA
+files are read lazily: a unit is only read when a worker slot is free (at most two units per worker are in flight),
+and each unit is sent once and digested with all selected proteases. The rows of each unit are appended to the
+peptide and glycopeptide libraries of its proteome as soon as the units before it are written (open_library_output,
+optionally gzip or zstd compressed), so only the units that finished out of order are held in memory. A proteome
+with a failed unit or an unreadable FASTA file is dropped, its file is not read any further, and it is reported as
+failed; the other proteomes of the batch carry on. The row counts and timings collected from the workers are
+written to the summary report (summary_batch_run.txt).
+
+Usage:
+    python batch_glycopeptide_sequence_finder.py -i <input_dir> -p <protease> -g <glycosylation_type> -c <missed_cleavages> -m <max_peptide_length> -z <max_charge> -j <cores> -u <unit_size> -y <glycan_file> [--fragment_charges <min> <max>] [--isotopes <n>] [--compress gz|zst] -v
+
+Author:
+    Richard Shipman -- 2025
+"""
+import argparse
+import glob
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import islice
+
+import glycopeptide_sequence_finder_core as gsf
+
+# Compiled glycan library of the worker process, set once by the pool initializer
+worker_glycans = None
+
+def init_worker(glycans):
+    """Keeps the compiled glycan library sent by the main process for every work unit of the worker."""
+    global worker_glycans
+    worker_glycans = glycans
+
+def run_unit(records, proteases, missed_cleavages, glycosylation_type, charge_state, peptide_max_length, fragment_charges=None,
+             isotopes=None):
+    """Digests one work unit of protein records with each protease in a worker and returns the libraries and timings by protease."""
+    results = {}
+    for protease in proteases:
+        start_wall = time.perf_counter()
+        start_cpu = time.process_time()
+        libraries = gsf.digest_record_rows(records, protease, missed_cleavages, glycosylation_type, worker_glycans,
+                                           charge_state, peptide_max_length, fragment_charges=fragment_charges, isotopes=isotopes)
+        libraries["wall_time"] = time.perf_counter() - start_wall
+        libraries["cpu_time"] = time.process_time() - start_cpu
+        results[protease] = libraries
+    return results
+
+def list_fasta_files(input_dir):
+    """Lists the FASTA files of a directory (plain, .gz, .bz2 or .xz), largest first."""
+    fasta_files = [file for pattern in ["*.fasta"] + [f"*.fasta{extension}" for extension in gsf.compressed_fasta_extensions]
+                   for file in glob.glob(os.path.join(input_dir, pattern))]
+    fasta_files.sort(key=os.path.getsize, reverse=True)
+    return fasta_files
+
+def iter_work_units(fasta_files, unit_size, skip=(), on_error=None):
+    """
+    Yields the work units of the FASTA files as (fasta_file, unit_index, records, last) tuples of at most unit_size
+    (protein_id, description, sequence) records. The files are read lazily, one unit ahead to know the last unit, and
+    files in skip (proteomes that already failed) are not read any further. An error reading a file is passed to
+    on_error(fasta_file, error) and the next file is read, or raised without on_error.
+    """
+    for fasta_file in fasta_files:
+        try:
+            records = gsf.read_fasta_records(fasta_file)
+            # Every file yields at least one unit so empty files still get (empty) libraries
+            unit = list(islice(records, unit_size))
+            unit_index = 0
+            while fasta_file not in skip:
+                next_unit = list(islice(records, unit_size)) if len(unit) == unit_size else []
+                yield fasta_file, unit_index, unit, not next_unit
+                if not next_unit:
+                    break
+                unit, unit_index = next_unit, unit_index + 1
+        except Exception as error:
+            if on_error is None:
+                raise
+            on_error(fasta_file, error)
+
+def split_work_units(fasta_file, unit_size):
+    """Splits a FASTA file into work units of at most unit_size (protein_id, description, sequence) records."""
+    return [records for _, _, records, _ in iter_work_units([fasta_file], unit_size)]
+
+def write_proteome_units(proteome):
+    """
+    Appends the stored work units of a proteome that are next in unit order to its peptide and glycopeptide
+    libraries, opening the library outputs on the first unit. Returns True once the last unit is written.
+    """
+    while proteome["next_unit"] in proteome["parts"]:
+        libraries = proteome["parts"].pop(proteome["next_unit"])
+        if "outputs" not in proteome:
+            proteome["outputs"] = [gsf.open_library_output(proteome["peptide_file"]),
+                                   gsf.open_library_output(proteome["glycopeptide_file"])]
+            proteome["writers"] = [gsf.RowWriter(proteome["outputs"][0], gsf.peptide_fields),
+                                   gsf.RowWriter(proteome["outputs"][1], libraries["glycopeptide_fields"])]
+        proteome["writers"][0].write(libraries["peptide_library"])
+        proteome["writers"][1].write(libraries["glycopeptide_library"])
+        proteome["peptides"] += len(libraries["peptide_library"])
+        proteome["glycopeptides"] += len(libraries["glycopeptide_library"])
+        proteome["next_unit"] += 1
+    if proteome["next_unit"] != proteome["units"]:
+        return False
+    close_proteome(proteome)
+    return True
+
+def new_proteome(fasta_file, protease, args):
+    """Returns the state of a proteome: its library files, the units written so far and the collected counts."""
+    peptide_file, glycopeptide_file = gsf.library_output_files(fasta_file, protease, args.missed_cleavages, args.charge,
+                                                               args.glycosylation)
+    if args.compress:
+        peptide_file, glycopeptide_file = f"{peptide_file}.{args.compress}", f"{glycopeptide_file}.{args.compress}"
+    return {
+        "input_file": fasta_file, "protease": protease, "units": None, "next_unit": 0, "parts": {},
+        "peptide_file": peptide_file, "glycopeptide_file": glycopeptide_file, "failed": False,
+        "proteins": 0, "peptides": 0, "glycopeptides": 0, "wall_time": 0.0, "cpu_time": 0.0,
+    }
+
+def close_proteome(proteome, remove=False):
+    """
+    Closes the library outputs of a proteome, removing the partly written files of a failed proteome (files this run
+    has not opened are left alone).
+    """
+    outputs = proteome.pop("outputs", [])
+    for output in outputs:
+        output.close()
+    proteome.pop("writers", None)
+    if remove and outputs:
+        for output_file in (proteome["peptide_file"], proteome["glycopeptide_file"]):
+            if os.path.exists(output_file):
+                os.remove(output_file)
+
+def write_summary_report(summary_report, results, args, elapsed_time, failed=()):
+    """Writes the batch run summary from the row counts and timings collected from the workers."""
+    peptide_count = sum(result["peptides"] for result in results)
+    glycopeptide_count = sum(result["glycopeptides"] for result in results)
+    elapsed_time_mins = f"{elapsed_time / 60:.2f}"
+    failed_names = [f"{os.path.basename(proteome['input_file'])} ({proteome['protease']})" for proteome in failed]
+
+    with open(summary_report, "w") as report:
+        report.write("==================== Glycopeptide Sequence Finder Summary ====================\n")
+        report.write("After some finding and searching for glycopeptides in input protein/proteome FASTA...\n")
+        report.write(f"Total Peptide Sequences Found: {peptide_count}\n")
+        report.write(f"Peptides generated using {args.protease} digestion with {args.missed_cleavages} missed cleavages.\n")
+        report.write(f"Total Glycopeptide Sequences Found: {glycopeptide_count}\n")
+        report.write("---------------------------------------------------------------------------\n")
+        report.write("Batch Run Summary:\n")
+        report.write(f"Total Elapsed Time: {elapsed_time_mins} minutes\n")
+        report.write(f"Protease Used: {args.protease}\n")
+        report.write(f"Missed Cleavages: {args.missed_cleavages}\n")
+        report.write(f"Glycosylation Type: {args.glycosylation}-Glycosylation\n")
+        report.write(f"Number of Peptide Sequences: {peptide_count}\n")
+        report.write(f"Number of {args.glycosylation}-Glycopeptide Sequences: {glycopeptide_count}\n")
+        report.write(f"Worker Processes: {args.cores}\n")
+        report.write("---------------------------------------------------------------------------\n")
+        report.write(f"Work Units: {sum(result['units'] for result in results)} of up to {args.unit_size} proteins\n")
+        report.write(f"Failed Proteomes: {len(failed)}{''.join(', ' + name for name in failed_names)}\n")
+        report.write("---------------------------------------------------------------------------\n")
+        report.write("Per File Results (File, Protease, Proteins, Peptides, Glycopeptides, Worker Time (s), CPU Time (s)):\n")
+        for result in sorted(results, key=lambda result: result["wall_time"], reverse=True):
+            report.write(f"{os.path.basename(result['input_file'])}, {result['protease']}, {result['proteins']}, {result['peptides']}, "
+                         f"{result['glycopeptides']}, {result['wall_time']:.2f}, {result['cpu_time']:.2f}\n")
+        report.write("---------------------------------------------------------------------------\n")
+        report.write("Thank you for using the Glycopeptide Sequence Finder!\n")
+        report.write("Please come back when you're ready to discover more glycopeptides!\n")
+        report.write("---------------------------------------------------------------------------\n")
+
+    return peptide_count, glycopeptide_count
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch run of the Glycopeptide Finder over a directory of FASTA files.")
+    parser.add_argument("-i", "--input_dir", default="test_proteomes", help="Directory of input FASTA files. Default is test_proteomes.")
+    parser.add_argument("-g", "--glycosylation", default="N", help="Glycosylation type (N, O, or C). Default is N.")
+    parser.add_argument("-p", "--protease", default="trypsin", help="Protease to use for cleavage ('all' for all proteases). Default is trypsin.")
+    parser.add_argument("-c", "--missed_cleavages", type=int, default=0, help="Number of missed cleavages allowed. Default is 0.")
+    parser.add_argument("-m", "--peptide_max_length", type=int, default=25, help="Max peptide length from digestion (default is 25).")
+    parser.add_argument("-y", "--glycan", default=None, help="Path to glycan file (CSV). Default is the built-in library of the glycosylation type.")
+    parser.add_argument("-z", "--charge", type=int, default=2, help="Maximum charge state (default: 2).")
+    parser.add_argument("--isotopes", type=int, metavar="N", help="Number of most abundant isotope peaks written to the Isotopes column (default: off).")
+    parser.add_argument("--fragment_charges", nargs=2, type=int, metavar=("MIN", "MAX"), help="Fragment ion charge range written to the FragmentIons column (default: off).")
+    parser.add_argument("-j", "--cores", type=int, default=os.cpu_count(), help="Number of worker processes (default: all CPU cores).")
+    parser.add_argument("-u", "--unit_size", type=int, default=500, help="Number of protein records per work unit (default: 500).")
+    parser.add_argument("--compress", choices=["gz", "zst"], help="Compress the library files with parallel gzip or zstd (default: plain CSV).")
+    parser.add_argument("-s", "--summary", default="summary_batch_run.txt", help="Summary report file (default: summary_batch_run.txt).")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Print verbose output from the workers.")
+    args = parser.parse_args()
+    fragment_charges = None
+    if args.fragment_charges:
+        if args.fragment_charges[0] < 1 or args.fragment_charges[1] < args.fragment_charges[0]:
+            parser.error("--fragment_charges needs 1 <= MIN <= MAX.")
+        fragment_charges = tuple(range(args.fragment_charges[0], args.fragment_charges[1] + 1))
+
+    # Select the protease(s)
+    if args.protease.lower() == "all":
+        selected_proteases = list(gsf.proteases.keys())
+    elif args.protease.lower() in gsf.proteases:
+        selected_proteases = [args.protease.lower()]
+    else:
+        print(f"Protease {args.protease} is not supported. Supported proteases: {', '.join(gsf.proteases.keys())}")
+        return
+
+    # Load and compile the glycan library once, the workers reuse the compiled form
+    try:
+        glycans = gsf.load_glycan_records(args.glycosylation, args.glycan)
+    except ValueError as error:
+        print(error)
+        return
+
+    fasta_files = list_fasta_files(args.input_dir)
+    if not fasta_files:
+        print(f"No FASTA files found in {args.input_dir}.")
+        return
+
+    start_time = time.perf_counter()
+    results = []
+    failed = []
+
+    print(f"Processing {len(fasta_files)} FASTA files from {args.input_dir} with {args.cores} worker processes...")
+
+    # Run the work units on a persistent worker pool. The units are read from the FASTA files (largest first) only as
+    # workers become free, keeping at most two units per worker in flight, and each worker takes the next unit as
+    # soon as it is idle. Units that finish ahead of an earlier unit of their proteome are stored until they are next
+    # in order, and count towards the units in flight. A proteome with a failed unit or an unreadable FASTA file is
+    # dropped and its file is not read any further.
+    proteomes = {}
+    failed_files = set()
+
+    def fail_proteome(fasta_file):
+        """Drops the proteome of a FASTA file for every protease: its stored units, partly written libraries and later units."""
+        failed_files.add(fasta_file)
+        for protease in selected_proteases:
+            proteome = proteomes.setdefault((fasta_file, protease), new_proteome(fasta_file, protease, args))
+            if not proteome["failed"]:
+                proteome["failed"] = True
+                proteome["parts"].clear()
+                close_proteome(proteome, remove=True)
+                failed.append(proteome)
+
+    def read_failed(fasta_file, error):
+        print(f"{os.path.basename(fasta_file)} could not be read: {error}")
+        fail_proteome(fasta_file)
+
+    with ProcessPoolExecutor(max_workers=args.cores, initializer=init_worker, initargs=(glycans,)) as executor:
+        work_units = iter_work_units(fasta_files, args.unit_size, failed_files, read_failed)
+        max_pending = 2 * args.cores
+        futures = {}
+        completed = 0
+        while True:
+            stored = sum(len(proteome["parts"]) for proteome in proteomes.values()) // len(selected_proteases)
+            for fasta_file, unit_index, records, last in islice(work_units, max(max_pending - len(futures) - stored, 0)):
+                for protease in selected_proteases:
+                    proteome = proteomes.setdefault((fasta_file, protease), new_proteome(fasta_file, protease, args))
+                    if last:
+                        proteome["units"] = unit_index + 1
+                future = executor.submit(run_unit, records, selected_proteases, args.missed_cleavages, args.glycosylation,
+                                         args.charge, args.peptide_max_length, fragment_charges, args.isotopes)
+                futures[future] = (fasta_file, unit_index)
+            if not futures:
+                break
+
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                fasta_file, unit_index = futures.pop(future)
+                completed += 1
+                try:
+                    unit_results = future.result()
+                except Exception as error:
+                    print(f"[{completed}] {os.path.basename(fasta_file)} unit {unit_index + 1} failed: {error}")
+                    fail_proteome(fasta_file)
+                    continue
+                for protease, libraries in unit_results.items():
+                    proteome = proteomes[(fasta_file, protease)]
+                    if proteome["failed"]:
+                        continue
+
+                    # Store the unit and write the units of the proteome that are next in order
+                    proteome["parts"][unit_index] = libraries
+                    proteome["proteins"] += libraries["proteins"]
+                    proteome["wall_time"] += libraries["wall_time"]
+                    proteome["cpu_time"] += libraries["cpu_time"]
+                    if args.verbose:
+                        print(f"[{completed}] {os.path.basename(fasta_file)} ({protease}) unit {unit_index + 1} "
+                              f"done in {libraries['wall_time']:.2f} s")
+                    if not write_proteome_units(proteome):
+                        continue
+
+                    # All units of the proteome are written
+                    results.append(proteome)
+                    print(f"[{completed}] {os.path.basename(fasta_file)} ({protease}): "
+                          f"{proteome['peptides']} peptides, {proteome['glycopeptides']} glycopeptides in {proteome['units']} units")
+
+    elapsed_time = time.perf_counter() - start_time
+
+    # Write the summary report from the collected counts
+    peptide_count, glycopeptide_count = write_summary_report(args.summary, results, args, elapsed_time, failed)
+    print(f"Total elapsed time: {elapsed_time / 60:.2f} minutes.")
+    print(f"The number of {args.protease} digested peptide sequences found is: {peptide_count}.")
+    print(f"The number of {args.glycosylation}-glycopeptide sequences found is: {glycopeptide_count}.")
+    print(f"A summary of the batch run has been saved to {args.summary}.")
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,4 @@
 #!/bin/bash
-start_time=$(date +%s)
 
 # define parameters
 # cores
@@ -52,30 +51,18 @@ echo "$ascii_glycopeptide1"
 echo "Starting glycopeptide sequence finder..."
 echo "Please wait while the glycopeptide sequence finder is running..."
 
-# Run the glycopeptide sequence finder script
-time ls ${input_dir}/*.fasta | xargs -I {} -P ${cores} python glycopeptide_sequence_finder_cmd.py \
-    -i "{}" -p ${protease} -g ${glycosylation_type} -c ${missed_cleavages} -z ${charge_state} -m ${max_peptide_length} -v 
+# Run the glycopeptide sequence finder batch runner (persistent worker pool, largest files first)
+# Row counts and timings are collected from the workers and written to summary_batch_run.txt
+python batch_glycopeptide_sequence_finder.py \
+    -i ${input_dir} -p ${protease} -g ${glycosylation_type} -c ${missed_cleavages} -z ${charge_state} -m ${max_peptide_length} -j ${cores}
 
 echo "Digested and tasted the glycoproteome. Yummy! 🍽️"
 
-# calculate elapsed time 
-end_time=$(date +%s)
-elapsed_time=$((end_time - start_time))
-elapsed_time_mins=$(echo "scale=2; $elapsed_time / 60" | bc)
-echo "Total elapsed time: $elapsed_time_mins minutes."
-
-# Count the number of peptide sequences, row entries, in all csv files in the digested_peptide_library directory, ignoring headers
-peptide_count=$(tail -n +2 digested_peptide_library/*.csv | wc -l)
-
-# Count the number of glycopeptide sequences, row entries, in all csv files in the digested_glycopeptide_library directory, ignoring headers
-glycopeptide_count=$(tail -n +2 digested_glycopeptide_library/*.csv | wc -l)
-
 ascii_glycopeptide2="
 ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
     🔬 F O U N D   G L Y C O P E P T I D E   S E Q U E N C E S ! ! ! 🔬
 ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━                                   
-    I D E N T I F I E D: $glycopeptide_count $protease-digested $glycosylation_type-glycopeptide sequences.                                      
-    I D E N T I F I E D: $peptide_count $protease-digested peptide sequences.
+    I D E N T I F I E D: $protease-digested $glycosylation_type-glycopeptide sequences (see summary_batch_run.txt).
         ╭────────────────────────────────────────────╮
                         GLYCO-
             H-N-C-C-O--PEPTIDE--N-C-C-O-H-N-C-C-O-H
@@ -92,46 +79,7 @@ ascii_glycopeptide2="
 
 # outro message
 echo "$ascii_glycopeptide2"
-sleep 2
-
-# print the number of peptide sequences found
-echo "The number of $protease digested peptide sequences found is: $peptide_count."
-echo "Wow! That is a LOT of peptides, buddy! You really know how to slice and dice! 😎🍴"
-# print the number of glycopeptide sequences found
-echo "The number of $glycosylation_type-glycopeptide sequences found is: $glycopeptide_count. Great job, Glycoscientist! You've done it again!"
 echo "Wow! That is a TON of glycopeptides! You are officially the Glycoprotein Master. 🏆"
 echo "You are a glycopeptide finding MACHINE! Keep up the epic work, my friend! 💪🚀"
 echo "Glycopeptide sequence finder has finished.  🎉"
 echo "But... Wait! Please feed me more proteome data! I'm hungry for more glycopeptides! 🍽️ Bring on the next batch!"
-sleep 1
-echo "Results written to summary_batch_run.txt."
-
-# Create a summary report
-summary_report="summary_batch_run.txt"
-
-# Write the summary to the file
-{
-    echo "$ascii_glycopeptide1"
-    echo "==================== Glycopeptide Sequence Finder Summary ===================="
-    echo "After some finding and searching for glycopeptides in input protein/proteome FASTA..."
-    echo "Total Peptide Sequences Found: $peptide_count"
-    echo "Peptides generated using $protease digestion with $missed_cleavages missed cleavages."
-    echo "Total Glycopeptide Sequences Found: $glycopeptide_count"
-    echo "---------------------------------------------------------------------------"
-    echo "Batch Run Summary:"
-    echo "Total Elapsed Time: $elapsed_time_mins minutes"
-    echo "Protease Used: $protease"
-    echo "Missed Cleavages: $missed_cleavages"
-    echo "Glycosylation Type: $glycosylation_type-Glycosylation"
-    echo "Number of Peptide Sequences: $peptide_count"
-    echo "Number of $glycosylation_type-Glycopeptide Sequences: $glycopeptide_count"
-    echo "---------------------------------------------------------------------------"
-    echo "Thank you for using the Glycopeptide Sequence Finder!" 
-    echo "Please come back when you're ready to discover more glycopeptides!"
-    echo "---------------------------------------------------------------------------"
-} > "$summary_report"
-
-# Notify user of the report
-echo "A summary of the batch run has been saved to $summary_report."
-
-
@@ -0,0 +1,220 @@
+"""
+benchmark_glycopeptide_sequence_finder.py
+
+Times each stage of the glycopeptide sequence finder pipeline on representative proteomes from test_proteomes
+(small viral SARS-CoV, yeast and the large mammalian cow proteome by default) across proteases and missed cleavage settings. The stages are FASTA parse,
+cleave_sequence, sequon scan, peptide mass/hydrophobicity/pI, glycan cross product, ion series and CSV write, plus the
+cold start of a fresh interpreter importing the command line module. The ion series is timed with a freshly compiled
+glycan library on every repeat (ion_series, the cost of a new process) and with the glycan fragment tables already
+cached (ion_series_warm).
+
+Results are written as JSON so runs can be compared. When a baseline JSON is given, every stage that is slower than
+the baseline by more than the threshold is flagged as a regression and the script exits with status 1.
+
+Usage:
+    python benchmarks/benchmark_glycopeptide_sequence_finder.py [-i <fasta> ...] [-p <protease> ...] [-c <missed_cleavages> ...] [-r <repeats>] [-o <output_json>] [-b <baseline_json>] [-t <threshold>] [--save-baseline]
+
+Author:
+    Richard Shipman -- 2025
+"""
+import argparse
+import glob
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+# Import the pipeline from the repository root
+script_dir = os.path.dirname(os.path.abspath(__file__))
+repo_dir = os.path.dirname(script_dir)
+sys.path.insert(0, repo_dir)
+
+import glycopeptide_sequence_finder_core as gsf
+
+# Representative proteomes (small viral, yeast, large mammalian), every pattern must match a file
+default_inputs = [
+    "test_proteomes/SARS-CoV_*.fasta",
+    "test_proteomes/yeast_*.fasta",
+    "test_proteomes/cow_*.fasta",
+]
+
+# Default output locations
+default_results_dir = os.path.join(script_dir, "results")
+default_baseline = os.path.join(script_dir, "baseline.json")
+
+def time_stage(function, repeats, setup=None):
+    """
+    Runs a stage function repeats times and returns its last result and the wall times in seconds. With setup, the
+    function is called with a fresh setup() result on every repeat, and the setup is not timed.
+    """
+    times = []
+    result = None
+    for _ in range(repeats):
+        args = (setup(),) if setup else ()
+        start = time.perf_counter()
+        result = function(*args)
+        times.append(time.perf_counter() - start)
+    return result, times
+
+def stage_entry(input_file, protease, missed_cleavages, stage, times, items):
+    """Creates the JSON entry of a timed stage."""
+    return {
+        "input": os.path.basename(input_file),
+        "protease": protease,
+        "missed_cleavages": missed_cleavages,
+        "stage": stage,
+        "items": items,
+        "min_seconds": min(times),
+        "median_seconds": statistics.median(times),
+        "repeats": len(times),
+    }
+
+def benchmark_input(input_file, protease, missed_cleavages, glycans, charge_state, peptide_max_length, repeats, output_dir):
+    """Times every pipeline stage for one input, protease and missed cleavage setting."""
+    entries = []
+    def record(stage, function, items=None, setup=None):
+        result, times = time_stage(function, repeats, setup)
+        entries.append(stage_entry(input_file, protease, missed_cleavages, stage, times,
+                                   items(result) if items else len(result)))
+        return result
+
+    # FASTA parse
+    records = record("fasta_parse", lambda: list(gsf.read_fasta_records(input_file)))
+
+    # cleave_sequence over every protein
+    record("cleave_sequence", lambda: [pep for _, _, sequence in records for pep in gsf.cleave_sequence(sequence, protease, missed_cleavages)])
+
+    # Sequon scan over the digested proteins (glycopeptide backbones with their properties)
+    proteins = gsf.digest_proteins(records, protease, missed_cleavages, "N")
+    backbones = record("sequon_scan", lambda: gsf.glycopeptide_rows(proteins, "N", peptide_max_length))
+
+    # Mass, hydrophobicity and pI of every digested peptide
+    record("peptide_properties", lambda: gsf.peptide_rows(proteins))
+
+    # Glycan cross product with m/z values
+    glycopeptides = record("glycan_cross_product", lambda: gsf.glycan_cross_rows(backbones, glycans, charge_state))
+
+    # Ion series of every glycopeptide, with the glycan fragment tables computed from scratch on every repeat (fresh
+    # library) and already cached
+    record("ion_series", lambda library: gsf.add_ion_rows(glycopeptides, library),
+           setup=lambda: gsf.GlycanLibrary(glycans.records))
+    record("ion_series_warm", lambda: gsf.add_ion_rows(glycopeptides, glycans))
+
+    # CSV write of the peptide and glycopeptide libraries
+    libraries = gsf.digest_record_rows(records, protease, missed_cleavages, "N", glycans, charge_state, peptide_max_length)
+    peptide_file = os.path.join(output_dir, "peptides.csv")
+    glycopeptide_file = os.path.join(output_dir, "glycopeptides.csv")
+    record("csv_write", lambda: gsf.write_library_rows(libraries, peptide_file, glycopeptide_file),
+           items=lambda _: len(libraries["peptide_library"]) + len(libraries["glycopeptide_library"]))
+
+    return entries
+
+def benchmark_cold_start(repeats):
+    """Times a fresh interpreter importing the command line module (the start-up cost of every process)."""
+    command = [sys.executable, "-c", "import glycopeptide_sequence_finder_cmd"]
+    _, times = time_stage(lambda: subprocess.run(command, cwd=repo_dir, check=True), repeats)
+    return stage_entry("(import)", None, None, "cold_start", times, 1)
+
+def compare_to_baseline(results, baseline, threshold):
+    """Returns the stages whose minimum time is slower than the baseline by more than the threshold (fraction)."""
+    def key(entry):
+        return (entry["input"], entry["protease"], entry["missed_cleavages"], entry["stage"])
+
+    baseline_entries = {key(entry): entry for entry in baseline["results"]}
+    regressions = []
+    for entry in results["results"]:
+        base = baseline_entries.get(key(entry))
+        if base is None or base["min_seconds"] <= 0:
+            continue
+        ratio = entry["min_seconds"] / base["min_seconds"]
+        if ratio > 1 + threshold:
+            regressions.append({**entry, "baseline_seconds": base["min_seconds"], "ratio": ratio})
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the stages of the Glycopeptide Finder pipeline.")
+    parser.add_argument("-i", "--input", nargs="+", default=default_inputs, help="Input FASTA files or glob patterns (default: SARS-CoV, yeast and cow from test_proteomes).")
+    parser.add_argument("-p", "--protease", nargs="+", default=["trypsin", "chymotrypsin"], help="Proteases to benchmark (default: trypsin chymotrypsin).")
+    parser.add_argument("-c", "--missed_cleavages", nargs="+", type=int, default=[0, 2], help="Missed cleavage settings to benchmark (default: 0 2).")
+    parser.add_argument("-y", "--glycan", default=None, help="Path to glycan file (CSV). Default is the built-in N-glycan library.")
+    parser.add_argument("-z", "--charge", type=int, default=3, help="Maximum charge state (default: 3).")
+    parser.add_argument("-m", "--peptide_max_length", type=int, default=25, help="Max peptide length from digestion (default is 25).")
+    parser.add_argument("-r", "--repeats", type=int, default=3, help="Number of repeats per stage, the minimum is compared (default: 3).")
+    parser.add_argument("-o", "--output", help="Output JSON file (default: benchmarks/results/benchmark_<timestamp>.json).")
+    parser.add_argument("-b", "--baseline", nargs="?", const=default_baseline, help="Baseline JSON to compare against (default: benchmarks/baseline.json).")
+    parser.add_argument("-t", "--threshold", type=float, default=0.2, help="Slowdown over the baseline flagged as a regression (default: 0.2 = 20%%).")
+    parser.add_argument("--save-baseline", action="store_true", help="Also save the results as the baseline (benchmarks/baseline.json).")
+    args = parser.parse_args()
+
+    # Resolve inputs relative to the working directory or the repository root, a pattern without matches is an error
+    # so a missing proteome tier cannot drop out of the results and the baseline unnoticed
+    input_files = []
+    for pattern in args.input:
+        matches = sorted(glob.glob(pattern) or glob.glob(os.path.join(repo_dir, pattern)))
+        if not matches:
+            parser.error(f"no FASTA file matches {pattern}.")
+        input_files.extend(matches)
+
+    glycans = gsf.load_glycan_records("N", args.glycan)
+    results = {
+        "metadata": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "processor": platform.processor(),
+            "glycans": len(glycans),
+            "charge": args.charge,
+            "repeats": args.repeats,
+        },
+        "results": [],
+    }
+
+    # Time the start-up cost of a fresh process
+    entry = benchmark_cold_start(args.repeats)
+    results["results"].append(entry)
+    print(f"{'(import)':<70} {'':<13} {'':<3} {entry['stage']:<21} {entry['min_seconds']:>9.4f} s")
+
+    # Time every stage for every input, protease and missed cleavage setting
+    with tempfile.TemporaryDirectory() as output_dir:
+        for input_file in input_files:
+            for protease in args.protease:
+                for missed_cleavages in args.missed_cleavages:
+                    entries = benchmark_input(input_file, protease, missed_cleavages, glycans, args.charge,
+                                              args.peptide_max_length, args.repeats, output_dir)
+                    results["results"].extend(entries)
+                    for entry in entries:
+                        print(f"{entry['input']:<70} {protease:<13} mc{missed_cleavages} {entry['stage']:<21} "
+                              f"{entry['min_seconds']:>9.4f} s  ({entry['items']} items)")
+
+    # Save the results
+    output_file = args.output or os.path.join(default_results_dir, f"benchmark_{datetime.now():%Y%m%d_%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output_file)), exist_ok=True)
+    with open(output_file, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Benchmark results written to {output_file}")
+
+    if args.save_baseline:
+        with open(default_baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline saved to {default_baseline}")
+
+    # Flag regressions against the baseline
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare_to_baseline(results, baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} stage(s) slower than the baseline by more than {args.threshold:.0%}:")
+            for entry in regressions:
+                print(f"  REGRESSION {entry['input']} {entry['protease']} mc{entry['missed_cleavages']} {entry['stage']}: "
+                      f"{entry['min_seconds']:.4f} s vs {entry['baseline_seconds']:.4f} s ({entry['ratio']:.2f}x)")
+            sys.exit(1)
+        print(f"No regressions against {args.baseline}.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+export_mock_mass_spectra.py
+
+Exports the mock mass spectra of glycopeptide library CSV files as peak arrays instead of PNGs. Every glycopeptide
+becomes one spectrum with the ions of its IonSeries as peaks, sorted by m/z, with the mock intensities of
+plot_mock_mass_spectra.py (the line length of each ion type). Spectra are written as MGF for search engines, or as one
+indexed NPZ container holding the concatenated m/z, intensity and ion label arrays of all spectra with their offsets.
+The NPZ container loads in a single read and any glycopeptide's spectrum is fetched by its ID (load_spectra).
+
+Spectrum IDs are the PNG names of plot_mock_mass_spectra.py without the suffix:
+    <ProteinID>_<Site>_<Peptide>_<GlyToucan_AC> (with | replaced by _)
+Repeated IDs get a _<n> suffix (_2 for the second spectrum with the same ID), so every ID fetches one spectrum.
+
+Usage:
+    python export_mock_mass_spectra.py -i <input_csv> [<input_csv> ...] -o <output.mgf | output.npz> [--precursor_charge <charge>] [--chunk_size <rows>]
+
+Author:
+    Richard Shipman -- 2025
+"""
+import argparse
+import ast
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from mock_mass_spectra_core import ion_labels, ion_length_map, plot_columns, plot_title
+
+def spectrum_peaks(ion_series):
+    """Returns the m/z values, mock intensities and labels of the ions of an ion series, sorted by m/z."""
+    peaks = []
+    for ion_type, (mz_values, names) in ion_labels(ion_series).items():
+        intensity = ion_length_map.get(ion_type, 50)
+        peaks.extend((mz, intensity, name) for mz, name in zip(mz_values, names))
+    peaks.sort(key=lambda peak: peak[0])
+    return peaks
+
+def library_spectra(csv_file, precursor_charge=2, chunk_size=10000):
+    """
+    Yields the mock spectra of a glycopeptide library CSV, reading it chunk by chunk. Each spectrum is a dict with its
+    ID, peptide, composition, precursor m/z and charge, and peaks.
+    """
+    precursor_column = f"z{precursor_charge}"
+    for df in pd.read_csv(csv_file, usecols=plot_columns + [precursor_column], chunksize=chunk_size):
+        for row in df.to_dict('records'):
+            _, file_name = plot_title(row)
+            yield {
+                "id": file_name[:-len("_mock_mass_spectrum.png")],
+                "peptide": row['Peptide'],
+                "composition": row['Composition'],
+                "precursor_mz": row[precursor_column],
+                "charge": precursor_charge,
+                "peaks": spectrum_peaks(ast.literal_eval(row['IonSeries'])),
+            }
+
+def unique_spectrum_ids(spectra):
+    """Yields the spectra with a _<n> suffix added to every repeated ID."""
+    seen = set()
+    for spectrum in spectra:
+        spectrum_id = spectrum['id']
+        number = 1
+        while spectrum_id in seen:
+            number += 1
+            spectrum_id = f"{spectrum['id']}_{number}"
+        seen.add(spectrum_id)
+        yield spectrum if spectrum_id == spectrum['id'] else {**spectrum, "id": spectrum_id}
+
+def write_mgf(spectra, output_file):
+    """Writes spectra as MGF and returns the number of spectra."""
+    count = 0
+    with open(output_file, "w") as file:
+        for spectrum in spectra:
+            file.write(f"BEGIN IONS\nTITLE={spectrum['id']}\nPEPMASS={spectrum['precursor_mz']}\n"
+                       f"CHARGE={spectrum['charge']}+\nSEQ={spectrum['peptide']}\n")
+            file.write("".join(f"{mz} {intensity}\n" for mz, intensity, _ in spectrum['peaks']))
+            file.write("END IONS\n\n")
+            count += 1
+    return count
+
+def write_npz(spectra, output_file):
+    """
+    Writes spectra as one indexed NPZ container and returns the number of spectra. The peaks of spectrum i are
+    mz[offsets[i]:offsets[i + 1]] (likewise intensity and label); labels are codes into label_names. Raises
+    ValueError on a repeated ID, which could not be fetched.
+    """
+    ids, peptides, compositions, precursor_mz, charges = [], [], [], [], []
+    mz, intensity, labels = [], [], []
+    offsets = [0]
+    label_codes = {}
+    for spectrum in spectra:
+        ids.append(spectrum['id'])
+        peptides.append(spectrum['peptide'])
+        compositions.append(spectrum['composition'])
+        precursor_mz.append(spectrum['precursor_mz'])
+        charges.append(spectrum['charge'])
+        for peak_mz, peak_intensity, label in spectrum['peaks']:
+            mz.append(peak_mz)
+            intensity.append(peak_intensity)
+            labels.append(label_codes.setdefault(label, len(label_codes)))
+        offsets.append(len(mz))
+    if len(set(ids)) != len(ids):
+        raise ValueError(f"Repeated spectrum IDs in {output_file}; pass the spectra through unique_spectrum_ids.")
+
+    np.savez(output_file,
+             ids=np.array(ids, dtype=str), peptides=np.array(peptides, dtype=str),
+             compositions=np.array(compositions, dtype=str),
+             precursor_mz=np.array(precursor_mz, dtype=np.float64), charge=np.array(charges, dtype=np.int8),
+             offsets=np.array(offsets, dtype=np.int64), mz=np.array(mz, dtype=np.float64),
+             intensity=np.array(intensity, dtype=np.float32), label=np.array(labels, dtype=np.uint16),
+             label_names=np.array(list(label_codes), dtype=str))
+    return len(ids)
+
+class MockSpectra:
+    """Mock spectra of an NPZ container, fetched by index or ID."""
+
+    def __init__(self, arrays):
+        self.arrays = arrays
+        self.ids = arrays['ids']
+        self.offsets = arrays['offsets']
+        self.index = {spectrum_id: i for i, spectrum_id in enumerate(self.ids.tolist())}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, key):
+        """Returns the m/z, intensity and label arrays of a spectrum by index or ID."""
+        i = self.index[key] if isinstance(key, str) else key
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return (self.arrays['mz'][start:end], self.arrays['intensity'][start:end],
+                self.arrays['label_names'][self.arrays['label'][start:end]])
+
+def load_spectra(npz_file):
+    """Loads every array of an NPZ container in one read and returns the MockSpectra."""
+    with np.load(npz_file) as data:
+        return MockSpectra({name: data[name] for name in data.files})
+
+def main():
+    parser = argparse.ArgumentParser(description="Export mock mass spectra from glycopeptide ion series CSV files as MGF or NPZ peak arrays.")
+    parser.add_argument('-i', '--input', required=True, nargs='+', help="Input CSV files containing glycopeptide ion series info.")
+    parser.add_argument('-o', '--output', required=True, help="Output file, .mgf or .npz.")
+    parser.add_argument('--precursor_charge', type=int, default=2, help="Charge of the precursor m/z (the z<charge> column, default: 2).")
+    parser.add_argument('--chunk_size', type=int, default=10000, help="Rows read at a time (default: 10000).")
+    args = parser.parse_args()
+
+    extension = os.path.splitext(args.output)[1].lower()
+    if extension not in (".mgf", ".npz"):
+        parser.error("The output file must end in .mgf or .npz.")
+
+    start_time = time.perf_counter()
+    spectra = unique_spectrum_ids(spectrum for csv_file in args.input
+                                  for spectrum in library_spectra(csv_file, args.precursor_charge, args.chunk_size))
+    count = write_mgf(spectra, args.output) if extension == ".mgf" else write_npz(spectra, args.output)
+    print(f"{count} spectra exported to {args.output} in {time.perf_counter() - start_time:.2f} seconds.")
+
+if __name__ == "__main__":
+    main()
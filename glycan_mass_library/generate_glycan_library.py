@@ -0,0 +1,130 @@
+"""
+generate_glycan_library.py
+
+Generates a combinatorial glycan composition library. Every composition within the given bounds on HexNAc, Hex, Fuc
+(written dHex as in Byonic), NeuAc and NeuGc counts is enumerated as a count matrix, filtered by biosynthetic rules,
+and its residue mass is computed in one matrix product with the masses of monosaccharide_library. The compositions are
+deduplicated, sorted by mass and written with the columns of the default glycan libraries (glytoucan_ac, byonic,
+composition, mass, shorthand_glycan), so the output can be passed to glycopeptide_sequence_finder_cmd.py with -y.
+
+Rules (N-glycans, all applied by default):
+    core      HexNAc >= 2 and Hex >= 3 (chitobiose and trimannosyl core)
+    sialic    NeuAc + NeuGc <= HexNAc - 2 (at most one sialic acid per antenna)
+    galactose NeuAc + NeuGc <= Hex - 3 (every sialic acid caps a galactose)
+    fucose    Fuc <= HexNAc - 1 (core fucose plus at most one per antenna)
+
+Usage:
+    python glycan_mass_library/generate_glycan_library.py [--hexnac <min> <max>] [--hex <min> <max>] [--fuc <min> <max>] [--neuac <min> <max>] [--neugc <min> <max>] [-r <rule> ...] [--min_mass <mass>] [--max_mass <mass>] [-o <output_file>]
+
+Author:
+    Richard Shipman -- 2025
+"""
+import argparse
+import csv
+import os
+import sys
+import time
+
+import numpy as np
+
+# Import the monosaccharide masses from the repository root
+script_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(script_dir))
+
+from glycopeptide_sequence_finder_core import monosaccharide_library, shorthand_symbols
+
+# Monosaccharides of the generated compositions, in composition string order
+monosaccharides = ["HexNAc", "Hex", "dHex", "NeuAc", "NeuGc"]
+
+# Biosynthetic rules, each returns the mask of allowed compositions of a count matrix (columns as monosaccharides)
+rules = {
+    "core": lambda counts: (counts[:, 0] >= 2) & (counts[:, 1] >= 3),
+    "sialic": lambda counts: counts[:, 3] + counts[:, 4] <= counts[:, 0] - 2,
+    "galactose": lambda counts: counts[:, 3] + counts[:, 4] <= counts[:, 1] - 3,
+    "fucose": lambda counts: counts[:, 2] <= counts[:, 0] - 1,
+}
+
+# Output columns, as in the default glycan libraries
+library_fields = ["glytoucan_ac", "byonic", "composition", "mass", "shorthand_glycan"]
+
+def enumerate_compositions(bounds):
+    """Returns the count matrix of every composition within the (min, max) bounds of each monosaccharide."""
+    ranges = [np.arange(low, high + 1, dtype=np.int32) for low, high in bounds]
+    grid = np.meshgrid(*ranges, indexing="ij")
+    return np.stack([axis.ravel() for axis in grid], axis=1)
+
+def generate_library(bounds, selected_rules=tuple(rules), min_mass=None, max_mass=None):
+    """
+    Enumerates, filters, deduplicates and mass-sorts the glycan compositions.
+
+    Returns:
+        tuple: The count matrix and the residue masses of the compositions, sorted by mass.
+    """
+    counts = enumerate_compositions(bounds)
+
+    # Apply the biosynthetic rules
+    keep = np.ones(len(counts), dtype=bool)
+    for rule in selected_rules:
+        keep &= rules[rule](counts)
+    counts = np.unique(counts[keep & (counts.sum(axis=1) > 0)], axis=0)
+
+    # Residue masses of all compositions in one matrix product
+    masses = counts @ np.array([monosaccharide_library[sugar]["mass"] for sugar in monosaccharides])
+    keep = np.ones(len(counts), dtype=bool)
+    if min_mass is not None:
+        keep &= masses >= min_mass
+    if max_mass is not None:
+        keep &= masses <= max_mass
+    counts, masses = counts[keep], masses[keep]
+
+    order = np.argsort(masses, kind="stable")
+    return counts[order], masses[order]
+
+def library_rows(counts, masses):
+    """Yields the glycan library rows of a count matrix and its masses."""
+    for row, mass in zip(counts.tolist(), masses.tolist()):
+        composition = "".join(f"{sugar}({count})" for sugar, count in zip(monosaccharides, row) if count)
+        yield {
+            "glytoucan_ac": "",
+            "byonic": f"{composition} % {mass:.6f}",
+            "composition": composition,
+            "mass": f"{mass:.6f}",
+            "shorthand_glycan": "".join(f"{shorthand_symbols[sugar]}{count}" for sugar, count in zip(monosaccharides, row) if count),
+        }
+
+def write_library(output_file, counts, masses):
+    """Writes the generated glycan library CSV, creating the output directory if needed."""
+    directory = os.path.dirname(output_file)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(output_file, "w", newline="") as file:
+        writer = csv.DictWriter(file, fieldnames=library_fields, lineterminator="\n")
+        writer.writeheader()
+        writer.writerows(library_rows(counts, masses))
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a combinatorial glycan composition library.")
+    parser.add_argument("--hexnac", nargs=2, type=int, default=[2, 7], metavar=("MIN", "MAX"), help="HexNAc count bounds (default: 2 7).")
+    parser.add_argument("--hex", nargs=2, type=int, default=[3, 10], metavar=("MIN", "MAX"), help="Hex count bounds (default: 3 10).")
+    parser.add_argument("--fuc", nargs=2, type=int, default=[0, 2], metavar=("MIN", "MAX"), help="Fuc (dHex) count bounds (default: 0 2).")
+    parser.add_argument("--neuac", nargs=2, type=int, default=[0, 4], metavar=("MIN", "MAX"), help="NeuAc count bounds (default: 0 4).")
+    parser.add_argument("--neugc", nargs=2, type=int, default=[0, 0], metavar=("MIN", "MAX"), help="NeuGc count bounds (default: 0 0).")
+    parser.add_argument("-r", "--rules", nargs="*", choices=list(rules), default=list(rules), help="Biosynthetic rules to apply (default: all). Give -r without rules to apply none.")
+    parser.add_argument("--min_mass", type=float, help="Minimum glycan mass.")
+    parser.add_argument("--max_mass", type=float, help="Maximum glycan mass.")
+    parser.add_argument("-o", "--output", default=os.path.join(script_dir, "output", "generated_glycan_library.csv"), help="Output CSV file (default: glycan_mass_library/output/generated_glycan_library.csv).")
+    args = parser.parse_args()
+
+    bounds = [args.hexnac, args.hex, args.fuc, args.neuac, args.neugc]
+    for sugar, (low, high) in zip(monosaccharides, bounds):
+        if low < 0 or high < low:
+            parser.error(f"Invalid bounds for {sugar}: {low} {high}.")
+
+    start_time = time.perf_counter()
+    counts, masses = generate_library(bounds, args.rules, args.min_mass, args.max_mass)
+    write_library(args.output, counts, masses)
+    print(f"{len(counts)} glycan compositions generated in {time.perf_counter() - start_time:.2f} seconds.")
+    print(f"Output written to: {args.output}")
+
+if __name__ == "__main__":
+    main()
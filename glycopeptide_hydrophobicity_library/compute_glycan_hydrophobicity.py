@@ -1,8 +1,15 @@
 import pandas as pd
+import numpy as np
 import argparse
+import json
 import os
 from scipy.stats import zscore
 
+# Running moments of the online aggregation: Welford count, mean and M2 (sum of squared deviations) of the HFs per
+# peptide backbone, and count, mean, min and max of the HFs per glycan and backbone
+backbone_moment_columns = ['count', 'mean', 'm2']
+cell_moment_columns = ['count', 'mean', 'min', 'max']
+
 def compute_adjusted_hf(df):
     """Compute the adjusted HF score by removing the peptide effect."""
     peptide_means = df.groupby('Peptide Backbone')['HFs'].transform('mean')
@@ -61,10 +68,121 @@ def rank_glycans_by_hydrophobicity(input_csv, output_csv=None):
     # Save the results to a new CSV file
     glycan_summary.to_csv(output_csv, index=False)
 
-if __name__ == "__main__":
+def hf_moments(df):
+    """Compute the running moments of the HFs of a dataset per peptide backbone and per glycan and backbone."""
+    hfs = df.groupby('Peptide Backbone')['HFs']
+    backbones = pd.DataFrame({'count': hfs.count(), 'mean': hfs.mean()})
+    backbones['m2'] = hfs.var(ddof=0).fillna(0) * backbones['count']
+    cells = df.groupby(['Glycans', 'Peptide Backbone'])['HFs'].agg(cell_moment_columns)
+    return {'backbones': backbones, 'cells': cells}
+
+def merge_moments(first, second):
+    """Merge two sets of running moments (Chan et al. parallel Welford update), as if from one combined dataset."""
+    backbones = first['backbones'].join(second['backbones'], how='outer', lsuffix='_a', rsuffix='_b').fillna(0)
+    count = backbones['count_a'] + backbones['count_b']
+    delta = backbones['mean_b'] - backbones['mean_a']
+    merged_backbones = pd.DataFrame({
+        'count': count,
+        'mean': backbones['mean_a'] + delta * backbones['count_b'] / count,
+        'm2': backbones['m2_a'] + backbones['m2_b'] + delta ** 2 * backbones['count_a'] * backbones['count_b'] / count,
+    })
+
+    cells = first['cells'].join(second['cells'], how='outer', lsuffix='_a', rsuffix='_b')
+    count_a, count_b = cells['count_a'].fillna(0), cells['count_b'].fillna(0)
+    count = count_a + count_b
+    merged_cells = pd.DataFrame({
+        'count': count,
+        'mean': (cells['mean_a'].fillna(0) * count_a + cells['mean_b'].fillna(0) * count_b) / count,
+        'min': cells[['min_a', 'min_b']].min(axis=1),
+        'max': cells[['max_a', 'max_b']].max(axis=1),
+    })
+    return {'backbones': merged_backbones, 'cells': merged_cells}
+
+def accumulate_moments(input_csvs, moments=None, chunk_size=100000):
+    """Fold datasets into the running moments chunk by chunk, without holding a whole dataset in memory."""
+    for input_csv in input_csvs:
+        for df in pd.read_csv(input_csv, usecols=['Peptide Backbone', 'Glycans', 'HFs'], chunksize=chunk_size):
+            chunk_moments = hf_moments(df)
+            moments = chunk_moments if moments is None else merge_moments(moments, chunk_moments)
+    return moments
+
+def save_moments(moments, state_file):
+    """Save the running moments to a JSON state file."""
+    state = {
+        'backbones': [[backbone] + values for backbone, values in zip(
+            moments['backbones'].index.tolist(), moments['backbones'][backbone_moment_columns].values.tolist())],
+        'cells': [list(key) + values for key, values in zip(
+            moments['cells'].index.tolist(), moments['cells'][cell_moment_columns].values.tolist())],
+    }
+    with open(state_file, 'w') as file:
+        json.dump(state, file)
+
+def load_moments(state_file):
+    """Load the running moments of a JSON state file."""
+    with open(state_file) as file:
+        state = json.load(file)
+    backbones = pd.DataFrame(state['backbones'], columns=['Peptide Backbone'] + backbone_moment_columns)
+    cells = pd.DataFrame(state['cells'], columns=['Glycans', 'Peptide Backbone'] + cell_moment_columns)
+    return {'backbones': backbones.set_index('Peptide Backbone'),
+            'cells': cells.set_index(['Glycans', 'Peptide Backbone'])}
+
+def rank_glycans_from_moments(moments):
+    """
+    Rank glycans from the running moments. Gives the glycan summary of rank_glycans_by_hydrophobicity for the
+    combined data: the mean adjusted HF of a glycan is its mean HF minus the mean of its backbone means, the
+    adjusted HF z-score uses the within-backbone variance (the adjusted HF has mean 0) and the scaling maximum comes
+    from the HF range of every glycan and backbone.
+    """
+    backbones, cells = moments['backbones'], moments['cells']
+    backbone_means = backbones['mean'].reindex(cells.index.get_level_values('Peptide Backbone')).to_numpy()
+    std = np.sqrt(backbones['m2'].sum() / backbones['count'].sum())
+
+    # Per glycan sums of the adjusted HF and the largest absolute adjusted HF
+    cells = cells.assign(
+        adjusted_sum=cells['count'] * (cells['mean'] - backbone_means),
+        adjusted_max=np.maximum(cells['max'] - backbone_means, backbone_means - cells['min']),
+    )
+    glycans = cells.groupby(level='Glycans').agg(Count=('count', 'sum'), adjusted_sum=('adjusted_sum', 'sum'),
+                                                 adjusted_max=('adjusted_max', 'max'))
+    glycan_summary = pd.DataFrame({'Adjusted_HF': glycans['adjusted_sum'] / glycans['Count']})
+    glycan_summary['Z_Adjusted_HF'] = glycan_summary['Adjusted_HF'] / std
+    glycan_summary['Weighted_Adjusted_HF'] = glycan_summary['Z_Adjusted_HF'] * glycans['Count']
+    glycan_summary['Scaled_HF'] = glycan_summary['Weighted_Adjusted_HF'] / (glycans['adjusted_max'] / std * glycans['Count']).max()
+    glycan_summary['Count'] = glycans['Count'].astype(int)
+    glycan_summary = glycan_summary.reset_index()
+
+    # Sort glycans by weighted adjusted HF score (ascending)
+    return glycan_summary.sort_values(by='Scaled_HF', ascending=True)
+
+def main():
     parser = argparse.ArgumentParser(description='Rank glycans by hydrophobicity.')
-    parser.add_argument('-i', '--input', required=True, help='Input CSV file path')
+    parser.add_argument('-i', '--input', nargs='+', default=[], help='Input CSV file path (several files with --state)')
     parser.add_argument('-o', '--output', help='Output CSV file path')
+    parser.add_argument('-s', '--state', help='Online aggregation state file (JSON): the inputs are folded into its running moments, which are saved, and the glycans are ranked from them')
+    parser.add_argument('-m', '--merge', nargs='*', default=[], help='Other state files merged into --state')
+    parser.add_argument('--chunk_size', type=int, default=100000, help='Rows read at a time in online aggregation (default: 100000)')
     args = parser.parse_args()
-    
-    rank_glycans_by_hydrophobicity(args.input, args.output)
+
+    if not args.state:
+        if len(args.input) != 1 or args.merge:
+            parser.error('Give one input file, or use --state to aggregate several datasets.')
+        rank_glycans_by_hydrophobicity(args.input[0], args.output)
+        return
+
+    # Online aggregation: fold the new datasets and state files into the saved running moments
+    moments = load_moments(args.state) if os.path.exists(args.state) else None
+    for state_file in args.merge:
+        other = load_moments(state_file)
+        moments = other if moments is None else merge_moments(moments, other)
+    moments = accumulate_moments(args.input, moments, args.chunk_size)
+    if moments is None:
+        parser.error(f'No input files and no state file {args.state}.')
+    save_moments(moments, args.state)
+    print(f"State of {int(moments['backbones']['count'].sum())} glycopeptides saved to {args.state}")
+
+    output_csv = args.output or f"{os.path.splitext(args.state)[0]}_glycan_hydrophobicity_index.csv"
+    rank_glycans_from_moments(moments).to_csv(output_csv, index=False)
+    print(f"Output saved to {output_csv}")
+
+if __name__ == "__main__":
+    main()
@@ -1,62 +1,61 @@
 import argparse
 import pandas as pd
 import os
+import time
 
-def load_data(glycopeptide_file, glycan_hf_file):
+def load_glycan_hf_table(glycan_hf_file):
     """
-    Load the glycopeptide data and glycan hydrophobicity data from the given files.
+    Load the glycan hydrophobicity data as a table of adjusted and weighted adjusted HF indexed by glycan.
     """
-    glycopeptide_data = pd.read_csv(glycopeptide_file, low_memory=False)
     glycan_hf_data = pd.read_csv(glycan_hf_file)
-    return glycopeptide_data, glycan_hf_data
+    return build_glycan_hf_table(glycan_hf_data)
 
-def build_glycan_hf_dict(glycan_hf_data):
+def build_glycan_hf_table(glycan_hf_data):
     """
-    Create a dictionary from glycan hydrophobicity data for fast lookup.
+    Create a glycan-indexed table from glycan hydrophobicity data for the vectorized join.
+    Later rows win for duplicate glycans, as in a dict.
     """
-    return dict(zip(glycan_hf_data['Glycans'], 
-                    zip(glycan_hf_data['Adjusted_HF'], glycan_hf_data['Weighted_Adjusted_HF'])))
+    glycan_hf_table = glycan_hf_data.set_index('Glycans')[['Adjusted_HF', 'Weighted_Adjusted_HF']]
+    return glycan_hf_table[~glycan_hf_table.index.duplicated(keep='last')]
 
-def calculate_glycopeptide_hydrophobicity(peptide_hf, glycan_composition, glycan_hf_dict, weight=1):
+def calculate_scores(glycopeptide_data, glycan_hf_table, weight=1, glycan_column='composition'):
     """
-    Calculate the combined hydrophobicity score for a glycopeptide.
+    Calculate glycopeptide hydrophobicity scores for all glycopeptides as one join against the glycan HF table.
+    Glycans missing from the table score NaN (an empty cell in the output).
     """
-    if glycan_composition in glycan_hf_dict:
-        glycan_hf, glycan_weighted_hf = glycan_hf_dict[glycan_composition]
-        glycopeptide_hf = peptide_hf + weight * glycan_hf
-        glycopeptide_weighted_hf = peptide_hf + weight * glycan_weighted_hf
-        return glycopeptide_hf, glycopeptide_weighted_hf
-    else:
-        # Return None if glycan composition is not found
-        return None, None
-
-def calculate_scores(glycopeptide_data, glycan_hf_dict):
-    """
-    Calculate glycopeptide hydrophobicity scores for all glycopeptides.
-    """
-    glycopeptide_hf_values = []
-    glycopeptide_weighted_hf_values = []
-
-    for _, row in glycopeptide_data.iterrows():
-        peptide_hf = row['Hydrophobicity']
-        glycan_composition = row['composition']
-        
-        glycopeptide_hf, glycopeptide_weighted_hf = calculate_glycopeptide_hydrophobicity(
-            peptide_hf, glycan_composition, glycan_hf_dict)
-        
-        glycopeptide_hf_values.append(glycopeptide_hf)
-        glycopeptide_weighted_hf_values.append(glycopeptide_weighted_hf)
-
+    peptide_hf = pd.to_numeric(glycopeptide_data['Hydrophobicity'])
+    glycans = glycopeptide_data[glycan_column]
+    glycopeptide_hf_values = peptide_hf + weight * glycans.map(glycan_hf_table['Adjusted_HF'])
+    glycopeptide_weighted_hf_values = peptide_hf + weight * glycans.map(glycan_hf_table['Weighted_Adjusted_HF'])
     return glycopeptide_hf_values, glycopeptide_weighted_hf_values
 
-def save_results(glycopeptide_data, glycopeptide_hf_values, glycopeptide_weighted_hf_values, output_file):
+def score_library(glycopeptide_file, glycan_hf_table, output_file, chunk_size=20000, weight=1,
+                  glycan_column='composition'):
     """
-    Save the glycopeptide data with calculated scores to a CSV file.
+    Stream a glycopeptide library through the scoring in chunks, so memory stays bounded by the chunk size. Only the
+    peptide hydrophobicity and glycan columns are parsed; the scores are appended to the input lines as they are,
+    which requires one line per row (no line breaks inside quoted fields). Returns the row count.
     """
-    glycopeptide_data['GlycopeptideHydrophobicity'] = glycopeptide_hf_values
-    glycopeptide_data['GlycopeptideHydrophobicityWeighted'] = glycopeptide_weighted_hf_values
-    glycopeptide_data.to_csv(output_file, index=False)
-    print(f"Output saved to {output_file}")
+    score_columns = ['GlycopeptideHydrophobicity', 'GlycopeptideHydrophobicityWeighted']
+    rows = 0
+    with open(glycopeptide_file, newline='') as library, open(output_file, 'w', newline='') as file:
+        header = library.readline().rstrip('\r\n')
+        file.write(f"{header},{','.join(score_columns)}\n")
+        for glycopeptide_data in pd.read_csv(glycopeptide_file, usecols=['Hydrophobicity', glycan_column],
+                                             dtype={glycan_column: str}, chunksize=chunk_size):
+            glycopeptide_hf_values, glycopeptide_weighted_hf_values = calculate_scores(
+                glycopeptide_data, glycan_hf_table, weight, glycan_column)
+            scores = pd.DataFrame({score_columns[0]: glycopeptide_hf_values, score_columns[1]: glycopeptide_weighted_hf_values})
+            score_lines = scores.to_csv(index=False, header=False, lineterminator='\n').splitlines()
+
+            # Append the scores to the input lines of the chunk
+            lines = [library.readline().rstrip('\r\n') for _ in range(len(score_lines))]
+            for line in lines:
+                if not line or line.count('"') % 2:
+                    raise ValueError(f"{glycopeptide_file}: blank lines and line breaks inside fields are not supported.")
+            file.write(''.join(f"{line},{score}\n" for line, score in zip(lines, score_lines)))
+            rows += len(lines)
+    return rows
 
 def main():
     """
@@ -67,17 +66,13 @@ def main():
     parser.add_argument('-i', '--glycopeptide_file', type=str, required=True, help="Input file with glycopeptide data")
     parser.add_argument('-gh', '--glycan_hf_file', type=str, default=os.path.join(os.path.dirname(__file__), 'glycan_mass_library/human_serum_glycopeptide_hydrophobicity_data_glycan_hydrophobicity_index.csv'), help="Input file with glycan hydrophobicity data")
     parser.add_argument('-o', '--output_file', type=str, help="Output file for the results")
+    parser.add_argument('-g', '--glycan_column', type=str, default='composition', help="Glycopeptide column joined with the Glycans of the glycan HF file (default: composition, use Composition for digested libraries)")
+    parser.add_argument('--chunk_size', type=int, default=20000, help="Rows scored at a time (default: 20000)")
 
     args = parser.parse_args()
     
-    # Load input data
-    glycopeptide_data, glycan_hf_data = load_data(args.glycopeptide_file, args.glycan_hf_file)
-    
-    # Build glycan hydrophobicity dictionary for quick lookup
-    glycan_hf_dict = build_glycan_hf_dict(glycan_hf_data)
-    
-    # Calculate hydrophobicity scores
-    glycopeptide_hf_values, glycopeptide_weighted_hf_values = calculate_scores(glycopeptide_data, glycan_hf_dict)
+    # Load the glycan hydrophobicity table for the join
+    glycan_hf_table = load_glycan_hf_table(args.glycan_hf_file)
     
     # Determine output file name and ensure it is saved in the HF_glycopeptide_library directory
     output_dir = os.path.join(os.path.dirname(__file__), 'HF_glycopeptide_library')
@@ -85,8 +80,11 @@ def main():
     output_file_name = args.output_file if args.output_file else f"{os.path.splitext(os.path.basename(args.glycopeptide_file))[0]}_HF.csv"
     output_file = os.path.join(output_dir, output_file_name)
     
-    # Save the results to a CSV file
-    save_results(glycopeptide_data, glycopeptide_hf_values, glycopeptide_weighted_hf_values, output_file)
+    # Calculate hydrophobicity scores chunk by chunk and stream them to the CSV file
+    start_time = time.perf_counter()
+    rows = score_library(args.glycopeptide_file, glycan_hf_table, output_file, args.chunk_size, glycan_column=args.glycan_column)
+    print(f"{rows} glycopeptides scored in {time.perf_counter() - start_time:.2f} seconds.")
+    print(f"Output saved to {output_file}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
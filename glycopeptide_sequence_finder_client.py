@@ -0,0 +1,125 @@
+"""
+glycopeptide_sequence_finder_client.py
+
+Local stand-in client for glycopeptide_sequence_finder_server.py. Sends digest requests (a sequence or the proteins of
+a FASTA file) or mass lookups over TCP or a Unix socket on one keep-alive connection, optionally repeated to measure
+latency, and prints the client side p50/p99 latency together with the server /stats.
+
+Usage:
+    python glycopeptide_sequence_finder_client.py [--sequence <sequence> | -i <fasta> | --mass <mass> | --mz <mz> --charge <charge>] [-p <protease>] [-c <missed_cleavages>] [-n <repeats>] [--host <host>] [--port <port>] [-s <socket>] [-v]
+
+Author:
+    Richard Shipman -- 2025
+"""
+import argparse
+import http.client
+import json
+import socket
+import time
+
+import glycopeptide_sequence_finder_core as gsf
+from glycopeptide_sequence_finder_server import percentile
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTP connection over a Unix socket."""
+
+    def __init__(self, path):
+        super().__init__("localhost")
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.path)
+
+class GlycopeptideClient:
+    """Client of the glycopeptide finder server, keeping one connection open between requests."""
+
+    def __init__(self, host="127.0.0.1", port=8765, socket_path=None):
+        self.connection = UnixHTTPConnection(socket_path) if socket_path else http.client.HTTPConnection(host, port)
+
+    def request(self, method, path, body=None):
+        """Sends a request and returns the status code and decoded JSON response."""
+        payload = json.dumps(body).encode() if body is not None else None
+        headers = {"Content-Type": "application/json"} if payload is not None else {}
+        try:
+            self.connection.request(method, path, body=payload, headers=headers)
+        except BrokenPipeError:
+            # The server answered an oversized body (413) and closed the connection before reading it; the response
+            # is still readable
+            pass
+        response = self.connection.getresponse()
+        return response.status, json.loads(response.read())
+
+    def digest(self, **request):
+        return self.request("POST", "/digest", request)
+
+    def mass(self, **request):
+        return self.request("POST", "/mass", request)
+
+    def stats(self):
+        return self.request("GET", "/stats")[1]
+
+    def close(self):
+        self.connection.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Stand-in client for the Glycopeptide Finder server.")
+    parser.add_argument("--sequence", help="Protein sequence to digest.")
+    parser.add_argument("-i", "--input", help="FASTA file whose proteins are sent in one digest request.")
+    parser.add_argument("--mass", type=float, help="Neutral glycopeptide mass to look up.")
+    parser.add_argument("--mz", type=float, help="Precursor m/z to look up (with --charge).")
+    parser.add_argument("--charge", type=int, help="Precursor charge of --mz.")
+    parser.add_argument("--tolerance_ppm", type=float, default=10, help="Mass lookup tolerance in ppm (default: 10).")
+    parser.add_argument("-p", "--protease", help="Protease of the digest request (default: the server protease).")
+    parser.add_argument("-c", "--missed_cleavages", type=int, help="Missed cleavages of the digest request (default: the server setting).")
+    parser.add_argument("-n", "--repeats", type=int, default=1, help="Number of times the request is sent (default: 1).")
+    parser.add_argument("--host", default="127.0.0.1", help="Server host (default: 127.0.0.1).")
+    parser.add_argument("--port", type=int, default=8765, help="Server port (default: 8765).")
+    parser.add_argument("-s", "--socket", help="Server Unix socket path (instead of TCP).")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Print the last response.")
+    args = parser.parse_args()
+
+    # Build the request
+    if args.mass is not None or args.mz is not None:
+        path = "/mass"
+        body = {"mass": args.mass} if args.mass is not None else {"mz": args.mz, "charge": args.charge}
+        body["tolerance_ppm"] = args.tolerance_ppm
+    elif args.sequence or args.input:
+        path = "/digest"
+        if args.input:
+            body = {"proteins": [{"protein_id": protein_id, "description": description, "sequence": sequence}
+                                 for protein_id, description, sequence in gsf.read_fasta_records(args.input)]}
+        else:
+            body = {"sequence": args.sequence, "protein_id": "query"}
+        if args.protease:
+            body["protease"] = args.protease
+        if args.missed_cleavages is not None:
+            body["missed_cleavages"] = args.missed_cleavages
+    else:
+        parser.error("Give --sequence, -i, --mass or --mz and --charge.")
+
+    # Send the request repeatedly on one connection
+    client = GlycopeptideClient(args.host, args.port, args.socket)
+    latencies = []
+    for _ in range(args.repeats):
+        start = time.perf_counter()
+        status, response = client.request("POST", path, body)
+        latencies.append(time.perf_counter() - start)
+        if status != 200:
+            print(f"Request failed ({status}): {response.get('error')}")
+            break
+
+    if args.verbose:
+        print(json.dumps(response, indent=2))
+    elif path == "/mass":
+        print(f"{len(response.get('matches', []))} glycopeptides within {args.tolerance_ppm} ppm of {response.get('mass')}.")
+    else:
+        glycopeptides = sum(len(protein["glycopeptides"]) for protein in response.get("proteins", []))
+        print(f"{len(response.get('proteins', []))} proteins digested, {glycopeptides} glycopeptides.")
+
+    print(f"{len(latencies)} requests: p50 {percentile(latencies, 0.50) * 1000:.3f} ms, p99 {percentile(latencies, 0.99) * 1000:.3f} ms")
+    print(f"Server stats: {json.dumps(client.stats())}")
+    client.close()
+
+if __name__ == "__main__":
+    main()
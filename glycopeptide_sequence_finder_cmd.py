@@ -6,269 +6,145 @@ predicts their masses, calculates their hydrophobicity, and calculates their pI.
 in the digest_glycopeptide_library directory.
 
 Usage:
-    python glycopeptide_sequence_finder_cmd.py -i <input_fasta_file> -o <output_csv_file> -p <protease> -g <glycosylation_type> -c <missed_cleavages> -l <log_file> -v -y <glycan_file> -z <max_charge>
+    python glycopeptide_sequence_finder_cmd.py -i <input_fasta_file> -o <output_csv_file> -p <protease> -g <glycosylation_type> -c <missed_cleavages> -l <log_file> -v -y <glycan_file> -z <max_charge> [--fragment_charges <min> <max>] [--isotopes <n>] [--glycan_hf <glycan_hf_file>] [--chunk_size <rows>] [--threads <n>] [--profile [stages|cprofile]] [--profile_memory]
 
 Author:
     Richard Shipman -- 2025
 """
 import argparse
+import cProfile
 import csv
-from itertools import permutations
-import re
-from Bio import SeqIO
+from contextlib import contextmanager
+import json
+import pstats
 import os
 import logging
-import pandas as pd
-
-# Constants
-
-# Define protease cleavage rules
-proteases = {
-    "trypsin": ("[KR]", "P"),  # Cleaves after K or R unless followed by P
-    "chymotrypsin": ("[FWY]", "P"),  # Cleaves after F, W, or Y unless followed by P
-    "glu-c": ("E", None),  # Cleaves after E
-    "lys-c": ("K", None),  # Cleaves after K
-    "arg-c": ("R", None),  # Cleaves after R
-    "pepsin": ("[FLWY]", None),  # Cleaves after F, W, or Y
-    "asp-n": ("D", None),  # Cleaves **before** Asp (D)
-    "proteinase-k": ("[AFILVWY]", None),  # Cleaves after A, F, I, L, V, W, Y
+import sys
+import time
+import tracemalloc
+
+# Constants, the digestion, sequon and mass core and the row pipeline (no pandas import, see glycopeptide_sequence_finder_core.py)
+from glycopeptide_sequence_finder_core import (
+    proteases,
+    glycosylation,
+    amino_acid_masses,
+    hydrophobicity_values,
+    pKa_values,
+    monosaccharide_library,
+    default_glycan_hydrophobicity,
+    default_n_glycans,
+    default_o_glycans,
+    default_c_glycans,
+    protein_fields,
+    peptide_fields,
+    glycopeptide_fields,
+    cleave_sequence,
+    calculate_peptide_mass,
+    predict_hydrophobicity,
+    calculate_pI,
+    compute_mz,
+    compute_hf_experimental,
+    glycan_hf_terms,
+    glycan_hydrophobicity_keys,
+    load_glycan_hydrophobicity,
+    parse_composition,
+    calculate_n_glycopeptide_ions,
+    glycan_fragments,
+    peptide_fragment_masses,
+    peptide_ions,
+    glycopeptide_ions,
+    charge_mz_table,
+    peptide_neutral_ions,
+    glycopeptide_ion_table,
+    json_members,
+    amino_acid_formulas,
+    element_isotopes,
+    parse_formula,
+    peptide_formula,
+    glycan_formula,
+    convolve_envelopes,
+    isotope_envelope,
+    top_isotopes,
+    glycan_sub_compositions,
+    generate_all_y_ions,
+    header_pattern,
+    fasta_buffer_records,
+    fasta_compressions,
+    compressed_fasta_extensions,
+    fasta_compression,
+    decompressed_stream,
+    background_chunks,
+    fasta_chunk_records,
+    read_fasta_records,
+    fasta_stream_records,
+    fasta_records,
+    NullProfiler,
+    null_profiler,
+    default_glycans,
+    GlycanLibrary,
+    compile_glycans,
+    load_glycan_records,
+    parse_header,
+    digest_proteins,
+    find_sequons,
+    peptide_rows,
+    glycopeptide_rows,
+    glycopeptide_library_fields,
+    glycan_cross_rows,
+    add_hf_experimental_rows,
+    add_ion_rows,
+    add_isotope_rows,
+    digest_record_rows,
+    library_output_files,
+    compressed_extensions,
+    ParallelGzipWriter,
+    open_library_output,
+    write_rows,
+    write_library_rows,
+    output_formats,
+    RowWriter,
+    stream_record_rows,
+    write_record_chunks,
+    PeptideRecord,
+    GlycopeptideRecord,
+    ProteinResult,
+    FinderResult,
+    GlycopeptideFinder,
+)
+
+# pandas is imported inside the functions that build DataFrames, so importing this module and running the command
+# line pipeline does not pay its import cost. The default glycan library DataFrames are built on first access.
+default_glycan_libraries = {
+    "default_n_glycan_library": "N",
+    "default_o_glycan_library": "O",
+    "default_c_glycan_library": "C",
 }
 
-# Define glycosylation sequon rules
-glycosylation = {
-    "N": ("N[^P][STC]"),  # N-glycosylation sequon - N-X-S/T/C (X is any amino acid except P).
-    "O": ("[ST]"),  # O-glycosylation sequon - S/T  (experimental! Creates large number of O-glycopeptides.)
-    "C": ("W..[WCF]")  # C-glycosylation sequon - W-X-X-W, W-X-X-C, or W-X-X-F (X is any amino acid).
-}
-
-# Define amino acid mass values for calculating peptide mass
-amino_acid_masses = {
-    'A': 71.03711, 'R': 156.10111, 'N': 114.04293, 'D': 115.02694, 'C': 103.00919,
-    'Q': 128.05858, 'E': 129.04259, 'G': 57.02146, 'H': 137.05891, 'I': 113.08406,
-    'L': 113.08406, 'K': 128.09496, 'M': 131.04049, 'F': 147.06841, 'P': 97.05276,
-    'S': 87.03203, 'T': 101.04768, 'W': 186.07931, 'Y': 163.06333, 'V': 99.06841
-}
-
-# Kyte-Doolittle hydrophobicity values for amino acids
-hydrophobicity_values = {
-    'A': 1.8, 'R': -4.5, 'N': -3.5, 'D': -3.5, 'C': 2.5,
-    'Q': -3.5, 'E': -3.5, 'G': -0.4, 'H': -3.2, 'I': 4.5,
-    'L': 3.8, 'K': -3.9, 'M': 1.9, 'F': 2.8, 'P': -1.6,
-    'S': -0.8, 'T': -0.7, 'W': -0.9, 'Y': -1.3, 'V': 4.2
-}
-
-# Define amino acid pKa values for calculating pI (placeholder)
-pKa_values = {
-    'C': 8.18, 'D': 3.65, 'E': 4.25, 'H': 6.00, 'K': 10.53,
-    'R': 12.48, 'Y': 10.07, 'N': 3.22, 'Q': 3.22, 'S': 3.70,
-    'T': 3.70, 'W': 10.07
-}
-
-# Define default N-glycan mass library as a DataFrame (N-Glycans) Using most common N-glycans as default, HexNAc(2)Hex(8) with no stereochemistry
-default_n_glycan_library = pd.DataFrame([
-    #{"glytoucan_ac": "G59324HL", "byonic": "HexNAc(2)Hex(12) % 2350.792627", "composition": "HexNAc(2)Hex(12)", "mass": 2350.792627, "shorthand_glycan": "N2H12"}, # N2H12
-    #{"glytoucan_ac": "G58087IP", "byonic": "HexNAc(2)Hex(11) % 2188.739804", "composition": "HexNAc(2)Hex(11)", "mass": 2188.739804, "shorthand_glycan": "N2H11"}, # N2H11
-    #{"glytoucan_ac": "G83460ZZ", "byonic": "HexNAc(2)Hex(10) % 2026.686980", "composition": "HexNAc(2)Hex(10)", "mass": 2026.686980, "shorthand_glycan": "N2H10"}, # N2H10
-    #{"glytoucan_ac": "G80920RR", "byonic": "HexNAc(2)Hex(9) % 1864.634157", "composition": "HexNAc(2)Hex(9)", "mass": 1864.634157, "shorthand_glycan": "N2H9"}, # N2H9
-    #{"glytoucan_ac": "G62765YT", "byonic": "HexNAc(2)Hex(8) % 1702.581333", "composition": "HexNAc(2)Hex(8)", "mass": 1702.581333, "shorthand_glycan": "N2H8"}, # N2H8 -- High Mannose
-    #{"glytoucan_ac": "G31852PQ", "byonic": "HexNAc(2)Hex(7) % 1540.528510", "composition": "HexNAc(2)Hex(7)", "mass": 1540.528510, "shorthand_glycan": "N2H7"}, # N2H7
-    #{"glytoucan_ac": "G41247ZX", "byonic": "HexNAc(2)Hex(6) % 1378.475686", "composition": "HexNAc(2)Hex(6)", "mass": 1378.475686, "shorthand_glycan": "N2H6"}, # N2H6
-    {"glytoucan_ac": "G22768VO", "byonic": "HexNAc(2)Hex(3) % 1216.422863", "composition": "HexNAc(2)Hex(3)", "mass": 1216.422863, "shorthand_glycan": "N2H3"}, # N2H3
-    #{"glytoucan_ac": "G36670VW", "byonic": "HexNAc(5)Hex(5)dHex(1)NeuAc(2) % 2553.909723", "composition": "HexNAc(5)Hex(5)dHex(1)NeuAc(2)", "mass": 2553.909723, "shorthand_glycan": "N5H5F1S2"}  # N5H5F1S2 -- # Complex - Fucosylation, Sialylated
-    #{"glytoucan_ac": "G29068FM", "byonic": "HexNAc(1) % 221.089937305", "composition": "HexNAc(1)", "mass": 221.089937305, "shorthand_glycan": "N1"}, # N1 -- EndoH Treatment HexNAc
-    #{"glytoucan_ac": "G04038LG", "byonic": "HexNAc(1)dHex(1) % 367.147846175", "composition": "HexNAc(1)dHex(1)", "mass": 367.147846175, "shorthand_glycan": "N1F1"}, # N1F1 -- EndoH Treatment HexNAc (Fuc-Core)
-])
-
-# Define default O-glycan mass library as a DataFrame (O-GalNAc Glycans) Using most common O-glycans as default, HexNac(1) with no stereochemistry
-default_o_glycan_library = pd.DataFrame([
-    {"glytoucan_ac": "G14843DJ", "byonic": "HexNAc(1) % 221.089937305", "composition": "HexNAc(1)", "mass": 221.089937305, "shorthand_glycan": "N1"}, # N1
-])
-
-# Define default C-glycan mass library as a DataFrame (C-Mannosylation) Using most common C-glycans as default, Hex(1) with no stereochemistry
-default_c_glycan_library = pd.DataFrame([
-    {"glytoucan_ac": "G81399MY", "byonic": "Hex(1) % 180.0633882", "composition": "Hex(1)", "mass": 180.0633882, "shorthand_glycan": "H1"}, # H1
-])
-
-# Define monosaccharide mass library with multiple properties (later use)
-monosaccharide_library = {
-    "Hex": {"mass": 162.0528, "formula": "C6H10O5", "symbol": "H"},
-    "HexA": {"mass": 176.0321, "formula": "C6H8O6", "symbol": "Ha"},
-    "HexNAc": {"mass": 203.0794, "formula": "C8H13NO5", "symbol": "N"},
-    "Fuc": {"mass": 146.0579, "formula": "C6H12O5", "symbol": "F"},
-    "dHex": {"mass": 146.0579, "formula": "C6H12O5", "symbol": "dH"},
-    "NeuAc": {"mass": 291.0954, "formula": "C11H17NO8", "symbol": "S"},
-    "NeuGc": {"mass": 307.0903, "formula": "C11H17NO9", "symbol": "G"},
-    "Xyl": {"mass": 150.0423, "formula": "C5H10O5", "symbol": "X"},
-    "Pent": {"mass": 132.0423, "formula": "C5H10O5", "symbol": "P"},
-    "Sulpho": {"mass": 79.9568, "formula": "SO3", "symbol": "Su"},
-    "Phospho": {"mass": 79.9663, "formula": "PO3", "symbol": "Ph"},
-    "Methyl": {"mass": 14.0157, "formula": "CH3", "symbol": "Me"},
-    "Acetyl": {"mass": 42.0106, "formula": "C2H3O", "symbol": "Ac"},
-    "Deoxy": {"mass": -18.0106, "formula": "H2O", "symbol": "d"},
-    "Amine": {"mass": 1.0078, "formula": "H", "symbol": "NH2"}
-}
-
-# Define hydrophobicity values for glycan library (experimental) 
-# (between -1 and 1) in relation to the peptide backbone and rank spread of glycopeptides with the same backdone.
-# compute_glycan_hydrophobicity.py script will be used to calculate the hydrophobicity values.
-# averaged aggregated from human and mouse datasets
-default_glycan_hydrophobicity = {
-    "N2H8": -0.0062899,
-    "N2H7": -0.005723031,
-    "N2H6": -0.004347122,
-    "N2H9": -0.001982055,
-    "N2H10": -0.001554309,
-    "N2H11": -2.53305E-05,
-    "N2H12": 5.36847E-06
-}
+def __getattr__(name):
+    """Builds the default glycan library DataFrames (default_n/o/c_glycan_library) on first access."""
+    if name not in default_glycan_libraries:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    import pandas as pd
+    library = pd.DataFrame(default_glycans(default_glycan_libraries[name]))
+    globals()[name] = library
+    return library
 
 # Functions
 
-def cleave_sequence(sequence, protease, missed_cleavages=0):
-    """Cleaves a sequence based on protease rules."""
-    cleavage_pattern, exclusion = proteases[protease.lower()]
-
-    # Handle Asp-N separately because it cleaves **before** D
-    if protease.lower() == "asp-n":
-        regex = rf"(?={cleavage_pattern})"  # Cleaves before D
-    else:
-        regex = rf"(?<={cleavage_pattern})(?!{exclusion})"  # Cleaves after other residues
-
-    # Perform cleavage
-    fragments = re.split(regex, sequence)
-
-    # Generate peptides including missed cleavages
-    peptides = []
-    for i in range(len(fragments)):
-        for j in range(i + 1, min(i + 2 + missed_cleavages, len(fragments) + 1)):
-            peptides.append("".join(fragments[i:j]))
-
-    return peptides
-
 def find_glycopeptides(peptides_df, glycosylation_type):
     """Identifies peptides containing sequons and maps the sites to the full protein sequence."""
     
     # Process pandas Dataframe
     peptides = [pep for sublist in peptides_df["Peptides"].tolist() for pep in sublist]
     full_sequence = peptides_df["Sequence"].tolist()[0]
-    glycosylation_type = glycosylation_type
-    
-    glyco_sequon = re.compile(glycosylation[glycosylation_type])
-    glycopeptides = []
-    for pep in peptides:
-        for match in glyco_sequon.finditer(pep):
-            # Map the position in the peptide to the full protein sequence
-            start_in_protein = full_sequence.find(pep) + match.start() + 1  # Adjust to 1-based indexing
-            glycopeptides.append((pep, start_in_protein))
-    return glycopeptides
-
-def calculate_peptide_mass(sequence):
-    """Calculates the mass of a peptide using predefined amino acid masses."""
-    
-    # Common ambiguous residues
-    invalid_residues = {"X", "B", "Z", "J", "U", "O"}  
-    if any(aa in invalid_residues for aa in sequence):
-        return "Unknown"  # Or return unknown if you prefer
-    
-    # water
-    water  = 18.010565
-
-    # Calculate the mass using the amino_acid_masses dictionary
-    mass = sum(amino_acid_masses.get(aa, 0) for aa in sequence) + water
-    return mass
-
-def predict_hydrophobicity(peptide_sequence):
-    """Predicts the hydrophobicity of a peptide sequence using the Kyte-Doolittle scale."""
-    
-    # safety check for empty peptide strings
-    if len(peptide_sequence) == 0:
-        return 0.0
-
-    # Calculate the average hydrophobicity of the peptide
-    total_hydrophobicity = sum(hydrophobicity_values.get(aa, 0) for aa in peptide_sequence)
-    average_hydrophobicity = round(total_hydrophobicity / len(peptide_sequence), 5)
-
-    return average_hydrophobicity
-
-def calculate_pI(peptide_sequence):
-    """
-    Calculate the isoelectric point (pI) of a peptide sequence.
-    
-    Parameters:
-        peptide (str): Peptide sequence (1-letter amino acid codes)
-    
-    Returns:
-        float: Estimated isoelectric point (pI)
-    """
-    # peptide sequence to string
-    peptide_sequence = str(peptide_sequence)
-
-    # Terminal group pKa values (assuming N-term = 9.6, C-term = 2.3)
-    N_term_pKa = 9.6
-    C_term_pKa = 2.3
-
-    # Count occurrences of ionizable residues
-    residue_counts = {aa: peptide_sequence.count(aa) for aa in pKa_values}
-    
-    # Function to calculate charge at a given pH
-    def calculate_net_charge(pH):
-        charge = 0.0
-
-        # N-terminal charge
-        charge += 1 / (1 + 10**(pH - N_term_pKa))
-
-        # C-terminal charge
-        charge -= 1 / (1 + 10**(C_term_pKa - pH))
-
-        # Side chain charges
-        for aa, count in residue_counts.items():
-            if count > 0:
-                pKa = pKa_values[aa]
-                if aa in ['D', 'E', 'Y', 'C']:  # Acidic side chains
-                    charge -= count / (1 + 10**(pKa - pH))
-                elif aa in ['H', 'K', 'R']:  # Basic side chains
-                    charge += count / (1 + 10**(pH - pKa))
-        
-        return charge
-
-    # Use bisection method to find the pH where net charge is closest to zero
-    low, high = 0.0, 14.0
-    while high - low > 0.01:  # Precision threshold
-        mid = (low + high) / 2
-        net_charge = calculate_net_charge(mid)
-        if net_charge > 0:
-            low = mid
-        else:
-            high = mid
-
-    return round((low + high) / 2, 2)
-
-def compute_mz(mass, charge):
-    """Compute m/z value for a given mass and charge state."""
-    proton = 1.007276
-    return (mass + (charge * proton)) / charge
-
-# experimental glycopeptide hydrophobicity calculation
-def compute_hf_experimental(peptide_hydrophobicity, glycan, hf_weight=10, rt_scale=60):
-    """Compute HF_experimental and scaled retention time (rt_HF_experimental) values."""
-    glycan_hydrophobicity = default_glycan_hydrophobicity.get(glycan, None)
-    
-    # Compute HF_experimental and scaled retention time (rt_HF_experimental) values
-    if glycan_hydrophobicity is not None:
-        hf_experimental = peptide_hydrophobicity + glycan_hydrophobicity * hf_weight
-        rt_hf_experimental = (glycan_hydrophobicity * hf_weight + 1) * (rt_scale / 2)
-    else:
-        hf_experimental = ""
-        rt_hf_experimental = ""
-    
-    return round(hf_experimental, 5), rt_hf_experimental
+    return find_sequons(peptides, full_sequence, glycosylation_type)
 
 def process_glycopeptides(peptide_file, glycans, max_charge):
     """
     Generate glycopeptide variants by combining peptides and glycans, and compute their mass-to-charge (m/z) values.
     Parameters:
-        peptide_file (str): Path to the CSV file containing peptide data. The CSV file should include columns such as
-                            'ProteinID', 'Site', 'Peptide', 'PredictedMass', 'Length', 'Sequon', 'Hydrophobicity', and 'pI'.
+        peptide_file (str or pandas.DataFrame): Path to the CSV file (or DataFrame) containing peptide data. It should include
+                            columns such as 'ProteinID', 'Site', 'Peptide', 'PredictedMass', 'Length', 'Sequon', 'Hydrophobicity', and 'pI'.
         glycans (pandas.DataFrame): DataFrame containing glycan data. This DataFrame should include columns such as
                                     'glytoucan_ac', 'composition', and 'mass'.
         max_charge (int): The maximum charge state for which m/z values will be computed. m/z values are calculated for charge
@@ -278,295 +154,96 @@ def process_glycopeptides(peptide_file, glycans, max_charge):
     Notes:
         - The peptide CSV file is loaded with low_memory=False to improve type inference.
         - Non-numeric values in the 'PredictedMass' column are coerced to NaN and subsequently dropped.
-        - It is assumed that the compute_mz() function is defined in the same scope where process_glycopeptides() is used.
+        - The glycopeptides are combined by glycan_cross_rows(), the command line pipeline uses it directly on rows.
     """
+    import pandas as pd
+
+    # Load peptide data, either from a CSV file or an in-memory DataFrame
+    if isinstance(peptide_file, pd.DataFrame):
+        peptides = peptide_file
+    else:
+        peptides = pd.read_csv(peptide_file, low_memory=False)
     
-    # Load peptide and glycan data
-    peptides = pd.read_csv(peptide_file, low_memory=False)
-    
-    # Convert relevant columns to float
+    # Keep peptides with a numeric mass
     peptides = peptides[pd.to_numeric(peptides['PredictedMass'], errors='coerce').notnull()]
-    peptides['PredictedMass'] = peptides['PredictedMass'].astype(float)
-    glycans['mass'] = glycans['mass'].astype(float)
-    
-    # Initialize list to store results
-    results = []
-    
-    # Generate glycopeptides, compute m/z values, compute HF_experimental
-    for _, pep in peptides.iterrows():
-        for _, gly in glycans.iterrows():
-
-            # Compute glycopeptide mass
-            glycopeptide_mass = pep['PredictedMass'] + gly['mass']
-
-            # Compute m/z values for charge states from 2 to max_charge
-            mz_values = {f'z{z}': compute_mz(glycopeptide_mass, z) for z in range(2, max_charge + 1)}
-
-            # Create a dictionary with the results
-            result = {
-                'ProteinID': pep['ProteinID'],
-                'Site': pep['Site'],
-                'GlyToucan_AC': gly['glytoucan_ac'],
-                'Composition': gly['composition'],
-                'ShorthandGlycan': gly['shorthand_glycan'],
-                'Peptide': pep['Peptide'],
-                'Start': pep['Start'],
-                'End': pep['End'],
-                'Length': pep['Length'],
-                'Sequon': pep['Sequon'],
-                'GlycopeptideMass': glycopeptide_mass,
-                'PeptideMass': pep['PredictedMass'],
-                'GlycanMass': gly['mass'],
-                'Hydrophobicity': pep['Hydrophobicity'],
-                'pI': pep['pI'],
-                **mz_values, # z charge states values
-            }
 
-            results.append(result)
-    
-    return pd.DataFrame(results)
+    # Generate glycopeptides and compute m/z values
+    results = glycan_cross_rows(peptides.to_dict("records"), glycans.to_dict("records"), max_charge)
+    return pd.DataFrame(results, columns=glycopeptide_library_fields(max_charge)[:-2])
 
-def setup_logging(log_file):
+def setup_logging(log_file, level="INFO"):
     """Sets up logging to a file."""
-    logging.basicConfig(filename=log_file, level=logging.INFO, 
+    logging.basicConfig(filename=log_file, level=getattr(logging, level), 
                         format='%(asctime)s - %(levelname)s - %(message)s')
 
-def process_fasta(file, protease, missed_cleavages, glycosylation_type):
-    """Processes the input FASTA file and extracts glycopeptides."""
-    
-    # Initialize list to store results
-    results = []
-
-    # Regular expression to capture OS and OX from the header
-    os_ox_pattern = r"OS=([^\s]+(?: [^\s]+)*)\s+OX=(\d+)\s+GN=([^\s]+)\s+PE=(\d+)\s+SV=(\d+)"
-
-    # Process each record in the FASTA file
-    for record in SeqIO.parse(file, "fasta"):
-        protein_id = record.id
-        sequence = str(record.seq)
-
-        # Get the full description line
-        header = record.description  
-        
-        # Use regex to find OS, OX, GN, PE, and SV
-        match = re.search(os_ox_pattern, header)
-        if match:
-            os_value = match.group(1)  # Organism Species
-            ox_value = match.group(2)  # Organism Taxonomy ID
-            gn_value = match.group(3)  # Gene Name
-            pe_value = match.group(4)  # Protein Evidence
-            sv_value = match.group(5)  # Sequence Version
-        else:
-            # blank values if not found
-            os_value = ""
-            ox_value = ""
-            gn_value = ""
-            pe_value = ""
-            sv_value = ""
-
-        # Log the digestion processing of the protein with protease and missed cleavages
-        logging.info(f"Processing {protein_id} with {len(sequence)} amino acids.")        
-        peptides = cleave_sequence(sequence, protease, missed_cleavages)
-        logging.info(f"Found {len(peptides)} peptides after {protease} cleavage. The peptides were: {peptides}")
-        
-        # Write protein, peptide and data above list of string results to a pandas DataFrame
-        results.append({
-            "ProteinID": protein_id,
-            "Peptides": peptides,
-            "Sequence": sequence,
-            "Protease": protease,
-            "MissedCleavages": missed_cleavages,
-            "GlycosylationType": glycosylation_type,
-            "Species": os_value,
-            "TaxonID": ox_value,
-            "GeneName": gn_value,
-            "ProteinEvidence": pe_value,
-            "SequenceVersion": sv_value
-        })
-
-    return pd.DataFrame(results)
-
-# Experimental Work in Progress for N-Glycans
-# Function to Calculate glycopeptide ion series m/z values  
-def calculate_n_glycopeptide_ions(peptide, glycan_composition, glycan_frag_order=None, charge=1):
-    """
-    Calculate theoretical m/z values for b, y, c, z, Y, B, and oxonium ions for an N-glycopeptide.
+# Logger of the throughput metrics (JSON lines)
+metrics_logger = logging.getLogger("glycopeptide_finder.metrics")
 
-    Parameters:
-      peptide (str): The peptide sequence (e.g., "NTSK").
-      glycan_composition (str): A string like "HexNAc(5)Hex(5)dHex(1)NeuAc(2)".
-      glycan_frag_order (list, optional): A list specifying the sugar loss order.
-      charge (int): The charge state (default is 1).
+def setup_metrics(metrics_file):
+    """Writes the throughput metrics to their own JSON lines file instead of the log file."""
+    handler = logging.FileHandler(metrics_file)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    metrics_logger.addHandler(handler)
+    metrics_logger.setLevel(logging.INFO)
+    metrics_logger.propagate = False
 
-    Returns:
-      dict: A dictionary with keys for 'b', 'y', 'c', 'z', 'Y', 'B', and 'oxonium' ions and their m/z values.
+class ProgressMeter:
     """
-    # Constants for ion calculations
-    proton = 1.007276
-    water  = 18.010565
-    NH3    = 17.0265  # mass of ammonia
-
-    # Compute the neutral mass of the peptide (including water)
-    peptide_mass = sum(amino_acid_masses[aa] for aa in peptide) + water
-
-    # Parse glycan composition into a dictionary
-    glycan_dict = {}
-    for part in glycan_composition.split(')'):
-        if part:
-            sugar, count = part.split('(')
-            glycan_dict[sugar] = int(count)
-
-    # --- Calculate b ions (CID) ---
-    b_ions = []
-    cumulative = 0.0
-    for i in range(len(peptide) - 1):
-        cumulative += amino_acid_masses[peptide[i]]
-        b_ions.append(round((cumulative + proton) / charge, 4))
-
-    # --- Calculate y ions (CID) ---
-    y_ions = []
-    cumulative = 0.0
-    for i in range(len(peptide) - 1, 0, -1):
-        cumulative += amino_acid_masses[peptide[i]]
-        y_ions.append(round((cumulative + water + proton) / charge, 4))
-
-    # --- Calculate c ions (ETD/ECD) ---
-    # c ions are the N-terminal fragments with an added NH3 group.
-    c_ions = []
-    cumulative = 0.0
-    for i in range(len(peptide) - 1):
-        cumulative += amino_acid_masses[peptide[i]]
-        c_ions.append(round((cumulative + NH3 + proton) / charge, 4))
-
-    # --- Calculate z ions (ETD/ECD) ---
-    # z ions are the complementary C-terminal fragments.
-    # One approach is to take the y ion mass and subtract water and NH3.
-    z_ions = []
-    cumulative = 0.0
-    for i in range(len(peptide) - 1, 0, -1):
-        cumulative += amino_acid_masses[peptide[i]]
-        # (cumulative + water + proton) is the y-ion mass; subtract water and NH3
-        z_ions.append(round((cumulative + proton - NH3) / charge, 4))
-
-    # --- Glycan Calculations ---
-    # glycan_total_mass = sum(monosaccharide_library[sugar]['mass'] * count 
-    #                           for sugar, count in glycan_dict.items())
-    # intact_glycopeptide_mass = peptide_mass + glycan_total_mass
-
-    # --- Calculate Y ions (glycan-attached peptide fragments) ---
-    Y_ions = {}
-    current_mass = peptide_mass  # Start with peptide alone (includes water)
-    Y_ions['Y0'] = round((current_mass + proton) / charge, 4)  # Y0 = peptide only
-
-    y_counter = 1  # Begin numbering Y ions
-
-    # First, add HexNAc(1) and HexNAc(2) if available
-    if 'HexNAc' in glycan_dict and glycan_dict['HexNAc'] >= 1:
-        current_mass += monosaccharide_library['HexNAc']['mass']
-        Y_ions[f'Y{y_counter}'] = round((current_mass + proton) / charge, 4)
-        y_counter += 1
-
-    if 'HexNAc' in glycan_dict and glycan_dict['HexNAc'] >= 2:
-        current_mass += monosaccharide_library['HexNAc']['mass']
-        Y_ions[f'Y{y_counter}'] = round((current_mass + proton) / charge, 4)
-        y_counter += 1
-
-    # Add remaining glycan fragments
-    remaining_sugars = []
-    for sugar, count in glycan_dict.items():
-        if sugar == 'HexNAc':  # Skip first two already added
-            count -= 2
-        remaining_sugars.extend([sugar] * count)
-
-    # Follow glycan_frag_order if provided, otherwise use the default order
-    if glycan_frag_order:
-        ordered_sugars = glycan_frag_order
-    else:
-        ordered_sugars = remaining_sugars
-
-    # Sequentially add the remaining glycans
-    for sugar in ordered_sugars:
-        current_mass += monosaccharide_library[sugar]['mass']
-        Y_ions[f'Y{y_counter}'] = round((current_mass + proton) / charge, 4)
-        y_counter += 1
-
-        # --- Calculate (2plusY 2+ charge) Y 2+ ions (glycan-attached peptide fragments) ---
-    plus2Y_ions = {}
-    current_mass = peptide_mass  # Start with peptide alone (includes water)
-    plus2Y_ions['2Y0'] = round((current_mass + proton) / (charge * 2), 4)  # 2Y0 = peptide only
-
-    y_counter = 1  # Begin numbering for 2Y ions
-
-    # First, add HexNAc(1) and HexNAc(2) if available
-    if 'HexNAc' in glycan_dict and glycan_dict['HexNAc'] >= 1:
-        current_mass += monosaccharide_library['HexNAc']['mass']
-        plus2Y_ions[f'2Y{y_counter}'] = round((current_mass + proton) / (charge * 2), 4)
-        y_counter += 1
-
-    if 'HexNAc' in glycan_dict and glycan_dict['HexNAc'] >= 2:
-        current_mass += monosaccharide_library['HexNAc']['mass']
-        plus2Y_ions[f'2Y{y_counter}'] = round((current_mass + proton) / (charge * 2), 4)
-        y_counter += 1
-
-    # Add remaining glycan fragments for the 2+ ions
-    remaining_sugars = []
-    for sugar, count in glycan_dict.items():
-        if sugar == 'HexNAc':  # Skip the first two already added
-            count -= 2
-        remaining_sugars.extend([sugar] * count)
-
-    # Follow glycan_frag_order if provided, otherwise use the default order
-    if glycan_frag_order:
-        ordered_sugars = glycan_frag_order
-    else:
-        ordered_sugars = remaining_sugars
-
-    # Sequentially add the remaining glycans to the 2Y ions (the fix)
-    for sugar in ordered_sugars:
-        current_mass += monosaccharide_library[sugar]['mass']
-        plus2Y_ions[f'2Y{y_counter}'] = round((current_mass + proton) / (charge * 2), 4)
-        y_counter += 1
-
-    # --- Calculate B ions (glycan fragment ions) ---
-    B_ions = {}
-    cumulative = 0.0
-
-    if glycan_frag_order:
-        # Separate HexNAc from other glycans
-        other_glycans = [sugar for sugar in glycan_frag_order if 'HexNAc' not in sugar]
-        hexnac_glycans = [sugar for sugar in glycan_frag_order if 'HexNAc' in sugar]
-
-        # Combine the orders so that HexNAc comes last
-        glycan_frag_order = other_glycans + hexnac_glycans
-
-        # Iterate through the reordered glycan list
-        for i, sugar in enumerate(glycan_frag_order, start=1):
-            cumulative += monosaccharide_library[sugar]['mass']
-            B_ions[f'B{i}'] = round((cumulative + proton) / charge, 4)
-    else:
-        # If no glycan frag order is provided, handle the glycan composition
-        for sugar, count in glycan_dict.items():
-            for i in range(count):
-                cumulative += monosaccharide_library[sugar]['mass']
-                B_ions[f'B_{sugar}_{i+1}'] = round((cumulative + proton) / charge, 4)
-
-    # --- Calculate Oxonium ions ---
-    oxonium_ions = {}
-    for sugar, count in glycan_dict.items():
-        if count > 0:
-            oxonium_ions[f'ox_{sugar}'] = round(monosaccharide_library[sugar]['mass'] + proton, 4)
-
-    # Return ion series in a dictionary
-    return {
-        'b': b_ions,
-        'y': y_ions,
-        'c': c_ions,
-        'z': z_ions,
-        'Y': dict(sorted(Y_ions.items(), key=lambda item: item[1])),  # Sorted by m/z
-        '2Y': dict(sorted(plus2Y_ions.items(), key=lambda item: item[1])),  # Sorted by m/z
-        'B': B_ions,
-        'oxonium': oxonium_ions,
-    }
+    Counts processed proteins, peptides, glycopeptides and written rows, and emits their throughput as a JSON line
+    to the metrics logger at most once every interval seconds (and once at the end of each protease).
+    """
+
+    def __init__(self, interval=10.0, logger=metrics_logger):
+        self.interval = interval
+        self.logger = logger
+        self.start()
+
+    def start(self, **labels):
+        """Resets the counters, labels (e.g. input file and protease) are added to every emitted line."""
+        self.labels = labels
+        self.proteins = 0
+        self.peptides = 0
+        self.glycopeptides = 0
+        self.rows_written = 0
+        self.start_time = time.monotonic()
+        self.next_emit = self.start_time + self.interval
+
+    def update(self, proteins=0, peptides=0, glycopeptides=0, rows_written=0):
+        """Adds to the counters and emits a metrics line if the interval has passed."""
+        self.proteins += proteins
+        self.peptides += peptides
+        self.glycopeptides += glycopeptides
+        self.rows_written += rows_written
+        now = time.monotonic()
+        if now >= self.next_emit:
+            self.emit(now)
+
+    def emit(self, now=None, final=False):
+        """Emits the current counters and rates as one JSON line."""
+        now = now or time.monotonic()
+        elapsed = max(now - self.start_time, 1e-9)
+        self.next_emit = now + self.interval
+        self.logger.info(json.dumps({
+            **self.labels,
+            "final": final,
+            "elapsed_s": round(elapsed, 3),
+            "proteins": self.proteins,
+            "peptides": self.peptides,
+            "glycopeptides": self.glycopeptides,
+            "rows_written": self.rows_written,
+            "proteins_per_s": round(self.proteins / elapsed, 1),
+            "peptides_per_s": round(self.peptides / elapsed, 1),
+            "glycopeptides_per_s": round(self.glycopeptides / elapsed, 1),
+        }))
+
+def process_records(records, protease, missed_cleavages, glycosylation_type, progress=None):
+    """Digests (protein_id, description, sequence) records and returns the digested proteins as a DataFrame."""
+    import pandas as pd
+    return pd.DataFrame(digest_proteins(records, protease, missed_cleavages, glycosylation_type, progress), columns=protein_fields)
+
+def process_fasta(file, protease, missed_cleavages, glycosylation_type):
+    """Processes the input FASTA file and extracts glycopeptides."""
+    return process_records(read_fasta_records(file), protease, missed_cleavages, glycosylation_type)
 
 # Add this function to write the results to a CSV file
 def write_csv(output_file, data):
@@ -576,58 +253,273 @@ def write_csv(output_file, data):
         writer.writeheader()
         writer.writerows(data)
 
-## Experimental -- testing
-#from itertools import permutations
-def generate_all_y_ions(peptide, glycan_composition, charge=1):
+def max_rss_mb():
+    """Returns the peak resident memory of the process so far in MB, None where the resource module is missing (Windows)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return max_rss / 1e6 if sys.platform == "darwin" else max_rss / 1e3
+
+class StageProfiler:
+    """
+    Records wall time, CPU time and the process peak resident memory (max_rss_mb) after each pipeline stage
+    (--profile). With trace_memory, the peak memory allocated within every stage is traced with tracemalloc
+    (--profile_memory); tracing slows down allocation-heavy stages, so their times are then inflated.
     """
-    Generate all possible Y ion series considering different fragmentation paths.
 
-    Parameters:
-      peptide (str): Peptide sequence (e.g., "NTSK").
-      glycan_composition (str): Glycan composition string (e.g., "HexNAc(5)Hex(5)dHex(1)NeuAc(2)").
-      charge (int): The charge state (default is 1).
+    def __init__(self, trace_memory=False):
+        self.stages = []
+        self.trace_memory = trace_memory
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextmanager
+    def stage(self, name, protease=None):
+        """Context manager timing one stage, optionally for a protease."""
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        start_wall = time.perf_counter()
+        start_cpu = time.process_time()
+        try:
+            yield
+        finally:
+            entry = {
+                "stage": name,
+                "protease": protease,
+                "wall_time": time.perf_counter() - start_wall,
+                "cpu_time": time.process_time() - start_cpu,
+            }
+            max_rss = max_rss_mb()
+            if max_rss is not None:
+                entry["max_rss_mb"] = max_rss
+            if self.trace_memory:
+                entry["peak_memory_mb"] = tracemalloc.get_traced_memory()[1] / 1e6
+            self.stages.append(entry)
+
+    def summary(self):
+        """Totals the stage entries per stage and per protease."""
+        per_stage = {}
+        per_protease = {}
+        for entry in self.stages:
+            for totals, key in ((per_stage, entry["stage"]), (per_protease, entry["protease"] or "all")):
+                total = totals.setdefault(key, {"wall_time": 0.0, "cpu_time": 0.0, "max_rss_mb": 0.0})
+                total["wall_time"] += entry["wall_time"]
+                total["cpu_time"] += entry["cpu_time"]
+                total["max_rss_mb"] = max(total["max_rss_mb"], entry.get("max_rss_mb", 0.0))
+                if "peak_memory_mb" in entry:
+                    total["peak_memory_mb"] = max(total.get("peak_memory_mb", 0.0), entry["peak_memory_mb"])
+        return {"stages": self.stages, "per_stage": per_stage, "per_protease": per_protease}
+
+    def write_report(self, report_file, metadata=None, cprofile_stats=None):
+        """Writes the profile report as JSON, with the top cProfile functions if available."""
+        report = {"metadata": metadata or {}, **self.summary()}
+        if cprofile_stats is not None:
+            report["cprofile_top"] = [
+                {"function": f"{filename}:{line}({function})", "calls": calls, "total_time": total_time, "cumulative_time": cumulative_time}
+                for (filename, line, function), (_, calls, total_time, cumulative_time, _) in
+                sorted(cprofile_stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:30]
+            ]
+        with open(report_file, "w") as f:
+            json.dump(report, f, indent=2)
+
+def load_glycan_library(glycosylation_type, glycan_file=None):
+    """Loads the glycan library from a CSV file, or the default library for the glycosylation type, as a DataFrame."""
+    import pandas as pd
+    if glycan_file is not None:
+        return pd.read_csv(glycan_file)
+    return pd.DataFrame(default_glycans(glycosylation_type))
+
+def build_peptide_library(results_df):
+    """Flattens the digested proteins into the peptide library with mass, hydrophobicity and pI per peptide."""
+    import pandas as pd
+    return pd.DataFrame(peptide_rows(results_df.to_dict("records")), columns=peptide_fields)
+
+def build_glycopeptide_library(results_df, glycosylation_type, peptide_max_length):
+    """Finds the glycopeptides of every digested protein and returns them as a DataFrame of peptide backbones."""
+    import pandas as pd
+    return pd.DataFrame(glycopeptide_rows(results_df.to_dict("records"), glycosylation_type, peptide_max_length),
+                        columns=glycopeptide_fields)
+
+def add_ion_series(glycopeptide_results):
+    """Computes the IonSeries column of the glycopeptides."""
+    if not glycopeptide_results.empty:
+        # Glycan fragment tables are computed once per composition
+        fragment_tables = GlycanLibrary([])
+        glycopeptide_results["IonSeries"] = glycopeptide_results.apply(lambda row: glycopeptide_ions(row["Peptide"], fragment_tables.fragment_table(row["Composition"]), charge=1), axis=1)
+    return glycopeptide_results
+
+def digest_records(records, protease, missed_cleavages, glycosylation_type, glycans, charge_state, peptide_max_length=25,
+                   profiler=None, progress=None, fragment_charges=None, isotopes=None, glycan_hydrophobicity=None):
+    """
+    Digests protein records with one protease and builds the peptide and glycopeptide libraries in memory.
 
     Returns:
-      dict: A dictionary where keys are fragmentation paths and values are Y ion series.
+        dict: The number of proteins, the peptide library and the glycopeptide library (pandas DataFrames).
     """
-    # Constants
-    proton = 1.007276
-    water  = 18.010565
-
-    # Compute the neutral mass of the peptide
-    peptide_mass = sum(amino_acid_masses[aa] for aa in peptide) + water
-
-    # Parse glycan composition
-    glycan_dict = {}
-    for part in glycan_composition.split(')'):
-        if part:
-            sugar, count = part.split('(')
-            glycan_dict[sugar] = int(count)
-
-    # Convert glycan composition into a list of sugars
-    glycan_list = []
-    for sugar, count in glycan_dict.items():
-        glycan_list.extend([sugar] * count)  # Expand each sugar into individual occurrences
-
-    # Generate all possible fragmentation paths
-    unique_permutations = set(permutations(glycan_list))  # Unique orders only
+    import pandas as pd
+
+    # Glycan libraries may be given as a DataFrame or as glycan records
+    if isinstance(glycans, pd.DataFrame):
+        glycans = glycans.to_dict("records")
+    libraries = digest_record_rows(records, protease, missed_cleavages, glycosylation_type, glycans, charge_state,
+                                   peptide_max_length, profiler=profiler, progress=progress, fragment_charges=fragment_charges,
+                                   isotopes=isotopes, glycan_hydrophobicity=glycan_hydrophobicity)
+    return {
+        "proteins": libraries["proteins"],
+        "peptide_library": pd.DataFrame(libraries["peptide_library"], columns=peptide_fields),
+        "glycopeptide_library": pd.DataFrame(libraries["glycopeptide_library"], columns=libraries["glycopeptide_fields"]),
+    }
 
-    # Compute Y ions for each fragmentation path
-    all_Y_ions = {}
+def write_libraries(peptide_library, glycopeptide_library, peptide_output_file, glycopeptide_output_file):
+    """Writes the peptide and glycopeptide libraries, creating the output directories if needed."""
+    for directory in (os.path.dirname(peptide_output_file), os.path.dirname(glycopeptide_output_file)):
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+    peptide_library.to_csv(peptide_output_file, index=False)
+    glycopeptide_library.to_csv(glycopeptide_output_file, index=False)
+
+def run_protease(input_file, protease, missed_cleavages, glycosylation_type, glycans, charge_state,
+                 peptide_max_length=25, output_file=None, verbose=False, log=False, profiler=None, progress=None,
+                 fragment_charges=None, isotopes=None, glycan_hydrophobicity=None, chunk_size=10000, threads=None,
+                 records=None):
+    """
+    Digests a FASTA file with one protease and writes its peptide and glycopeptide libraries in chunks of about
+    chunk_size glycopeptide rows (write_record_chunks), compressed by extension with threads compression threads
+    (open_library_output). The FASTA file is read as it is digested, unless its records are given (read once by the
+    caller for several proteases).
 
-    for perm in unique_permutations:
-        path_name = " -> ".join(perm)  # Name this path
+    Returns:
+        dict: Output files and row counts of the peptide and glycopeptide libraries.
+    """
+    peptide_output_file, default_output_file = library_output_files(input_file, protease, missed_cleavages, charge_state, glycosylation_type)
+    glycopeptide_output_file = output_file or default_output_file
+
+    # The peptide library is compressed like the glycopeptide library
+    extension = os.path.splitext(glycopeptide_output_file)[1].lower()
+    if extension in compressed_extensions:
+        peptide_output_file += extension
+
+    # Log the start of the process
+    print(f"Processing {input_file} with protease {protease} and {missed_cleavages} missed cleavages...")
+    if log:
+        logging.info(f"Processing {input_file} with protease {protease} and {missed_cleavages} missed cleavages...")
+        logging.info(f"Generating glycopeptides and computing m/z values with range of +2 to +{charge_state} charge states.")
+
+    profiler = profiler or null_profiler
+    if progress:
+        progress.start(input_file=input_file, protease=protease)
+
+    # Glycan libraries may be given as a DataFrame or as glycan records (load_glycan_records)
+    if hasattr(glycans, "to_dict"):
+        glycans = glycans.to_dict("records")
+
+    # Read the protein records as they are digested
+    if records is None:
+        records = read_fasta_records(input_file)
+
+    # Digest the proteins, find glycopeptides, combine with glycans, compute m/z values and ion series and write the
+    # peptide library and the glycopeptide library chunk by chunk
+    glycopeptide_fields = glycopeptide_library_fields(charge_state, fragment_charges, isotopes, glycan_hydrophobicity is not None)
+    with open_library_output(peptide_output_file, threads) as peptide_stream, \
+            open_library_output(glycopeptide_output_file, threads) as glycopeptide_stream:
+        counts = write_record_chunks(records, protease, missed_cleavages, glycosylation_type, glycans, charge_state,
+                                     peptide_max_length, RowWriter(glycopeptide_stream, glycopeptide_fields),
+                                     RowWriter(peptide_stream, peptide_fields), chunk_size, profiler=profiler, progress=progress,
+                                     fragment_charges=fragment_charges, isotopes=isotopes,
+                                     glycan_hydrophobicity=glycan_hydrophobicity)
+    if not counts["glycopeptides"]:
+        print("No glycopeptides found; skipping Ion Series computation.")
+    if progress:
+        progress.emit(final=True)
+
+    # Log the completion of the glycopeptide processing
+    if log:
+        logging.info(f"Glycopeptide results written to {glycopeptide_output_file}. Processing complete.")
+    if verbose:
+        print(f"Processed {counts['glycopeptides']} glycopeptides for protease {protease}.")
+        print(f"Glycopeptide results written to {glycopeptide_output_file}. Processing complete.")
 
-        current_mass = peptide_mass  # Start with peptide only
-        y_series = {'Y0': round((current_mass + proton) / charge, 4)}
+    return {
+        "input_file": input_file,
+        "protease": protease,
+        "peptide_file": peptide_output_file,
+        "glycopeptide_file": glycopeptide_output_file,
+        **counts,
+    }
 
-        for i, sugar in enumerate(perm, start=1):
-            current_mass += monosaccharide_library[sugar]['mass']
-            y_series[f'Y{i}'] = round((current_mass + proton) / charge, 4)
+def stream_protease(input_file, protease, missed_cleavages, glycosylation_type, glycans, charge_state,
+                    peptide_max_length=25, output_file=None, output_format="csv", log=False, profiler=None, progress=None,
+                    fragment_charges=None, isotopes=None, glycan_hydrophobicity=None, threads=None):
+    """
+    Streams a FASTA file (or stdin with -i -) through one protease, writing the rows of every protein as soon as it
+    is processed. With -o - the glycopeptide rows are written to stdout as CSV or NDJSON and the peptide library is
+    not written, otherwise both libraries are written to their CSV files. Status messages go to stderr.
 
-        all_Y_ions[path_name] = y_series
+    Returns:
+        dict: Output files and row counts of the peptide and glycopeptide libraries.
+    """
+    input_name = "stdin" if input_file == "-" else input_file
+    peptide_output_file, default_output_file = library_output_files(input_name, protease, missed_cleavages, charge_state, glycosylation_type)
+    glycopeptide_output_file = output_file or default_output_file
+    extension = os.path.splitext(glycopeptide_output_file)[1].lower()
+    if glycopeptide_output_file == "-":
+        peptide_output_file = None
+    elif extension in compressed_extensions:
+        peptide_output_file += extension
+
+    print(f"Streaming {input_name} with protease {protease} and {missed_cleavages} missed cleavages...", file=sys.stderr)
+    if log:
+        logging.info(f"Streaming {input_name} with protease {protease} and {missed_cleavages} missed cleavages...")
+
+    profiler = profiler or null_profiler
+    if progress:
+        progress.start(input_file=input_name, protease=protease)
+    if hasattr(glycans, "to_dict"):
+        glycans = glycans.to_dict("records")
+
+    # Read the records incrementally from stdin or the FASTA file
+    input_stream = sys.stdin.buffer if input_file == "-" else open(input_file, "rb")
+    glycopeptide_stream = sys.stdout if glycopeptide_output_file == "-" else None
+    peptide_stream = None
+    try:
+        if glycopeptide_stream is None:
+            glycopeptide_stream = open_library_output(glycopeptide_output_file, threads)
+        if peptide_output_file:
+            peptide_stream = open_library_output(peptide_output_file, threads)
+
+        # Rows written to stdout are flushed per protein, files are left to their buffers
+        to_stdout = glycopeptide_stream is sys.stdout
+        glycopeptide_fields = glycopeptide_library_fields(charge_state, fragment_charges, isotopes, glycan_hydrophobicity is not None)
+        glycopeptide_writer = RowWriter(glycopeptide_stream, glycopeptide_fields,
+                                        output_format if to_stdout else "csv", flush=to_stdout)
+        peptide_writer = RowWriter(peptide_stream, peptide_fields) if peptide_stream else None
+        with profiler.stage("stream", protease):
+            counts = stream_record_rows(fasta_stream_records(input_stream), protease, missed_cleavages, glycosylation_type,
+                                        glycans, charge_state, peptide_max_length, glycopeptide_writer, peptide_writer, progress,
+                                        fragment_charges, isotopes, glycan_hydrophobicity)
+    finally:
+        if input_stream is not sys.stdin.buffer:
+            input_stream.close()
+        for stream in (peptide_stream, glycopeptide_stream):
+            if stream is not None and stream is not sys.stdout:
+                stream.close()
+    if progress:
+        progress.emit(final=True)
+
+    print(f"Streamed {counts['glycopeptides']} glycopeptides from {counts['proteins']} proteins for protease {protease}.", file=sys.stderr)
+    if log:
+        logging.info(f"Glycopeptide results written to {glycopeptide_output_file}. Processing complete.")
 
-    return all_Y_ions
+    return {
+        "input_file": input_name,
+        "protease": protease,
+        "peptide_file": peptide_output_file,
+        "glycopeptide_file": glycopeptide_output_file,
+        **counts,
+    }
 
 # Add this to the main function to set up logging
 def main():
@@ -636,67 +528,60 @@ def main():
     
     # Set up the argument parser
     parser = argparse.ArgumentParser(description="Glycopeptide Finder")
-    parser.add_argument("-i", "--input", required=True, help="Input FASTA file. Can be found in the test_proteomes folder.")
+    parser.add_argument("-i", "--input", required=True, help="Input FASTA file, plain or compressed (gzip, bzip2 or xz). Can be found in the test_proteomes folder. Use '-' to stream from stdin.")
     parser.add_argument("-g", "--glycosylation", default="N", help="Glycosylation type (N, O, or C). Default is N. Large file sizes may result from selecting O or C.")
-    parser.add_argument("-o", "--output", help="Output CSV file prefix. Default output directory for files is 'digested_glycopeptide_library'.")
+    parser.add_argument("-o", "--output", help="Output CSV file prefix. Default output directory for files is 'digested_glycopeptide_library'. Use '-' to stream the glycopeptide rows to stdout.")
+    parser.add_argument("-f", "--format", default="csv", choices=output_formats, help="Format of the rows streamed to stdout with -o - (default: csv).")
     parser.add_argument("-p", "--protease", default="trypsin", help="Protease to use for cleavage ('all' for all proteases). Default is trypsin. Proteases: trypsin, chymotrypsin, glu-c, lys-c, arg-c, pepsin, asp-n, proteinase-k.")
     parser.add_argument("-c", "--missed_cleavages", type=int, default=0, help="Number of missed cleavages allowed. Default is 0.")
     parser.add_argument("-m", "--peptide_max_length", type=int, default=25, help="Max peptide length from digestion(default is 25).")
     parser.add_argument("-y", "--glycan", default=None, help="Path to glycan file (CSV). Default is 'default_glycan_library.csv'.")
     parser.add_argument("-l", "--log", help="Provide log file name. (suggestion: -l log.txt)")
+    parser.add_argument("--log_level", default="INFO", choices=["INFO", "DEBUG"], help="Log level (default: INFO). DEBUG also logs every protein and its full peptide list.")
+    parser.add_argument("--metrics", help="JSON lines file for the throughput metrics (default: the log file when -l is given).")
+    parser.add_argument("--metrics_interval", type=float, default=10.0, help="Seconds between throughput metrics lines (default: 10).")
     parser.add_argument("-v", "--verbose", action="store_true", help="Print verbose output.")
     parser.add_argument("-z", "--charge", type=int, default=3, help="Maximum charge state (default: 3).")
+    parser.add_argument("--isotopes", type=int, metavar="N", help="Number of most abundant isotope peaks of every glycopeptide, with m/z values for charges 2 to -z, written to the Isotopes column (default: off).")
+    parser.add_argument("--glycan_hf", help="Glycan hydrophobicity table (CSV, e.g. compute_glycan_hydrophobicity.py output). HF_experimental and the scaled retention time rt_HF_experimental of every glycopeptide are computed from its Scaled_HF values right after the glycan cross product (default: off).")
+    parser.add_argument("--chunk_size", type=int, default=10000, help="Glycopeptide rows digested and written at a time, memory stays constant (default: 10000).")
+    parser.add_argument("--threads", type=int, help="Compression threads for -o files ending in .gz or .zst (default: all cores).")
+    parser.add_argument("--fragment_charges", nargs=2, type=int, metavar=("MIN", "MAX"), help="Fragment ion charge range. The fragment ions of every charge are computed in one pass and written to the FragmentIons column (default: off, IonSeries only).")
+    parser.add_argument("--profile", nargs="?", const="stages", choices=["stages", "cprofile"], help="Record wall time, CPU time and peak resident memory per stage and protease ('cprofile' also runs cProfile). The report is written next to the outputs.")
+    parser.add_argument("--profile_memory", action="store_true", help="With --profile, also trace the peak memory allocated in every stage with tracemalloc (slows down and inflates the stage times).")
 
     # Parse arguments
     args = parser.parse_args()
+    fragment_charges = None
+    if args.fragment_charges:
+        if args.fragment_charges[0] < 1 or args.fragment_charges[1] < args.fragment_charges[0]:
+            parser.error("--fragment_charges needs 1 <= MIN <= MAX.")
+        fragment_charges = tuple(range(args.fragment_charges[0], args.fragment_charges[1] + 1))
 
     # Set up logging if log file is provided
     if args.log:
-        setup_logging(args.log)
-
-    # Process the input file
-    input_file = args.input
-    base_filename = input_file.rsplit(".", 1)[0]
-    missed_cleavages = args.missed_cleavages
-    peptide_max_length = args.peptide_max_length
-    glycosylation_type = args.glycosylation
-    charge_state = args.charge
-    glycan_library = args.glycan
-
-    # Set default glycan library based on glycosylation type only if no glycan library is provided
-    if glycan_library is None:
-        if glycosylation_type == "N":
-            default_glycan_library = default_n_glycan_library
-        elif glycosylation_type == "O":
-            default_glycan_library = default_o_glycan_library
-        elif glycosylation_type == "C":
-            default_glycan_library = default_c_glycan_library
-        else:
-            if args.log:
-                logging.error(f"Glycosylation type {glycosylation_type} is not supported. Supported glycosylation types: N, O, C.")
-            return
-    else:
-        default_glycan_library = None
+        setup_logging(args.log, args.log_level)
 
-    # Load glycan library
-    if glycan_library is None:
-        glycans = default_glycan_library
-    else:
-        glycans = pd.read_csv(glycan_library)
+    # Set up the throughput metrics (proteins/s, peptides/s, glycopeptides/s and rows written)
+    if args.metrics:
+        setup_metrics(args.metrics)
+    progress = ProgressMeter(args.metrics_interval) if (args.log or args.metrics) else None
 
-    # Ensure the output directory exists (digested_glycopeptide_library)
-    output_dir = "digested_glycopeptide_library"
-    os.makedirs(output_dir, exist_ok=True)
-
-    # Ensure the output directory exists (digested_peptide_library)
-    peptide_output_dir = "digested_peptide_library"
-    os.makedirs(peptide_output_dir, exist_ok=True)
-
-    # Extract the base filename without any directory path
-    base_filename = os.path.basename(base_filename)
+    # Load glycan library, the default library for the glycosylation type is used if no glycan file is provided
+    try:
+        glycans = load_glycan_records(args.glycosylation, args.glycan)
+    except ValueError as error:
+        if args.log:
+            logging.error(str(error))
+        return
 
-    # Process the input file with the selected protease(s)
-    all_results = []
+    # Load the glycan hydrophobicity table for HF_experimental
+    glycan_hydrophobicity = None
+    if args.glycan_hf:
+        try:
+            glycan_hydrophobicity = load_glycan_hydrophobicity(args.glycan_hf)
+        except ValueError as error:
+            parser.error(str(error))
 
     # If "all" is selected, process all proteases
     if args.protease.lower() == "all":
@@ -708,140 +593,62 @@ def main():
             logging.error(f"Protease {args.protease} is not supported. Supported proteases: {', '.join(proteases.keys())}")
         return
 
-    # WORKFLOW STARTS HERE
-
-    # Process the input file with the selected protease(s)
-    for protease in selected_proteases:
-        
-        # Log the start of the process
-        print(f"Processing {input_file} with protease {protease} and {missed_cleavages} missed cleavages...")
-        if args.log:
-            logging.info(f"Processing {input_file} with protease {protease} and {missed_cleavages} missed cleavages...")
-        
-        # Process the input file and return pandas DataFrame
-        results_df = process_fasta(input_file, protease, missed_cleavages, glycosylation_type)
-        #print(results_df)
-
-        # Flatten results_df to extract peptides
-        digest_peptide_library = pd.DataFrame([pep for sublist in results_df["Peptides"].tolist() for pep in sublist])
-        
-        # Set name of first column to "Peptide"
-        digest_peptide_library.columns = ["Peptide"]
-
-        # Add other columns to the DataFrame
-        digest_peptide_library["ProteinID"] = results_df["ProteinID"].tolist()[0]
-
-        # Remove duplicate peptide entries in digest_peptide_library (No, Proteomic Parsimony)
-        #digest_peptide_library = digest_peptide_library.drop_duplicates(subset=["Peptide"])
-
-        # Remove empty peptide entries in digest_peptide_library
-        digest_peptide_library = digest_peptide_library[digest_peptide_library["Peptide"].str.strip().astype(bool)]
-
-        # Compute peptide mass, hydrophobicity, pI, and m/z values per row
-        digest_peptide_library["PredictedMass"] = digest_peptide_library["Peptide"].apply(calculate_peptide_mass)
-        digest_peptide_library["Hydrophobicity"] = digest_peptide_library["Peptide"].apply(predict_hydrophobicity)
-        digest_peptide_library["pI"] = digest_peptide_library["Peptide"].apply(calculate_pI)
-        digest_peptide_library["PredictedMass"] = pd.to_numeric(digest_peptide_library["PredictedMass"], errors='coerce')
-        digest_peptide_library = digest_peptide_library.dropna(subset=["PredictedMass"])
-        #digest_peptide_library["z1"] = digest_peptide_library["PredictedMass"].apply(lambda mass: compute_mz(mass, 1)) # charge state = 1
-
-        # Write results_df to a CSV file in peptide_library folder
-        digest_peptide_library.to_csv(f"{peptide_output_dir}/{base_filename}_{protease}_digested_mc{missed_cleavages}_peptides.csv", index=False)
-
-        # Extract the protein sequence
-        all_glycopeptides = []
-        for _, row in results_df.iterrows():
-            protein_id = row["ProteinID"]
-            sequence = row["Sequence"]
-
-            # Find glycopeptides
-            x_glycopeptides = find_glycopeptides(pd.DataFrame([row]), glycosylation_type)
-            
-            # Process each glycopeptide
-            for peptide, site in x_glycopeptides:
-                mass = calculate_peptide_mass(peptide)
-                hydrophobicity = predict_hydrophobicity(peptide)
-                pI = calculate_pI(peptide)
-                start_pos = sequence.find(peptide) + 1  # 1-based indexing
-                end_pos = start_pos + len(peptide) - 1
-                all_glycopeptides.append({
-                    "ProteinID": protein_id,
-                    "Site": int(site),
-                    "Peptide": peptide,
-                    "Start": int(start_pos),
-                    "End": int(end_pos),
-                    "Length": len(peptide),
-                    "Sequon": sequence[site - 1:site + 2], # Extract the sequon amino acid sequence + 1 flanking residue
-                    "PredictedMass": mass,
-                    "Hydrophobicity": hydrophobicity,
-                    "pI": pI,
-
-                })
-        
-        # List to pandas dataframe
-        all_glycopeptides = pd.DataFrame(all_glycopeptides)
-        
-        # Now apply filtering (peptide length less than 50 or set as desired. maybe by users. this saves room too data wise.)
-        # Filter out peptides with length greater than the specified maximum length (-m flag)
-        if not all_glycopeptides.empty and 'Peptide' in all_glycopeptides.columns:
-            all_glycopeptides = all_glycopeptides.loc[all_glycopeptides['Peptide'].str.len() <= peptide_max_length]
-        else:
-            print("No glycopeptides found; skipping peptide length filtering.")
-
-        # Concatenate the results to the main DataFrame
-        results_df = pd.concat([results_df, pd.DataFrame(all_glycopeptides)], ignore_index=True)
-
-        # Log the completion of the process
-        all_results.extend(results_df.to_dict(orient='records'))
-        if args.verbose:
-            print(f"Processed {len(results_df)} peptides for protease {protease}.")
-        
-        # Write the results to a new CSV file
-        output_file = args.output or f"{output_dir}/{base_filename}_{protease}_digested_mc{missed_cleavages}_z{charge_state}_{glycosylation_type}-glycopeptides.csv"
-        
-        # Filter out unwanted fields before writing to CSV
-        filtered_results = [{k: v for k, v in result.items() if k in ["ProteinID", "Site", "Peptide", "Start", "End", "Length", "Sequon", "PredictedMass", "Hydrophobicity", "pI"]} for result in all_results]
-        
-        # write results
-        write_csv(output_file, filtered_results)
-
-        # Log the completion of the process
-        if args.log:
-            logging.info(f"Results written to {output_file}. Processing complete.")
-        if args.verbose:
-            print(f"Results written to {output_file}. Processing complete.")
-
-        # Set the output file for glycopeptides
-        glycopeptide_output_file = output_file
-
-        # Log the start of the glycopeptide processing
-        if args.log:
-            logging.info(f"Generating glycopeptides and computing m/z values with range of +2 to +{args.charge} charge states using {args.glycan} glycan library.")
-        if args.verbose:
-            print(f"Generating glycopeptides and computing m/z values with range of +2 to +{args.charge} charge states using {args.glycan} glycan library.")
-
-        # Process glycopeptides and compute m/z values
-        glycopeptide_results = process_glycopeptides(output_file, glycans, charge_state)
-
-        # Add charge_state from input columns to the DataFrame
-        glycopeptide_results["Charge"] = charge_state
+    # Streams are read once, so streaming supports a single protease
+    if (args.input == "-" or args.output == "-") and len(selected_proteases) > 1:
+        print("Streaming with -i - or -o - supports a single protease, not 'all'.", file=sys.stderr)
+        return
 
-        # Compute IonSeries for glycopeptides
-        if not glycopeptide_results.empty:
-            glycopeptide_results["IonSeries"] = glycopeptide_results.apply(lambda row: calculate_n_glycopeptide_ions(row["Peptide"], row["Composition"], charge=1), axis=1)
-        else:
-            print("No glycopeptides found; skipping Ion Series computation.")
+    # Set up the stage profiler (and cProfile) if profiling is requested
+    profiler = StageProfiler(trace_memory=args.profile_memory) if args.profile else null_profiler
+    cprofiler = cProfile.Profile() if args.profile == "cprofile" else None
+    if cprofiler:
+        cprofiler.enable()
 
-        # Write the results to a new CSV file
-        glycopeptide_results.to_csv(glycopeptide_output_file, index=False)
-        #print(glycopeptide_results)
-        #print(f"Glycopeptide results written to {glycopeptide_output_file}. Processing complete.")
+    # WORKFLOW STARTS HERE
 
-        # Log the completion of the glycopeptide processing
-        if args.log:
-            logging.info(f"Glycopeptide results written to {glycopeptide_output_file}. Processing complete.")
-        if args.verbose:
-            print(f"Glycopeptide results written to {glycopeptide_output_file}. Processing complete.")
+    # Stream stdin (-i -) or to stdout (-o -) one protein at a time, otherwise process the input file with the selected protease(s)
+    run_results = []
+    if args.input == "-" or args.output == "-":
+        try:
+            run_results.append(stream_protease(args.input, selected_proteases[0], args.missed_cleavages, args.glycosylation, glycans,
+                                               args.charge, peptide_max_length=args.peptide_max_length, output_file=args.output,
+                                               output_format=args.format, log=bool(args.log), profiler=profiler, progress=progress,
+                                               fragment_charges=fragment_charges, isotopes=args.isotopes,
+                                               glycan_hydrophobicity=glycan_hydrophobicity, threads=args.threads))
+        except BrokenPipeError:
+            # The reader of stdout went away (e.g. head), stop quietly
+            sys.stdout = open(os.devnull, "w")
+            return
+    else:
+        # A single protease reads the FASTA file as it is digested, several proteases share the records read once
+        records = None
+        if len(selected_proteases) > 1:
+            with profiler.stage("fasta_parse"):
+                records = list(read_fasta_records(args.input))
+        for protease in selected_proteases:
+            run_results.append(run_protease(args.input, protease, args.missed_cleavages, args.glycosylation, glycans, args.charge,
+                                            peptide_max_length=args.peptide_max_length, output_file=args.output,
+                                            verbose=args.verbose, log=bool(args.log), profiler=profiler, progress=progress,
+                                            fragment_charges=fragment_charges, isotopes=args.isotopes,
+                                            glycan_hydrophobicity=glycan_hydrophobicity, chunk_size=args.chunk_size,
+                                            threads=args.threads, records=records))
+
+    # Write the profile report next to the glycopeptide library
+    if args.profile:
+        cprofile_stats = None
+        input_name = "stdin" if args.input == "-" else args.input
+        report_dir = "" if run_results[-1]["glycopeptide_file"] == "-" else os.path.dirname(run_results[-1]["glycopeptide_file"])
+        if input_name.endswith(compressed_fasta_extensions):
+            input_name = input_name.rsplit(".", 1)[0]
+        report_base = os.path.join(report_dir, os.path.basename(input_name.rsplit(".", 1)[0]))
+        if cprofiler:
+            cprofiler.disable()
+            cprofile_stats = pstats.Stats(cprofiler)
+            cprofile_stats.dump_stats(f"{report_base}_profile.prof")
+        metadata = {"input_file": args.input, "proteases": selected_proteases, "missed_cleavages": args.missed_cleavages,
+                    "glycosylation_type": args.glycosylation, "charge": args.charge, "glycans": len(glycans), "runs": run_results}
+        profiler.write_report(f"{report_base}_profile.json", metadata, cprofile_stats)
+        print(f"Profile report written to {report_base}_profile.json", file=sys.stderr if args.output == "-" else sys.stdout)
 
 # main function
 if __name__ == "__main__":
@@ -0,0 +1,1674 @@
+"""
+glycopeptide_sequence_finder_core.py
+
+Dependency-light core of the glycopeptide sequence finder: protease, sequon and mass constants, FASTA reading, protease
+digestion, sequon search, peptide mass/hydrophobicity/pI, glycan combination, ion series and CSV writing. It only uses
+the standard library, so scripts and worker processes that digest proteins do not pay the pandas import cost.
+glycopeptide_sequence_finder_cmd.py re-exports these names and adds the pandas DataFrame interface.
+
+Author:
+    Richard Shipman -- 2025
+"""
+from collections import deque
+import csv
+from contextlib import nullcontext
+from functools import lru_cache
+import io
+from itertools import islice, product
+import json
+import logging
+from math import factorial
+import mmap
+import os
+import queue
+import re
+import threading
+from typing import NamedTuple
+
+logger = logging.getLogger(__name__)
+
+# Constants
+
+# Define protease cleavage rules
+proteases = {
+    "trypsin": ("[KR]", "P"),  # Cleaves after K or R unless followed by P
+    "chymotrypsin": ("[FWY]", "P"),  # Cleaves after F, W, or Y unless followed by P
+    "glu-c": ("E", None),  # Cleaves after E
+    "lys-c": ("K", None),  # Cleaves after K
+    "arg-c": ("R", None),  # Cleaves after R
+    "pepsin": ("[FLWY]", None),  # Cleaves after F, W, or Y
+    "asp-n": ("D", None),  # Cleaves **before** Asp (D)
+    "proteinase-k": ("[AFILVWY]", None),  # Cleaves after A, F, I, L, V, W, Y
+}
+
+# Define glycosylation sequon rules
+glycosylation = {
+    "N": ("N[^P][STC]"),  # N-glycosylation sequon - N-X-S/T/C (X is any amino acid except P).
+    "O": ("[ST]"),  # O-glycosylation sequon - S/T  (experimental! Creates large number of O-glycopeptides.)
+    "C": ("W..[WCF]")  # C-glycosylation sequon - W-X-X-W, W-X-X-C, or W-X-X-F (X is any amino acid).
+}
+
+# Define amino acid mass values for calculating peptide mass
+amino_acid_masses = {
+    'A': 71.03711, 'R': 156.10111, 'N': 114.04293, 'D': 115.02694, 'C': 103.00919,
+    'Q': 128.05858, 'E': 129.04259, 'G': 57.02146, 'H': 137.05891, 'I': 113.08406,
+    'L': 113.08406, 'K': 128.09496, 'M': 131.04049, 'F': 147.06841, 'P': 97.05276,
+    'S': 87.03203, 'T': 101.04768, 'W': 186.07931, 'Y': 163.06333, 'V': 99.06841
+}
+
+# Elemental formulas of the amino acid residues (amino_acid_masses), used for isotope envelopes
+amino_acid_formulas = {
+    'A': "C3H5NO", 'R': "C6H12N4O", 'N': "C4H6N2O2", 'D': "C4H5NO3", 'C': "C3H5NOS",
+    'Q': "C5H8N2O2", 'E': "C5H7NO3", 'G': "C2H3NO", 'H': "C6H7N3O", 'I': "C6H11NO",
+    'L': "C6H11NO", 'K': "C6H12N2O", 'M': "C5H9NOS", 'F': "C9H9NO", 'P': "C5H7NO",
+    'S': "C3H5NO2", 'T': "C4H7NO2", 'W': "C11H10N2O", 'Y': "C9H9NO2", 'V': "C5H9NO"
+}
+
+# Kyte-Doolittle hydrophobicity values for amino acids
+hydrophobicity_values = {
+    'A': 1.8, 'R': -4.5, 'N': -3.5, 'D': -3.5, 'C': 2.5,
+    'Q': -3.5, 'E': -3.5, 'G': -0.4, 'H': -3.2, 'I': 4.5,
+    'L': 3.8, 'K': -3.9, 'M': 1.9, 'F': 2.8, 'P': -1.6,
+    'S': -0.8, 'T': -0.7, 'W': -0.9, 'Y': -1.3, 'V': 4.2
+}
+
+# Define amino acid pKa values for calculating pI (placeholder)
+pKa_values = {
+    'C': 8.18, 'D': 3.65, 'E': 4.25, 'H': 6.00, 'K': 10.53,
+    'R': 12.48, 'Y': 10.07, 'N': 3.22, 'Q': 3.22, 'S': 3.70,
+    'T': 3.70, 'W': 10.07
+}
+
+# Define default N-glycan mass library (N-Glycans) Using most common N-glycans as default, HexNAc(2)Hex(8) with no stereochemistry
+default_n_glycans = [
+    #{"glytoucan_ac": "G59324HL", "byonic": "HexNAc(2)Hex(12) % 2350.792627", "composition": "HexNAc(2)Hex(12)", "mass": 2350.792627, "shorthand_glycan": "N2H12"}, # N2H12
+    #{"glytoucan_ac": "G58087IP", "byonic": "HexNAc(2)Hex(11) % 2188.739804", "composition": "HexNAc(2)Hex(11)", "mass": 2188.739804, "shorthand_glycan": "N2H11"}, # N2H11
+    #{"glytoucan_ac": "G83460ZZ", "byonic": "HexNAc(2)Hex(10) % 2026.686980", "composition": "HexNAc(2)Hex(10)", "mass": 2026.686980, "shorthand_glycan": "N2H10"}, # N2H10
+    #{"glytoucan_ac": "G80920RR", "byonic": "HexNAc(2)Hex(9) % 1864.634157", "composition": "HexNAc(2)Hex(9)", "mass": 1864.634157, "shorthand_glycan": "N2H9"}, # N2H9
+    #{"glytoucan_ac": "G62765YT", "byonic": "HexNAc(2)Hex(8) % 1702.581333", "composition": "HexNAc(2)Hex(8)", "mass": 1702.581333, "shorthand_glycan": "N2H8"}, # N2H8 -- High Mannose
+    #{"glytoucan_ac": "G31852PQ", "byonic": "HexNAc(2)Hex(7) % 1540.528510", "composition": "HexNAc(2)Hex(7)", "mass": 1540.528510, "shorthand_glycan": "N2H7"}, # N2H7
+    #{"glytoucan_ac": "G41247ZX", "byonic": "HexNAc(2)Hex(6) % 1378.475686", "composition": "HexNAc(2)Hex(6)", "mass": 1378.475686, "shorthand_glycan": "N2H6"}, # N2H6
+    {"glytoucan_ac": "G22768VO", "byonic": "HexNAc(2)Hex(3) % 892.317215", "composition": "HexNAc(2)Hex(3)", "mass": 892.317215, "shorthand_glycan": "N2H3"}, # N2H3
+    #{"glytoucan_ac": "G36670VW", "byonic": "HexNAc(5)Hex(5)dHex(1)NeuAc(2) % 2553.909723", "composition": "HexNAc(5)Hex(5)dHex(1)NeuAc(2)", "mass": 2553.909723, "shorthand_glycan": "N5H5F1S2"}  # N5H5F1S2 -- # Complex - Fucosylation, Sialylated
+    #{"glytoucan_ac": "G29068FM", "byonic": "HexNAc(1) % 221.089937305", "composition": "HexNAc(1)", "mass": 221.089937305, "shorthand_glycan": "N1"}, # N1 -- EndoH Treatment HexNAc
+    #{"glytoucan_ac": "G04038LG", "byonic": "HexNAc(1)dHex(1) % 367.147846175", "composition": "HexNAc(1)dHex(1)", "mass": 367.147846175, "shorthand_glycan": "N1F1"}, # N1F1 -- EndoH Treatment HexNAc (Fuc-Core)
+]
+
+# Define default O-glycan mass library (O-GalNAc Glycans) Using most common O-glycans as default, HexNac(1) with no stereochemistry
+default_o_glycans = [
+    {"glytoucan_ac": "G14843DJ", "byonic": "HexNAc(1) % 221.089937305", "composition": "HexNAc(1)", "mass": 221.089937305, "shorthand_glycan": "N1"}, # N1
+]
+
+# Define default C-glycan mass library (C-Mannosylation) Using most common C-glycans as default, Hex(1) with no stereochemistry
+default_c_glycans = [
+    {"glytoucan_ac": "G81399MY", "byonic": "Hex(1) % 180.0633882", "composition": "Hex(1)", "mass": 180.0633882, "shorthand_glycan": "H1"}, # H1
+]
+
+# Define monosaccharide mass library with multiple properties (later use)
+monosaccharide_library = {
+    "Hex": {"mass": 162.0528, "formula": "C6H10O5", "symbol": "H"},
+    "HexA": {"mass": 176.0321, "formula": "C6H8O6", "symbol": "Ha"},
+    "HexNAc": {"mass": 203.0794, "formula": "C8H13NO5", "symbol": "N"},
+    "Fuc": {"mass": 146.0579, "formula": "C6H10O4", "symbol": "F"},
+    "dHex": {"mass": 146.0579, "formula": "C6H10O4", "symbol": "dH"},
+    "NeuAc": {"mass": 291.0954, "formula": "C11H17NO8", "symbol": "S"},
+    "NeuGc": {"mass": 307.0903, "formula": "C11H17NO9", "symbol": "G"},
+    "Xyl": {"mass": 150.0423, "formula": "C5H10O5", "symbol": "X"},
+    "Pent": {"mass": 132.0423, "formula": "C5H8O4", "symbol": "P"},
+    "Sulpho": {"mass": 79.9568, "formula": "SO3", "symbol": "Su"},
+    "Phospho": {"mass": 79.9663, "formula": "HPO3", "symbol": "Ph"},
+    "Methyl": {"mass": 14.0157, "formula": "CH2", "symbol": "Me"},
+    "Acetyl": {"mass": 42.0106, "formula": "C2H2O", "symbol": "Ac"},
+    "Deoxy": {"mass": -18.0106, "formula": "-H2O", "symbol": "d"},
+    "Amine": {"mass": 1.0078, "formula": "H", "symbol": "NH2"}
+}
+
+# Define hydrophobicity values for glycan library (experimental) 
+# (between -1 and 1) in relation to the peptide backbone and rank spread of glycopeptides with the same backdone.
+# compute_glycan_hydrophobicity.py script will be used to calculate the hydrophobicity values.
+# averaged aggregated from human and mouse datasets
+default_glycan_hydrophobicity = {
+    "N2H8": -0.0062899,
+    "N2H7": -0.005723031,
+    "N2H6": -0.004347122,
+    "N2H9": -0.001982055,
+    "N2H10": -0.001554309,
+    "N2H11": -2.53305E-05,
+    "N2H12": 5.36847E-06
+}
+
+# Fields of the digested protein rows (and the DataFrame returned by process_fasta)
+protein_fields = ["ProteinID", "Peptides", "Sequence", "Protease", "MissedCleavages", "GlycosylationType",
+                  "Species", "TaxonID", "GeneName", "ProteinEvidence", "SequenceVersion"]
+
+# Fields written to the glycopeptide (peptide backbone) library
+glycopeptide_fields = ["ProteinID", "Site", "Peptide", "Start", "End", "Length", "Sequon", "PredictedMass", "Hydrophobicity", "pI"]
+
+# Fields written to the peptide library
+peptide_fields = ["Peptide", "ProteinID", "PredictedMass", "Hydrophobicity", "pI"]
+
+# Functions
+
+def cleave_sequence(sequence, protease, missed_cleavages=0):
+    """Cleaves a sequence based on protease rules."""
+    cleavage_pattern, exclusion = proteases[protease.lower()]
+
+    # Handle Asp-N separately because it cleaves **before** D
+    if protease.lower() == "asp-n":
+        regex = rf"(?={cleavage_pattern})"  # Cleaves before D
+    else:
+        regex = rf"(?<={cleavage_pattern})(?!{exclusion})"  # Cleaves after other residues
+
+    # Perform cleavage
+    fragments = re.split(regex, sequence)
+
+    # Generate peptides including missed cleavages
+    peptides = []
+    for i in range(len(fragments)):
+        for j in range(i + 1, min(i + 2 + missed_cleavages, len(fragments) + 1)):
+            peptides.append("".join(fragments[i:j]))
+
+    return peptides
+
+def calculate_peptide_mass(sequence):
+    """Calculates the mass of a peptide using predefined amino acid masses."""
+    
+    # Common ambiguous residues
+    invalid_residues = {"X", "B", "Z", "J", "U", "O"}  
+    if any(aa in invalid_residues for aa in sequence):
+        return "Unknown"  # Or return unknown if you prefer
+    
+    # water
+    water  = 18.010565
+
+    # Calculate the mass using the amino_acid_masses dictionary
+    mass = sum(amino_acid_masses.get(aa, 0) for aa in sequence) + water
+    return mass
+
+def predict_hydrophobicity(peptide_sequence):
+    """Predicts the hydrophobicity of a peptide sequence using the Kyte-Doolittle scale."""
+    
+    # safety check for empty peptide strings
+    if len(peptide_sequence) == 0:
+        return 0.0
+
+    # Calculate the average hydrophobicity of the peptide
+    total_hydrophobicity = sum(hydrophobicity_values.get(aa, 0) for aa in peptide_sequence)
+    average_hydrophobicity = round(total_hydrophobicity / len(peptide_sequence), 5)
+
+    return average_hydrophobicity
+
+def calculate_pI(peptide_sequence):
+    """
+    Calculate the isoelectric point (pI) of a peptide sequence.
+    
+    Parameters:
+        peptide (str): Peptide sequence (1-letter amino acid codes)
+    
+    Returns:
+        float: Estimated isoelectric point (pI)
+    """
+    # peptide sequence to string
+    peptide_sequence = str(peptide_sequence)
+
+    # Terminal group pKa values (assuming N-term = 9.6, C-term = 2.3)
+    N_term_pKa = 9.6
+    C_term_pKa = 2.3
+
+    # Count occurrences of ionizable residues
+    residue_counts = {aa: peptide_sequence.count(aa) for aa in pKa_values}
+    
+    # Function to calculate charge at a given pH
+    def calculate_net_charge(pH):
+        charge = 0.0
+
+        # N-terminal charge
+        charge += 1 / (1 + 10**(pH - N_term_pKa))
+
+        # C-terminal charge
+        charge -= 1 / (1 + 10**(C_term_pKa - pH))
+
+        # Side chain charges
+        for aa, count in residue_counts.items():
+            if count > 0:
+                pKa = pKa_values[aa]
+                if aa in ['D', 'E', 'Y', 'C']:  # Acidic side chains
+                    charge -= count / (1 + 10**(pKa - pH))
+                elif aa in ['H', 'K', 'R']:  # Basic side chains
+                    charge += count / (1 + 10**(pH - pKa))
+        
+        return charge
+
+    # Use bisection method to find the pH where net charge is closest to zero
+    low, high = 0.0, 14.0
+    while high - low > 0.01:  # Precision threshold
+        mid = (low + high) / 2
+        net_charge = calculate_net_charge(mid)
+        if net_charge > 0:
+            low = mid
+        else:
+            high = mid
+
+    return round((low + high) / 2, 2)
+
+def compute_mz(mass, charge):
+    """Compute m/z value for a given mass and charge state."""
+    proton = 1.007276
+    return (mass + (charge * proton)) / charge
+
+# experimental glycopeptide hydrophobicity calculation
+def compute_hf_experimental(peptide_hydrophobicity, glycan, hf_weight=10, rt_scale=60, glycan_hydrophobicities=None):
+    """
+    Compute HF_experimental and scaled retention time (rt_HF_experimental) values. The glycan HF is looked up in
+    glycan_hydrophobicities (default: default_glycan_hydrophobicity).
+    """
+    if glycan_hydrophobicities is None:
+        glycan_hydrophobicities = default_glycan_hydrophobicity
+    glycan_hydrophobicity = glycan_hydrophobicities.get(glycan, None)
+    if glycan_hydrophobicity is None:
+        return "", ""
+
+    # Compute HF_experimental and scaled retention time (rt_HF_experimental) values
+    glycan_term, rt_hf_experimental = glycan_hf_terms(glycan_hydrophobicity, hf_weight, rt_scale)
+    return round(peptide_hydrophobicity + glycan_term, 5), rt_hf_experimental
+
+def glycan_hf_terms(glycan_hydrophobicity, hf_weight=10, rt_scale=60):
+    """
+    Returns the glycan part of HF_experimental (the weighted glycan HF added to the peptide hydrophobicity) and the
+    scaled retention time rt_HF_experimental, which only depends on the glycan.
+    """
+    glycan_term = glycan_hydrophobicity * hf_weight
+    return glycan_term, (glycan_term + 1) * (rt_scale / 2)
+
+# Glycan name columns of glycan hydrophobicity tables (compute_glycan_hydrophobicity.py output and HF libraries)
+glycan_hydrophobicity_keys = ("Glycans", "shorthand_glycan", "longhand_glycan", "composition")
+
+def load_glycan_hydrophobicity(glycan_hf_file, column="Scaled_HF"):
+    """
+    Loads a glycan hydrophobicity table as a {glycan: HF} dict like default_glycan_hydrophobicity, keyed by every
+    glycan name column of the table. Glycans listed more than once (e.g. per sample matrix) get their mean HF.
+    """
+    sums = {}
+    with open(glycan_hf_file, newline="", encoding="utf-8-sig") as f:
+        reader = csv.DictReader(f)
+        keys = [key for key in glycan_hydrophobicity_keys if key in (reader.fieldnames or [])]
+        if column not in (reader.fieldnames or []) or not keys:
+            raise ValueError(f"Glycan hydrophobicity file {glycan_hf_file} needs a {column} column and a glycan column "
+                             f"({', '.join(glycan_hydrophobicity_keys)}).")
+        for row in reader:
+            if row[column] in ("", None):
+                continue
+            for name in {row[key] for key in keys if row[key]}:
+                total, count = sums.get(name, (0.0, 0))
+                sums[name] = (total + float(row[column]), count + 1)
+    return {name: total / count for name, (total, count) in sums.items()}
+
+def parse_composition(glycan_composition):
+    """Parses a glycan composition string like "HexNAc(2)Hex(3)" into a {monosaccharide: count} dict in string order."""
+    glycan_dict = {}
+    for part in glycan_composition.split(')'):
+        if part:
+            sugar, count = part.split('(')
+            glycan_dict[sugar] = int(count)
+    return glycan_dict
+
+# Experimental Work in Progress for N-Glycans
+# Function to Calculate glycopeptide ion series m/z values  
+def calculate_n_glycopeptide_ions(peptide, glycan_composition, glycan_frag_order=None, charge=1):
+    """
+    Calculate theoretical m/z values for b, y, c, z, Y, B, and oxonium ions for an N-glycopeptide.
+
+    Parameters:
+      peptide (str): The peptide sequence (e.g., "NTSK").
+      glycan_composition (str or dict): A string like "HexNAc(5)Hex(5)dHex(1)NeuAc(2)", or its parse_composition dict.
+      glycan_frag_order (list, optional): A list specifying the sugar loss order.
+      charge (int): The charge state (default is 1).
+
+    Returns:
+      dict: A dictionary with keys for 'b', 'y', 'c', 'z', 'Y', 'B', and 'oxonium' ions and their m/z values.
+    """
+    return glycopeptide_ions(peptide, glycan_fragments(glycan_composition, glycan_frag_order, charge), charge)
+
+def glycan_fragments(glycan_composition, glycan_frag_order=None, charge=1):
+    """
+    Calculate the peptide-independent fragments of an N-glycan: the Y ion mass offsets (glycan mass attached to the
+    peptide for Y0, Y1, ...), the B ions and the oxonium ions. The table is computed once per glycan and combined with
+    each peptide by glycopeptide_ions.
+
+    Returns:
+      dict: 'Y' (list of mass offsets), 'B' and 'oxonium' (dicts of m/z values), 'B_masses' and 'oxonium_masses'
+      (lists of neutral masses, see glycopeptide_ion_table).
+    """
+    # Constants for ion calculations
+    proton = 1.007276
+
+    # Parse glycan composition into a dictionary (compiled glycan libraries pass the parsed composition)
+    glycan_dict = parse_composition(glycan_composition) if isinstance(glycan_composition, str) else glycan_composition
+
+    # --- Y ion offsets (glycan mass attached to the peptide) ---
+    Y_offsets = [0.0]  # Y0 = peptide only
+    current_mass = 0.0
+
+    # First, add HexNAc(1) and HexNAc(2) if available
+    if 'HexNAc' in glycan_dict and glycan_dict['HexNAc'] >= 1:
+        current_mass += monosaccharide_library['HexNAc']['mass']
+        Y_offsets.append(current_mass)
+
+    if 'HexNAc' in glycan_dict and glycan_dict['HexNAc'] >= 2:
+        current_mass += monosaccharide_library['HexNAc']['mass']
+        Y_offsets.append(current_mass)
+
+    # Add remaining glycan fragments
+    remaining_sugars = []
+    for sugar, count in glycan_dict.items():
+        if sugar == 'HexNAc':  # Skip first two already added
+            count -= 2
+        remaining_sugars.extend([sugar] * count)
+
+    # Follow glycan_frag_order if provided, otherwise use the default order
+    if glycan_frag_order:
+        ordered_sugars = glycan_frag_order
+    else:
+        ordered_sugars = remaining_sugars
+
+    # Sequentially add the remaining glycans
+    for sugar in ordered_sugars:
+        current_mass += monosaccharide_library[sugar]['mass']
+        Y_offsets.append(current_mass)
+
+    # --- Calculate B ions (glycan fragment ions) ---
+    B_ions = {}
+    B_masses = []  # Neutral B ion masses for other charge states
+    cumulative = 0.0
+
+    if glycan_frag_order:
+        # Separate HexNAc from other glycans
+        other_glycans = [sugar for sugar in glycan_frag_order if 'HexNAc' not in sugar]
+        hexnac_glycans = [sugar for sugar in glycan_frag_order if 'HexNAc' in sugar]
+
+        # Combine the orders so that HexNAc comes last
+        glycan_frag_order = other_glycans + hexnac_glycans
+
+        # Iterate through the reordered glycan list
+        for i, sugar in enumerate(glycan_frag_order, start=1):
+            cumulative += monosaccharide_library[sugar]['mass']
+            B_ions[f'B{i}'] = round((cumulative + proton) / charge, 4)
+            B_masses.append(cumulative)
+    else:
+        # If no glycan frag order is provided, handle the glycan composition
+        for sugar, count in glycan_dict.items():
+            for i in range(count):
+                cumulative += monosaccharide_library[sugar]['mass']
+                B_ions[f'B_{sugar}_{i+1}'] = round((cumulative + proton) / charge, 4)
+                B_masses.append(cumulative)
+
+    # --- Calculate Oxonium ions ---
+    oxonium_ions = {}
+    oxonium_masses = []
+    for sugar, count in glycan_dict.items():
+        if count > 0:
+            oxonium_ions[f'ox_{sugar}'] = round(monosaccharide_library[sugar]['mass'] + proton, 4)
+            oxonium_masses.append(monosaccharide_library[sugar]['mass'])
+
+    return {'Y': Y_offsets, 'B': B_ions, 'oxonium': oxonium_ions, 'B_masses': B_masses, 'oxonium_masses': oxonium_masses}
+
+def peptide_fragment_masses(peptide):
+    """
+    Calculate the neutral masses of a peptide used by its ion series, computed once for every glycan and charge.
+
+    Returns:
+      tuple: The peptide mass (including water), the N-terminal residue sums (b and c ions) and the C-terminal residue
+      sums (y and z ions).
+    """
+    water  = 18.010565
+
+    # Compute the neutral mass of the peptide (including water)
+    peptide_mass = sum(amino_acid_masses[aa] for aa in peptide) + water
+
+    # N-terminal residue sums
+    n_terminal = []
+    cumulative = 0.0
+    for i in range(len(peptide) - 1):
+        cumulative += amino_acid_masses[peptide[i]]
+        n_terminal.append(cumulative)
+
+    # C-terminal residue sums
+    c_terminal = []
+    cumulative = 0.0
+    for i in range(len(peptide) - 1, 0, -1):
+        cumulative += amino_acid_masses[peptide[i]]
+        c_terminal.append(cumulative)
+
+    return peptide_mass, n_terminal, c_terminal
+
+def peptide_ions(peptide_masses, charge=1):
+    """Calculate the b, y, c and z ions of peptide_fragment_masses, shared by the ion series of all its glycans."""
+    # Constants for ion calculations
+    proton = 1.007276
+    water  = 18.010565
+    NH3    = 17.0265  # mass of ammonia
+
+    peptide_mass, n_terminal, c_terminal = peptide_masses
+    return {
+        # --- Calculate b ions (CID) ---
+        'b': [round((cumulative + proton) / charge, 4) for cumulative in n_terminal],
+        # --- Calculate y ions (CID) ---
+        'y': [round((cumulative + water + proton) / charge, 4) for cumulative in c_terminal],
+        # --- Calculate c ions (ETD/ECD) ---
+        # c ions are the N-terminal fragments with an added NH3 group.
+        'c': [round((cumulative + NH3 + proton) / charge, 4) for cumulative in n_terminal],
+        # --- Calculate z ions (ETD/ECD) ---
+        # z ions are the complementary C-terminal fragments, the y ion mass minus water and NH3.
+        'z': [round((cumulative + proton - NH3) / charge, 4) for cumulative in c_terminal],
+    }
+
+def glycopeptide_ions(peptide, fragments, charge=1, peptide_masses=None, peptide_series=None):
+    """
+    Calculate the ion series of a peptide with a glycan fragment table (glycan_fragments of the same charge): the
+    b, y, c and z ions of the peptide (peptide_ions, computed here unless given), and the Y and 2Y ions as the peptide
+    mass plus the glycan Y offsets.
+
+    Returns:
+      dict: A dictionary with keys for 'b', 'y', 'c', 'z', 'Y', '2Y', 'B', and 'oxonium' ions and their m/z values.
+    """
+    proton = 1.007276
+
+    peptide_masses = peptide_masses or peptide_fragment_masses(peptide)
+    peptide_series = peptide_series or peptide_ions(peptide_masses, charge)
+
+    # --- Calculate Y ions (glycan-attached peptide fragments) and their 2+ ions from the glycan offsets ---
+    Y_masses = [peptide_masses[0] + offset + proton for offset in fragments['Y']]
+    Y_ions = {f'Y{i}': round(mass / charge, 4) for i, mass in enumerate(Y_masses)}
+    plus2Y_ions = {f'2Y{i}': round(mass / (charge * 2), 4) for i, mass in enumerate(Y_masses)}
+
+    # Return ion series in a dictionary
+    return {
+        'b': list(peptide_series['b']),
+        'y': list(peptide_series['y']),
+        'c': list(peptide_series['c']),
+        'z': list(peptide_series['z']),
+        'Y': dict(sorted(Y_ions.items(), key=lambda item: item[1])),  # Sorted by m/z
+        '2Y': dict(sorted(plus2Y_ions.items(), key=lambda item: item[1])),  # Sorted by m/z
+        'B': dict(fragments['B']),
+        'oxonium': dict(fragments['oxonium']),
+    }
+
+def charge_mz_table(masses, charges):
+    """Returns one list of m/z values per charge z of neutral fragment masses: (M + z * proton) / z, as compute_mz."""
+    proton = 1.007276
+    return [[round((mass + z * proton) / z, 4) for mass in masses] for z in charges]
+
+def peptide_neutral_ions(peptide_masses):
+    """Returns the neutral b, y, c and z ion masses of peptide_fragment_masses."""
+    water  = 18.010565
+    NH3    = 17.0265  # mass of ammonia
+    peptide_mass, n_terminal, c_terminal = peptide_masses
+    return {
+        'b': n_terminal,
+        'y': [cumulative + water for cumulative in c_terminal],
+        'c': [cumulative + NH3 for cumulative in n_terminal],
+        'z': [cumulative - NH3 for cumulative in c_terminal],
+    }
+
+def glycopeptide_ion_table(peptide, fragments, charges, peptide_masses=None):
+    """
+    Calculate the fragment ion m/z values of a glycopeptide for several fragment charge states in one pass. The neutral
+    fragment masses are computed once and every charge z adds z protons: m/z = (M + z * proton) / z, as compute_mz.
+    Charge 1 corresponds to the IonSeries.
+
+    Returns:
+      dict: 'charges' and, for the 'b', 'y', 'c', 'z', 'Y' (Y0, Y1, ...), 'B' and 'oxonium' ions, one list of m/z
+      values per charge, in the order of the IonSeries names.
+    """
+    peptide_masses = peptide_masses or peptide_fragment_masses(peptide)
+    neutral_masses = {
+        **peptide_neutral_ions(peptide_masses),
+        'Y': [peptide_masses[0] + offset for offset in fragments['Y']],
+        'B': fragments['B_masses'],
+        'oxonium': fragments['oxonium_masses'],
+    }
+    table = {'charges': list(charges)}
+    for ion_type, masses in neutral_masses.items():
+        table[ion_type] = charge_mz_table(masses, charges)
+    return table
+
+def json_members(table):
+    """Returns the members of a dict as compact JSON without the enclosing braces."""
+    return json.dumps(table, separators=(",", ":"))[1:-1]
+
+def glycan_sub_compositions(glycan_dict):
+    """
+    Enumerates the lattice of sub-compositions of a parsed glycan composition, from the empty glycan to the intact one.
+
+    Returns:
+      list: (counts, mass) pairs, counts is a tuple in the order of glycan_dict and mass is the sum of its residue masses.
+    """
+    sugars = list(glycan_dict)
+    sugar_masses = [monosaccharide_library[sugar]['mass'] for sugar in sugars]
+    sub_compositions = []
+    for counts in product(*(range(glycan_dict[sugar] + 1) for sugar in sugars)):
+        sub_compositions.append((counts, sum(count * mass for count, mass in zip(counts, sugar_masses))))
+    return sub_compositions
+
+## Experimental -- testing
+def generate_all_y_ions(peptide, glycan_composition, charge=1, path_counts=False):
+    """
+    Generate all possible Y ions considering every fragmentation path.
+
+    Every fragmentation path (order of monosaccharide losses) only passes through sub-compositions of the glycan, so
+    the distinct Y ions are the lattice of sub-compositions: prod(count + 1) ions rather than one series per unique
+    permutation, which grows factorially with the glycan size.
+
+    Parameters:
+      peptide (str): Peptide sequence (e.g., "NTSK").
+      glycan_composition (str or dict): Glycan composition string (e.g., "HexNAc(5)Hex(5)dHex(1)NeuAc(2)") or its parse_composition dict.
+      charge (int): The charge state (default is 1).
+      path_counts (bool): Also return the number of fragmentation paths through each Y ion.
+
+    Returns:
+      dict: Y ions sorted by m/z, keyed by the attached sub-composition ("Y0" for the peptide only). The values are the
+      m/z values, or (m/z, paths) tuples with path_counts.
+    """
+    # Constants
+    proton = 1.007276
+    water  = 18.010565
+
+    # Compute the neutral mass of the peptide
+    peptide_mass = sum(amino_acid_masses[aa] for aa in peptide) + water
+
+    # Parse glycan composition
+    glycan_dict = parse_composition(glycan_composition) if isinstance(glycan_composition, str) else glycan_composition
+    sugars = list(glycan_dict)
+    total = tuple(glycan_dict.values())
+
+    def orderings(counts):
+        # Number of distinct orders of a multiset of monosaccharides
+        paths = factorial(sum(counts))
+        for count in counts:
+            paths //= factorial(count)
+        return paths
+
+    # Compute the Y ion of every sub-composition
+    all_Y_ions = {}
+    for counts, glycan_mass in glycan_sub_compositions(glycan_dict):
+        name = "".join(f"{sugar}({count})" for sugar, count in zip(sugars, counts) if count) or "Y0"
+        mz = round((peptide_mass + glycan_mass + proton) / charge, 4)
+        if path_counts:
+            # Paths through a sub-composition: orders of the sugars lost before it times orders of those after it
+            remaining = tuple(full - count for full, count in zip(total, counts))
+            all_Y_ions[name] = (mz, orderings(counts) * orderings(remaining))
+        else:
+            all_Y_ions[name] = mz
+
+    return dict(sorted(all_Y_ions.items(), key=lambda item: item[1]))
+
+# Isotope envelopes
+
+# Natural isotopes (mass, abundance) of the elements of peptides and glycans, by nominal mass offset from the lightest
+element_isotopes = {
+    "C": [(12.0, 0.9893), (13.0033548, 0.0107)],
+    "H": [(1.00782503, 0.999885), (2.01410178, 0.000115)],
+    "N": [(14.003074, 0.99636), (15.0001089, 0.00364)],
+    "O": [(15.9949146, 0.99757), (16.9991317, 0.00038), (17.9991596, 0.00205)],
+    "S": [(31.9720707, 0.9499), (32.9714585, 0.0075), (33.9678669, 0.0425), (0.0, 0.0), (35.9670808, 0.0001)],
+    "P": [(30.9737615, 1.0)],
+}
+
+# Peaks kept in an isotope envelope, and the relative abundance below which tail peaks are pruned
+max_isotope_peaks = 16
+isotope_prune_threshold = 1e-6
+
+formula_pattern = re.compile(r"([A-Z][a-z]?)(\d*)")
+
+def parse_formula(formula):
+    """Parses an elemental formula like "C6H10O5" into a {element: count} dict, a leading '-' negates the counts."""
+    sign = -1 if formula.startswith("-") else 1
+    elements = {}
+    for element, count in formula_pattern.findall(formula):
+        elements[element] = elements.get(element, 0) + sign * int(count or 1)
+    return elements
+
+def add_formulas(*formulas):
+    """Adds {element: count} dicts."""
+    total = {}
+    for formula in formulas:
+        for element, count in formula.items():
+            total[element] = total.get(element, 0) + count
+    return total
+
+# Parsed residue formulas
+amino_acid_elements = {aa: parse_formula(formula) for aa, formula in amino_acid_formulas.items()}
+monosaccharide_elements = {sugar: parse_formula(info["formula"]) for sugar, info in monosaccharide_library.items()}
+
+def peptide_formula(peptide):
+    """Returns the elemental formula of a peptide (residues and water) as a {element: count} dict."""
+    counts = {}
+    for aa in peptide:
+        counts[aa] = counts.get(aa, 0) + 1
+    return add_formulas({"H": 2, "O": 1}, *({element: count * n for element, count in amino_acid_elements[aa].items()}
+                                           for aa, n in counts.items()))
+
+def glycan_formula(glycan_composition):
+    """Returns the elemental formula of the glycan residues of a composition string or parse_composition dict."""
+    glycan_dict = parse_composition(glycan_composition) if isinstance(glycan_composition, str) else glycan_composition
+    return add_formulas(*({element: count * n for element, count in monosaccharide_elements[sugar].items()}
+                          for sugar, n in glycan_dict.items()))
+
+def convolve_envelopes(first, second, max_peaks=max_isotope_peaks):
+    """Convolves two isotope envelopes ((abundance, mass) per nominal mass offset), keeping the first max_peaks peaks."""
+    size = min(len(first) + len(second) - 1, max_peaks)
+    abundances = [0.0] * size
+    masses = [0.0] * size
+    for i, (abundance_i, mass_i) in enumerate(first):
+        if i >= size:
+            break
+        for j, (abundance_j, mass_j) in enumerate(second[:size - i]):
+            abundance = abundance_i * abundance_j
+            abundances[i + j] += abundance
+            masses[i + j] += abundance * (mass_i + mass_j)
+    # Prune the tail peaks below the threshold
+    highest = max(abundances)
+    while len(abundances) > 1 and abundances[-1] < highest * isotope_prune_threshold:
+        abundances.pop()
+        masses.pop()
+    return tuple((abundance, mass / abundance if abundance else 0.0) for abundance, mass in zip(abundances, masses))
+
+@lru_cache(maxsize=None)
+def element_envelope(element, count):
+    """Isotope envelope of count atoms of an element, by repeated squaring of the single atom envelope."""
+    if count == 0:
+        return ((1.0, 0.0),)
+    if count == 1:
+        return tuple((abundance, mass) for mass, abundance in element_isotopes[element])
+    half = element_envelope(element, count // 2)
+    envelope = convolve_envelopes(half, half)
+    return convolve_envelopes(envelope, element_envelope(element, 1)) if count % 2 else envelope
+
+@lru_cache(maxsize=65536)
+def formula_envelope(formula):
+    """Isotope envelope of an elemental formula given as a sorted tuple of (element, count), cached by composition."""
+    envelope = ((1.0, 0.0),)
+    for element, count in formula:
+        if count:
+            envelope = convolve_envelopes(envelope, element_envelope(element, count))
+    return envelope
+
+def isotope_envelope(formula):
+    """
+    Calculate the isotope envelope of an elemental formula ({element: count} dict) by pruned convolution.
+
+    Returns:
+      tuple: (abundance, mass) of every peak from the monoisotopic peak (M, M+1, M+2, ...), the abundances sum to 1.
+    """
+    return formula_envelope(tuple(sorted((element, count) for element, count in formula.items() if count)))
+
+def top_isotopes(envelope, top_n, monoisotopic_mass, charges):
+    """
+    Selects the top_n most abundant peaks of an isotope envelope. The peak masses are shifted so the monoisotopic
+    peak is monoisotopic_mass (the library mass of the glycopeptide).
+
+    Returns:
+      dict: 'peaks' (offsets from the monoisotopic peak), 'abundance' (relative to the most abundant peak), 'mass' and
+      one list of m/z values per charge ('z2', 'z3', ...), in peak order.
+    """
+    peaks = sorted(sorted(range(len(envelope)), key=lambda peak: -envelope[peak][0])[:top_n])
+    highest = max(abundance for abundance, _ in envelope)
+    masses = [monoisotopic_mass + envelope[peak][1] - envelope[0][1] for peak in peaks]
+    isotopes = {
+        "peaks": peaks,
+        "abundance": [round(envelope[peak][0] / highest, 4) for peak in peaks],
+        "mass": [round(mass, 4) for mass in masses],
+    }
+    for z in charges:
+        isotopes[f"z{z}"] = [round(compute_mz(mass, z), 4) for mass in masses]
+    return isotopes
+
+# Regular expression to capture OS, OX, GN, PE and SV from a UniProt FASTA header
+header_pattern = re.compile(r"OS=([^\s]+(?: [^\s]+)*)\s+OX=(\d+)\s+GN=([^\s]+)\s+PE=(\d+)\s+SV=(\d+)")
+
+# Whitespace removed from sequence lines
+sequence_whitespace = b" \t\r\n\x0b\x0c"
+
+def fasta_buffer_records(data):
+    """Yields (protein_id, description, sequence) records from a FASTA bytes buffer or memory map.
+
+    The records match Bio.SeqIO: text before the first header is skipped, the description is the header line without
+    the '>' and trailing whitespace, the ID is its first word, and whitespace is removed from the sequence.
+    """
+    size = len(data)
+    if data[:1] == b">":
+        start = 0
+    else:
+        start = data.find(b"\n>")
+        if start == -1:
+            return
+        start += 1
+
+    while start != -1:
+        header_end = data.find(b"\n", start)
+        if header_end == -1:
+            header_end = size
+        next_start = data.find(b"\n>", header_end)
+        sequence_end = size if next_start == -1 else next_start
+
+        description = data[start + 1:header_end].decode().rstrip()
+        sequence = data[header_end:sequence_end].translate(None, sequence_whitespace).decode()
+        protein_id = description.split(None, 1)[0] if description else ""
+        yield protein_id, description, sequence
+
+        start = -1 if next_start == -1 else next_start + 1
+
+# Compressed FASTA inputs by magic bytes, and their usual file extensions
+fasta_compressions = {b"\x1f\x8b": "gzip", b"BZh": "bz2", b"\xfd7zXZ\x00": "xz"}
+compressed_fasta_extensions = (".gz", ".bz2", ".xz")
+
+def fasta_compression(head):
+    """Returns the compression (gzip, bz2 or xz) of the first bytes of a FASTA file or stream, None if uncompressed."""
+    for magic, compression in fasta_compressions.items():
+        if head[:len(magic)] == magic:
+            return compression
+    return None
+
+def decompressed_stream(handle, compression):
+    """Returns a binary stream decompressing an open compressed file or stream."""
+    if compression == "gzip":
+        import gzip
+        return gzip.GzipFile(fileobj=handle, mode="rb")
+    if compression == "bz2":
+        import bz2
+        return bz2.BZ2File(handle, mode="rb")
+    import lzma
+    return lzma.LZMAFile(handle, mode="rb")
+
+def background_chunks(read, chunk_size=1 << 20, prefetch=8):
+    """
+    Yields the chunks of read(chunk_size) from a background thread, at most prefetch chunks ahead. zlib, bz2 and lzma
+    release the GIL, so decompression overlaps with parsing. Errors of the reader are raised in the consumer.
+    """
+    chunks = queue.Queue(prefetch)
+    stop = threading.Event()
+
+    def put(item):
+        # Give up when the consumer has stopped reading
+        while not stop.is_set():
+            try:
+                chunks.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def produce():
+        try:
+            while not stop.is_set():
+                chunk = read(chunk_size)
+                put(chunk)
+                if not chunk:
+                    return
+        except Exception as error:
+            put(error)
+
+    thread = threading.Thread(target=produce, name="fasta-decompress", daemon=True)
+    thread.start()
+    try:
+        while True:
+            chunk = chunks.get()
+            if isinstance(chunk, Exception):
+                raise chunk
+            if not chunk:
+                return
+            yield chunk
+    finally:
+        stop.set()
+        thread.join()
+
+def fasta_chunk_records(chunks):
+    """
+    Yields (protein_id, description, sequence) records from FASTA byte chunks (e.g. decompressed blocks). Each run of
+    complete records is parsed with fasta_buffer_records; the last, possibly partial record is kept for the next chunk.
+    """
+    pending = b""
+    for chunk in chunks:
+        data = pending + chunk
+        cut = data.rfind(b"\n>")
+        if cut == -1:
+            pending = data
+            continue
+        yield from fasta_buffer_records(data[:cut + 1])
+        pending = data[cut + 1:]
+    yield from fasta_buffer_records(pending)
+
+def read_fasta_records(file):
+    """
+    Reads a FASTA file through a memory map and yields (protein_id, description, sequence) records. gzip, bzip2 and
+    xz files (detected by their magic bytes) are decompressed in a background thread while the records are parsed.
+    """
+    with open(file, "rb") as handle:
+        compression = fasta_compression(handle.read(6))
+        if compression:
+            handle.seek(0)
+            with decompressed_stream(handle, compression) as stream:
+                yield from fasta_chunk_records(background_chunks(stream.read))
+            return
+
+        # Empty files cannot be memory mapped
+        if os.fstat(handle.fileno()).st_size == 0:
+            return
+        with mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            yield from fasta_buffer_records(data)
+
+class PrefixedStream(io.RawIOBase):
+    """Raw binary stream returning bytes already read from a stream (e.g. its magic bytes) before the rest of it."""
+
+    def __init__(self, prefix, stream):
+        self.prefix = prefix
+        self.stream = stream
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if self.prefix:
+            data, self.prefix = self.prefix[:len(buffer)], self.prefix[len(buffer):]
+        else:
+            # read1 returns the bytes available so far, so lines of a pipe are not held back until the buffer is full
+            data = getattr(self.stream, "read1", self.stream.read)(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+def fasta_stream_records(handle):
+    """
+    Yields (protein_id, description, sequence) records from a text or binary FASTA stream, line by line. Compressed
+    binary streams that can be peeked (e.g. sys.stdin.buffer or files opened with "rb") are detected by their magic
+    bytes and decompressed in a background thread.
+    """
+    if hasattr(handle, "peek"):
+        # A pipe may have delivered fewer bytes than the longest magic so far: read until there are enough (or the
+        # stream ends) and put the bytes read back in front of the stream
+        head = handle.peek(6)[:6]
+        if len(head) < 6:
+            head = b""
+            while len(head) < 6:
+                data = handle.read(6 - len(head))
+                if not data:
+                    break
+                head += data
+            handle = io.BufferedReader(PrefixedStream(head, handle))
+        compression = fasta_compression(head)
+        if compression:
+            with decompressed_stream(handle, compression) as stream:
+                yield from fasta_chunk_records(background_chunks(stream.read))
+            return
+
+    description = None
+    lines = []
+    for line in handle:
+        if isinstance(line, bytes):
+            line = line.decode()
+        if line[:1] == ">":
+            if description is not None:
+                yield (description.split(None, 1)[0] if description else ""), description, "".join("".join(lines).split())
+            description = line[1:].rstrip()
+            lines = []
+        elif description is not None:
+            lines.append(line)
+    if description is not None:
+        yield (description.split(None, 1)[0] if description else ""), description, "".join("".join(lines).split())
+
+def fasta_records(source):
+    """
+    Yields (protein_id, description, sequence) records from a FASTA file path, an open stream or a bytes buffer, each
+    of them plain or compressed (gzip, bzip2 or xz).
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        compression = fasta_compression(bytes(source[:6]))
+        if compression:
+            return fasta_chunk_records([decompressed_stream(io.BytesIO(source), compression).read()])
+        return fasta_buffer_records(source)
+    if hasattr(source, "read"):
+        return fasta_stream_records(source)
+    return read_fasta_records(source)
+
+class NullProfiler:
+    """Profiler used when --profile is off, its stages do nothing."""
+
+    def stage(self, name, protease=None):
+        return nullcontext()
+
+# Shared no-op profiler
+null_profiler = NullProfiler()
+
+# Row pipeline
+
+def default_glycans(glycosylation_type):
+    """Returns the default glycan records of the glycosylation type."""
+    if glycosylation_type == "N":
+        return default_n_glycans
+    elif glycosylation_type == "O":
+        return default_o_glycans
+    elif glycosylation_type == "C":
+        return default_c_glycans
+    raise ValueError(f"Glycosylation type {glycosylation_type} is not supported. Supported glycosylation types: N, O, C.")
+
+# Water added to the residue masses by glycan libraries listing free glycan masses (the default O- and C-glycans)
+water_mass = 18.010565
+
+# Symbols of derived shorthand glycan names, dHex is written F as in the default libraries
+shorthand_symbols = {**{sugar: info["symbol"] for sugar, info in monosaccharide_library.items()}, "dHex": "F"}
+
+class GlycanLibrary:
+    """
+    Glycan library compiled once from glycan records and reused by every stage. Each glycan gets an integer ID (its
+    row), its composition parsed into a row of monosaccharide counts over monosaccharide_library and its mass
+    recomputed from the counts. The listed masses are kept and validated against the recomputed residue mass, with or
+    without water; glycans matching neither are kept in mismatches and logged at debug level. Missing masses are taken
+    from the counts and missing shorthand names from converted_glycan (glycan_format_converter.py) or the counts. The library
+    is picklable, so worker processes receive the compiled form instead of reading the glycan file again. The glycan
+    fragment tables of the ion series (glycan_fragments) and the isotope envelopes are computed on first use and kept
+    with the library.
+    """
+
+    # Monosaccharides of the count matrix columns
+    monosaccharides = list(monosaccharide_library)
+
+    def __init__(self, glycans, mass_tolerance=0.01):
+        self.records = []
+        self.counts = []
+        self.compositions = []
+        self.computed_masses = []
+        self.mismatches = []
+        self.parsed = {}
+        self.fragments = {}
+        self.fragment_ions = {}
+        self.envelopes = {}
+        for glycan_id, glycan in enumerate(glycans):
+            composition = glycan["composition"]
+            parsed = self.parsed.get(composition) or parse_composition(composition)
+            unknown = [sugar for sugar in parsed if sugar not in monosaccharide_library]
+            if unknown:
+                raise ValueError(f"Glycan {composition} has unknown monosaccharides: {', '.join(unknown)}.")
+
+            # Recompute the residue mass from the counts and validate the listed mass
+            computed_mass = sum(monosaccharide_library[sugar]["mass"] * count for sugar, count in parsed.items())
+            mass = glycan.get("mass")
+            mass = computed_mass if mass in (None, "") else float(mass)
+            if min(abs(mass - computed_mass), abs(mass - computed_mass - water_mass)) > mass_tolerance:
+                self.mismatches.append({"glycan_id": glycan_id, "glytoucan_ac": glycan.get("glytoucan_ac", ""),
+                                        "composition": composition, "mass": mass, "computed_mass": round(computed_mass, 6)})
+                logger.debug(f"Glycan {glycan.get('glytoucan_ac', glycan_id)} {composition}: listed mass {mass} does "
+                             f"not match its composition ({computed_mass:.4f}, or {computed_mass + water_mass:.4f} with water).")
+
+            shorthand = (glycan.get("shorthand_glycan") or glycan.get("converted_glycan")
+                         or "".join(f"{shorthand_symbols[sugar]}{count}" for sugar, count in parsed.items()))
+            self.records.append({**glycan, "glycan_id": glycan_id, "mass": mass, "shorthand_glycan": shorthand})
+            self.counts.append(tuple(parsed.get(sugar, 0) for sugar in self.monosaccharides))
+            self.compositions.append(parsed)
+            self.computed_masses.append(computed_mass)
+            self.parsed[composition] = parsed
+
+    def __len__(self):
+        return len(self.records)
+
+    def __iter__(self):
+        return iter(self.records)
+
+    def __getitem__(self, glycan_id):
+        return self.records[glycan_id]
+
+    def composition(self, composition):
+        """Returns the parsed composition dict of a composition string, parsing only compositions not in the library."""
+        return self.parsed.get(composition) or parse_composition(composition)
+
+    def fragment_table(self, composition, charge=1):
+        """Returns the glycan_fragments table of a composition, computed once per glycan and charge."""
+        key = (composition, charge)
+        fragments = self.fragments.get(key)
+        if fragments is None:
+            fragments = self.fragments[key] = glycan_fragments(self.composition(composition), charge=charge)
+        return fragments
+
+    def glycan_ions_json(self, composition, charges):
+        """Returns the B and oxonium ions of a composition for fragment charges as compact JSON members, computed once."""
+        key = (composition, tuple(charges))
+        members = self.fragment_ions.get(key)
+        if members is None:
+            fragments = self.fragment_table(composition)
+            members = self.fragment_ions[key] = json_members({"B": charge_mz_table(fragments["B_masses"], charges),
+                                                              "oxonium": charge_mz_table(fragments["oxonium_masses"], charges)})
+        return members
+
+    def isotope_envelope(self, composition):
+        """Returns the isotope envelope of the glycan residues of a composition, computed once per glycan."""
+        envelope = self.envelopes.get(composition)
+        if envelope is None:
+            envelope = self.envelopes[composition] = isotope_envelope(glycan_formula(self.composition(composition)))
+        return envelope
+
+    def count_matrix(self):
+        """Returns the monosaccharide counts as a (glycans x monosaccharides) numpy array."""
+        import numpy as np
+        return np.array(self.counts, dtype=np.int32).reshape(len(self.counts), len(self.monosaccharides))
+
+def compile_glycans(glycans):
+    """Returns glycan records as a compiled GlycanLibrary, compiled libraries are returned unchanged."""
+    return glycans if isinstance(glycans, GlycanLibrary) else GlycanLibrary(glycans)
+
+def load_glycan_records(glycosylation_type, glycan_file=None):
+    """Loads the glycans of a CSV file, or the default glycans of the glycosylation type, as a compiled GlycanLibrary."""
+    if glycan_file is None:
+        return GlycanLibrary(default_glycans(glycosylation_type))
+    with open(glycan_file, newline="") as f:
+        return GlycanLibrary(csv.DictReader(f))
+
+def parse_header(description):
+    """Returns the OS, OX, GN, PE and SV values of a UniProt FASTA header, blank values if not found."""
+    match = header_pattern.search(description)
+    return match.groups() if match else ("", "", "", "", "")
+
+def digest_proteins(records, protease, missed_cleavages, glycosylation_type, progress=None):
+    """Digests (protein_id, description, sequence) records and returns one row per protein (protein_fields)."""
+    proteins = []
+
+    # Per protein peptide lists are only logged at the explicit DEBUG level, they are too large for the hot path
+    debug = logging.getLogger().isEnabledFor(logging.DEBUG)
+
+    for protein_id, description, sequence in records:
+        species, taxon_id, gene_name, protein_evidence, sequence_version = parse_header(description)
+
+        # Digest the protein with protease and missed cleavages
+        peptides = cleave_sequence(sequence, protease, missed_cleavages)
+        if debug:
+            logging.debug(f"Processing {protein_id} with {len(sequence)} amino acids.")
+            logging.debug(f"Found {len(peptides)} peptides after {protease} cleavage. The peptides were: {peptides}")
+        if progress:
+            progress.update(proteins=1, peptides=len(peptides))
+
+        proteins.append({
+            "ProteinID": protein_id,
+            "Peptides": peptides,
+            "Sequence": sequence,
+            "Protease": protease,
+            "MissedCleavages": missed_cleavages,
+            "GlycosylationType": glycosylation_type,
+            "Species": species,
+            "TaxonID": taxon_id,
+            "GeneName": gene_name,
+            "ProteinEvidence": protein_evidence,
+            "SequenceVersion": sequence_version
+        })
+
+    return proteins
+
+def find_sequons(peptides, sequence, glycosylation_type):
+    """Finds the sequons of the peptides and maps them to 1-based sites in the full protein sequence."""
+    glyco_sequon = re.compile(glycosylation[glycosylation_type])
+    glycopeptides = []
+    for pep in peptides:
+        for match in glyco_sequon.finditer(pep):
+            # Map the position in the peptide to the full protein sequence
+            start_in_protein = sequence.find(pep) + match.start() + 1  # Adjust to 1-based indexing
+            glycopeptides.append((pep, start_in_protein))
+    return glycopeptides
+
+def peptide_rows(proteins):
+    """Flattens digested protein rows into peptide library rows with mass, hydrophobicity and pI (peptide_fields)."""
+    rows = []
+    for protein in proteins:
+        protein_id = protein["ProteinID"]
+        for peptide in protein["Peptides"]:
+            # Skip empty peptides and peptides with ambiguous residues (unknown mass)
+            if not peptide.strip():
+                continue
+            mass = calculate_peptide_mass(peptide)
+            if mass == "Unknown":
+                continue
+            rows.append({
+                "Peptide": peptide,
+                "ProteinID": protein_id,
+                "PredictedMass": mass,
+                "Hydrophobicity": predict_hydrophobicity(peptide),
+                "pI": calculate_pI(peptide),
+            })
+    return rows
+
+def glycopeptide_rows(proteins, glycosylation_type, peptide_max_length):
+    """Finds the glycopeptides (peptide backbones) of digested protein rows (glycopeptide_fields)."""
+    rows = []
+    for protein in proteins:
+        sequence = protein["Sequence"]
+        for peptide, site in find_sequons(protein["Peptides"], sequence, glycosylation_type):
+            # Skip peptides longer than the maximum length (-m flag)
+            if len(peptide) > peptide_max_length:
+                continue
+            start_pos = sequence.find(peptide) + 1  # 1-based indexing
+            rows.append({
+                "ProteinID": protein["ProteinID"],
+                "Site": site,
+                "Peptide": peptide,
+                "Start": start_pos,
+                "End": start_pos + len(peptide) - 1,
+                "Length": len(peptide),
+                "Sequon": sequence[site - 1:site + 2], # Extract the sequon amino acid sequence + 1 flanking residue
+                "PredictedMass": calculate_peptide_mass(peptide),
+                "Hydrophobicity": predict_hydrophobicity(peptide),
+                "pI": calculate_pI(peptide),
+            })
+    return rows
+
+def glycopeptide_library_fields(max_charge, fragment_charges=None, isotopes=None, hf_experimental=False):
+    """
+    Returns the fields of the glycopeptide library for a maximum charge state, with FragmentIons for fragment charges,
+    Isotopes for a number of isotope peaks and HF_experimental and rt_HF_experimental with hf_experimental.
+    """
+    return (["ProteinID", "Site", "GlyToucan_AC", "Composition", "ShorthandGlycan", "Peptide", "Start", "End", "Length",
+             "Sequon", "GlycopeptideMass", "PeptideMass", "GlycanMass", "Hydrophobicity", "pI"]
+            + [f"z{z}" for z in range(2, max_charge + 1)] + ["Charge", "IonSeries"]
+            + (["FragmentIons"] if fragment_charges else []) + (["Isotopes"] if isotopes else [])
+            + (["HF_experimental", "rt_HF_experimental"] if hf_experimental else []))
+
+def glycan_cross_rows(peptides, glycans, max_charge):
+    """Combines peptide backbone rows with glycan records and computes m/z values for charge states 2 to max_charge."""
+    glycans = compile_glycans(glycans)
+    rows = []
+    for pep in peptides:
+        # Skip peptides with an unknown mass
+        if isinstance(pep["PredictedMass"], str):
+            continue
+        peptide_mass = float(pep["PredictedMass"])
+        for gly in glycans:
+            glycan_mass = gly["mass"]
+
+            # Compute glycopeptide mass and m/z values for charge states from 2 to max_charge
+            glycopeptide_mass = peptide_mass + glycan_mass
+            mz_values = {f'z{z}': compute_mz(glycopeptide_mass, z) for z in range(2, max_charge + 1)}
+
+            rows.append({
+                'ProteinID': pep['ProteinID'],
+                'Site': pep['Site'],
+                'GlyToucan_AC': gly['glytoucan_ac'],
+                'Composition': gly['composition'],
+                'ShorthandGlycan': gly['shorthand_glycan'],
+                'Peptide': pep['Peptide'],
+                'Start': pep['Start'],
+                'End': pep['End'],
+                'Length': pep['Length'],
+                'Sequon': pep['Sequon'],
+                'GlycopeptideMass': glycopeptide_mass,
+                'PeptideMass': peptide_mass,
+                'GlycanMass': glycan_mass,
+                'Hydrophobicity': pep['Hydrophobicity'],
+                'pI': pep['pI'],
+                **mz_values, # z charge states values
+            })
+    return rows
+
+def add_hf_experimental_rows(glycopeptides, glycan_hydrophobicity=None, hf_weight=10, rt_scale=60):
+    """
+    Adds HF_experimental and the scaled retention time rt_HF_experimental (compute_hf_experimental) of every
+    glycopeptide row. Glycans are looked up by ShorthandGlycan, then Composition, in the glycan hydrophobicity dict
+    (default: default_glycan_hydrophobicity); glycans not in it get blank values. The glycan terms are computed once
+    per glycan, so each row only adds its peptide hydrophobicity.
+    """
+    if glycan_hydrophobicity is None:
+        glycan_hydrophobicity = default_glycan_hydrophobicity
+    terms = {}
+    for row in glycopeptides:
+        glycan = (row["ShorthandGlycan"], row["Composition"])
+        term = terms.get(glycan)
+        if term is None:
+            glycan_hf = glycan_hydrophobicity.get(glycan[0], glycan_hydrophobicity.get(glycan[1]))
+            term = terms[glycan] = glycan_hf_terms(glycan_hf, hf_weight, rt_scale) if glycan_hf is not None else ()
+        if term:
+            row["HF_experimental"] = round(row["Hydrophobicity"] + term[0], 5)
+            row["rt_HF_experimental"] = term[1]
+        else:
+            row["HF_experimental"] = row["rt_HF_experimental"] = ""
+    return glycopeptides
+
+def add_ion_rows(glycopeptides, glycans=None, fragment_charges=None):
+    """
+    Adds the IonSeries of every glycopeptide row, reusing the glycan fragment tables of a compiled GlycanLibrary.
+
+    With fragment charges, the FragmentIons of these charges are added in the same pass as compact JSON (the
+    glycopeptide_ion_table of the row). Only the Y ions depend on both the peptide and the glycan, so the b, y, c and
+    z ions are computed once per peptide and the B and oxonium ions once per glycan, for the IonSeries as well.
+    """
+    glycans = compile_glycans(glycans if glycans is not None else [])
+    charges_json = json.dumps(list(fragment_charges), separators=(",", ":")) if fragment_charges else None
+    last_peptide = None
+    for row in glycopeptides:
+        # Rows of the same peptide follow each other, its fragment masses are computed once
+        peptide = row["Peptide"]
+        if peptide != last_peptide:
+            peptide_masses = peptide_fragment_masses(peptide)
+            peptide_series = peptide_ions(peptide_masses, charge=1)
+            if fragment_charges:
+                peptide_json = json_members({ion_type: charge_mz_table(masses, fragment_charges)
+                                             for ion_type, masses in peptide_neutral_ions(peptide_masses).items()})
+            last_peptide = peptide
+        fragments = glycans.fragment_table(row["Composition"])
+        row["IonSeries"] = glycopeptide_ions(peptide, fragments, charge=1, peptide_masses=peptide_masses,
+                                             peptide_series=peptide_series)
+        if fragment_charges:
+            Y_masses = [peptide_masses[0] + offset for offset in fragments["Y"]]
+            row["FragmentIons"] = (f'{{"charges":{charges_json},{peptide_json},'
+                                   f'"Y":{json.dumps(charge_mz_table(Y_masses, fragment_charges), separators=(",", ":"))},'
+                                   f'{glycans.glycan_ions_json(row["Composition"], fragment_charges)}}}')
+    return glycopeptides
+
+def add_isotope_rows(glycopeptides, glycans=None, top_n=3, max_charge=3):
+    """
+    Adds the Isotopes of every glycopeptide row as compact JSON: the top_n most abundant peaks of its isotope envelope
+    with m/z values for charge states 2 to max_charge (top_isotopes). The envelopes of the peptide and of the glycan
+    are cached by elemental composition, so every row only convolves the two.
+    """
+    glycans = compile_glycans(glycans if glycans is not None else [])
+    charges = range(2, max_charge + 1)
+    last_peptide = None
+    for row in glycopeptides:
+        # Rows of the same peptide follow each other
+        peptide = row["Peptide"]
+        if peptide != last_peptide:
+            peptide_envelope = isotope_envelope(peptide_formula(peptide))
+            last_peptide = peptide
+        envelope = convolve_envelopes(peptide_envelope, glycans.isotope_envelope(row["Composition"]))
+        row["Isotopes"] = json.dumps(top_isotopes(envelope, top_n, row["GlycopeptideMass"], charges), separators=(",", ":"))
+    return glycopeptides
+
+def digest_record_rows(records, protease, missed_cleavages, glycosylation_type, glycans, charge_state, peptide_max_length=25,
+                       profiler=None, progress=None, fragment_charges=None, isotopes=None, glycan_hydrophobicity=None):
+    """
+    Digests protein records with one protease and builds the peptide and glycopeptide library rows. With fragment
+    charges (e.g. range(1, 4)) the glycopeptides also get their FragmentIons for these charges, with isotopes
+    (a number of peaks) the most abundant peaks of their isotope envelopes, and with a glycan hydrophobicity dict
+    (load_glycan_hydrophobicity) their HF_experimental and rt_HF_experimental.
+
+    Returns:
+        dict: The number of proteins, the peptide library rows, the glycopeptide library rows and their fields.
+    """
+    profiler = profiler or null_profiler
+    glycans = compile_glycans(glycans)
+
+    # Digest the proteins
+    with profiler.stage("digest", protease):
+        proteins = digest_proteins(records, protease, missed_cleavages, glycosylation_type, progress)
+
+    # Compute peptide mass, hydrophobicity and pI of the digested peptides
+    with profiler.stage("peptide_properties", protease):
+        peptide_library = peptide_rows(proteins)
+
+    # Find glycopeptides (peptide backbones)
+    with profiler.stage("sequon_scan", protease):
+        backbones = glycopeptide_rows(proteins, glycosylation_type, peptide_max_length)
+
+    # Combine the glycopeptides with the glycan library and compute m/z values
+    with profiler.stage("glycan_cross_product", protease):
+        glycopeptide_library = glycan_cross_rows(backbones, glycans, charge_state)
+        for row in glycopeptide_library:
+            row["Charge"] = charge_state
+    if progress:
+        progress.update(glycopeptides=len(glycopeptide_library))
+
+    # Compute HF_experimental and the scaled retention times of the glycopeptides
+    if glycan_hydrophobicity is not None:
+        with profiler.stage("hf_experimental", protease):
+            add_hf_experimental_rows(glycopeptide_library, glycan_hydrophobicity)
+
+    # Compute IonSeries for glycopeptides
+    with profiler.stage("ion_series", protease):
+        add_ion_rows(glycopeptide_library, glycans, fragment_charges)
+
+    # Compute the isotope envelopes of the glycopeptides
+    if isotopes:
+        with profiler.stage("isotopes", protease):
+            add_isotope_rows(glycopeptide_library, glycans, isotopes, charge_state)
+
+    return {
+        "proteins": len(proteins),
+        "peptide_library": peptide_library,
+        "glycopeptide_library": glycopeptide_library,
+        "glycopeptide_fields": glycopeptide_library_fields(charge_state, fragment_charges, isotopes,
+                                                           glycan_hydrophobicity is not None),
+    }
+
+def library_output_files(input_file, protease, missed_cleavages, charge_state, glycosylation_type):
+    """Returns the default peptide and glycopeptide library file paths for an input FASTA file."""
+    if input_file.endswith(compressed_fasta_extensions):
+        input_file = input_file.rsplit(".", 1)[0]
+    base_filename = os.path.basename(input_file.rsplit(".", 1)[0])
+    peptide_output_file = f"digested_peptide_library/{base_filename}_{protease}_digested_mc{missed_cleavages}_peptides.csv"
+    glycopeptide_output_file = f"digested_glycopeptide_library/{base_filename}_{protease}_digested_mc{missed_cleavages}_z{charge_state}_{glycosylation_type}-glycopeptides.csv"
+    return peptide_output_file, glycopeptide_output_file
+
+# Compression of library output files by extension
+compressed_extensions = {".gz": "gzip", ".zst": "zstd"}
+
+class ParallelGzipWriter(io.BufferedIOBase):
+    """
+    Binary gzip writer that compresses fixed-size blocks in a thread pool (zlib releases the GIL), like pigz. Every
+    block is a complete gzip member and concatenated members are one valid gzip file (gzip, zcat, pandas). At most two
+    blocks per thread are held in memory, the compressed blocks are written in order.
+    """
+
+    def __init__(self, file, threads=None, block_size=1 << 22, compresslevel=6):
+        from concurrent.futures import ThreadPoolExecutor
+        self.file = file
+        self.threads = threads or os.cpu_count() or 1
+        self.block_size = block_size
+        self.compresslevel = compresslevel
+        self.executor = ThreadPoolExecutor(self.threads)
+        self.pending = deque()
+        self.buffer = bytearray()
+        self.blocks = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.buffer += data
+        while len(self.buffer) >= self.block_size:
+            self.submit(bytes(self.buffer[:self.block_size]))
+            del self.buffer[:self.block_size]
+        return len(data)
+
+    def submit(self, block):
+        """Compresses a block in the thread pool and writes the finished blocks beyond two per thread."""
+        import gzip
+        self.pending.append(self.executor.submit(gzip.compress, block, self.compresslevel, mtime=0))
+        self.blocks += 1
+        while len(self.pending) > 2 * self.threads:
+            self.file.write(self.pending.popleft().result())
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            # An empty output is still written as one (empty) gzip member
+            if self.buffer or not self.blocks:
+                self.submit(bytes(self.buffer))
+                self.buffer.clear()
+            while self.pending:
+                self.file.write(self.pending.popleft().result())
+        finally:
+            self.executor.shutdown()
+            self.file.close()
+            super().close()
+
+def open_library_output(output_file, threads=None):
+    """
+    Opens a library output file for writing CSV text, creating the output directory if needed. Files ending in .gz
+    are compressed with ParallelGzipWriter and files ending in .zst with the multithreaded zstd compressor of the
+    zstandard package, each with threads compression threads (default: all cores).
+    """
+    directory = os.path.dirname(output_file)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    compression = compressed_extensions.get(os.path.splitext(output_file)[1].lower())
+    if compression is None:
+        return open(output_file, mode="w", newline="")
+    if compression == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            raise ValueError(f"Writing {output_file} needs the zstandard package (pip install zstandard).") from None
+        stream = zstandard.ZstdCompressor(level=3, threads=threads or -1).stream_writer(open(output_file, "wb"))
+    else:
+        stream = ParallelGzipWriter(open(output_file, "wb"), threads)
+    return io.TextIOWrapper(stream, encoding="utf-8", newline="")
+
+def write_rows(output_file, rows, fields):
+    """Writes rows to a CSV file (compressed by extension, see open_library_output)."""
+    with open_library_output(output_file) as file:
+        writer = csv.DictWriter(file, fieldnames=fields, lineterminator="\n")
+        writer.writeheader()
+        writer.writerows(rows)
+
+def write_library_rows(libraries, peptide_output_file, glycopeptide_output_file):
+    """Writes the peptide and glycopeptide library rows returned by digest_record_rows."""
+    write_rows(peptide_output_file, libraries["peptide_library"], peptide_fields)
+    write_rows(glycopeptide_output_file, libraries["glycopeptide_library"], libraries["glycopeptide_fields"])
+
+# Output formats of the streamed rows
+output_formats = ("csv", "ndjson")
+
+class RowWriter:
+    """
+    Writes rows incrementally to an open text stream, as CSV with a header or as NDJSON (one JSON object per line).
+    With flush=True the stream is flushed after every write, so rows reach a pipe as soon as they are written.
+    """
+
+    def __init__(self, stream, fields, output_format="csv", flush=False):
+        if output_format not in output_formats:
+            raise ValueError(f"Output format {output_format} is not supported. Supported formats: {', '.join(output_formats)}.")
+        self.stream = stream
+        self.output_format = output_format
+        self.flush = flush
+        if output_format == "csv":
+            self.writer = csv.DictWriter(stream, fieldnames=fields, lineterminator="\n")
+            self.writer.writeheader()
+
+    def write(self, rows):
+        if self.output_format == "csv":
+            self.writer.writerows(rows)
+        else:
+            self.stream.write("".join(json.dumps(row) + "\n" for row in rows))
+        if self.flush:
+            self.stream.flush()
+
+def stream_record_rows(records, protease, missed_cleavages, glycosylation_type, glycans, charge_state, peptide_max_length,
+                       glycopeptide_writer, peptide_writer=None, progress=None, fragment_charges=None, isotopes=None,
+                       glycan_hydrophobicity=None):
+    """
+    Digests protein records one at a time and writes the rows of each protein as soon as it is processed. Only one
+    protein is held in memory, so a slow reader of the output slows down the reading of the input (back-pressure).
+
+    Returns:
+        dict: The number of digested proteins, peptides and glycopeptides.
+    """
+    glycans = compile_glycans(glycans)
+    counts = {"proteins": 0, "peptides": 0, "glycopeptides": 0}
+    for record in records:
+        libraries = digest_record_rows([record], protease, missed_cleavages, glycosylation_type, glycans, charge_state,
+                                       peptide_max_length, progress=progress, fragment_charges=fragment_charges,
+                                       isotopes=isotopes, glycan_hydrophobicity=glycan_hydrophobicity)
+        if peptide_writer:
+            peptide_writer.write(libraries["peptide_library"])
+        glycopeptide_writer.write(libraries["glycopeptide_library"])
+        counts["proteins"] += 1
+        counts["peptides"] += len(libraries["peptide_library"])
+        counts["glycopeptides"] += len(libraries["glycopeptide_library"])
+        if progress:
+            progress.update(rows_written=len(libraries["glycopeptide_library"]) + (len(libraries["peptide_library"]) if peptide_writer else 0))
+    return counts
+
+def write_record_chunks(records, protease, missed_cleavages, glycosylation_type, glycans, charge_state, peptide_max_length,
+                        glycopeptide_writer, peptide_writer=None, chunk_size=10000, profiler=None, progress=None,
+                        fragment_charges=None, isotopes=None, glycan_hydrophobicity=None):
+    """
+    Digests protein records in batches of about chunk_size glycopeptide rows and writes the rows of every batch before
+    the next is digested, so memory stays constant however large the library. The batch size (in proteins) follows
+    the glycopeptides per protein so far and at most doubles from one batch to the next. Records may be an iterator
+    reading the FASTA file, its reading is profiled per batch as the fasta_parse stage.
+
+    Returns:
+        dict: The number of digested proteins, peptides and glycopeptides.
+    """
+    profiler = profiler or null_profiler
+    glycans = compile_glycans(glycans)
+    counts = {"proteins": 0, "peptides": 0, "glycopeptides": 0}
+    records = iter(records)
+    batch_size = 1
+    while True:
+        with profiler.stage("fasta_parse", protease):
+            batch = list(islice(records, batch_size))
+        if not batch:
+            break
+        libraries = digest_record_rows(batch, protease, missed_cleavages, glycosylation_type, glycans, charge_state,
+                                       peptide_max_length, profiler=profiler, progress=progress,
+                                       fragment_charges=fragment_charges, isotopes=isotopes,
+                                       glycan_hydrophobicity=glycan_hydrophobicity)
+        with profiler.stage("csv_write", protease):
+            if peptide_writer:
+                peptide_writer.write(libraries["peptide_library"])
+            glycopeptide_writer.write(libraries["glycopeptide_library"])
+        counts["proteins"] += libraries["proteins"]
+        counts["peptides"] += len(libraries["peptide_library"])
+        counts["glycopeptides"] += len(libraries["glycopeptide_library"])
+        if progress:
+            progress.update(rows_written=len(libraries["glycopeptide_library"]) + (len(libraries["peptide_library"]) if peptide_writer else 0))
+        batch_size = max(1, min(2 * len(batch), chunk_size * counts["proteins"] // max(counts["glycopeptides"], 1)))
+    return counts
+
+# Embeddable API
+
+class PeptideRecord(NamedTuple):
+    """A digested peptide with its predicted mass, hydrophobicity and pI."""
+    Peptide: str
+    ProteinID: str
+    PredictedMass: float
+    Hydrophobicity: float
+    pI: float
+
+class GlycopeptideRecord(NamedTuple):
+    """A glycopeptide (peptide backbone and glycan) with its masses, m/z values for charges 2 to Charge and ion series."""
+    ProteinID: str
+    Site: int
+    GlyToucan_AC: str
+    Composition: str
+    ShorthandGlycan: str
+    Peptide: str
+    Start: int
+    End: int
+    Length: int
+    Sequon: str
+    GlycopeptideMass: float
+    PeptideMass: float
+    GlycanMass: float
+    Hydrophobicity: float
+    pI: float
+    MZ: tuple
+    Charge: int
+    IonSeries: dict = None
+    FragmentIons: str = None
+    Isotopes: str = None
+    HF_experimental: float = None
+    rt_HF_experimental: float = None
+
+class ProteinResult(NamedTuple):
+    """The peptides and glycopeptides of one digested protein."""
+    ProteinID: str
+    Description: str
+    Species: str
+    TaxonID: str
+    GeneName: str
+    Peptides: list
+    Glycopeptides: list
+
+class FinderResult(NamedTuple):
+    """The number of digested proteins and all of their peptides and glycopeptides."""
+    proteins: int
+    peptides: list
+    glycopeptides: list
+
+class GlycopeptideFinder:
+    """
+    Glycopeptide finder configured once (protease, missed cleavages, glycosylation type, glycan library and charge)
+    for use from other Python code. With a glycan hydrophobicity table (a CSV file or a {glycan: HF} dict, see
+    load_glycan_hydrophobicity) the glycopeptides also get HF_experimental and rt_HF_experimental. It digests (protein_id, description, sequence) records, sequences or FASTA
+    sources and returns typed records in memory, nothing is written to the filesystem.
+
+    Example:
+        finder = GlycopeptideFinder("trypsin", missed_cleavages=1, charge=3)
+        for glycopeptide in finder.iter_glycopeptides(fasta_records("proteome.fasta")):
+            print(glycopeptide.Peptide, glycopeptide.MZ)
+    """
+
+    def __init__(self, protease="trypsin", missed_cleavages=0, glycosylation_type="N", glycans=None, charge=3,
+                 peptide_max_length=25, ion_series=True, fragment_charges=None, isotopes=None, glycan_hydrophobicity=None):
+        if protease.lower() not in proteases:
+            raise ValueError(f"Protease {protease} is not supported. Supported proteases: {', '.join(proteases.keys())}")
+        self.protease = protease.lower()
+        self.missed_cleavages = missed_cleavages
+        self.glycosylation_type = glycosylation_type
+        self.charge = charge
+        self.peptide_max_length = peptide_max_length
+        self.ion_series = ion_series
+        self.fragment_charges = tuple(fragment_charges) if fragment_charges else None
+        self.isotopes = isotopes
+        if isinstance(glycan_hydrophobicity, (str, os.PathLike)):
+            glycan_hydrophobicity = load_glycan_hydrophobicity(glycan_hydrophobicity)
+        self.glycan_hydrophobicity = glycan_hydrophobicity
+
+        # Glycans may be a CSV file, glycan records, a compiled GlycanLibrary or a DataFrame, the default library is used if none are given
+        if glycans is None or isinstance(glycans, (str, os.PathLike)):
+            glycans = load_glycan_records(glycosylation_type, glycans)
+        elif hasattr(glycans, "to_dict"):
+            glycans = glycans.to_dict("records")
+        default_glycans(glycosylation_type)  # Validates the glycosylation type
+        self.glycans = compile_glycans(glycans)
+
+    def digest_protein(self, protein, description=""):
+        """Builds the ProteinResult of one digested protein row (see digest_proteins)."""
+        peptides = [PeptideRecord(**row) for row in peptide_rows([protein])]
+        backbones = glycopeptide_rows([protein], self.glycosylation_type, self.peptide_max_length)
+        rows = glycan_cross_rows(backbones, self.glycans, self.charge)
+        if self.glycan_hydrophobicity is not None:
+            add_hf_experimental_rows(rows, self.glycan_hydrophobicity)
+        if self.ion_series:
+            add_ion_rows(rows, self.glycans, self.fragment_charges)
+        if self.isotopes:
+            add_isotope_rows(rows, self.glycans, self.isotopes, self.charge)
+        glycopeptides = [
+            GlycopeptideRecord(
+                **{field: row[field] for field in GlycopeptideRecord._fields[:15]},
+                MZ=tuple(row[f"z{z}"] for z in range(2, self.charge + 1)),
+                Charge=self.charge,
+                IonSeries=row.get("IonSeries"),
+                FragmentIons=row.get("FragmentIons"),
+                Isotopes=row.get("Isotopes"),
+                HF_experimental=row.get("HF_experimental") if row.get("HF_experimental") != "" else None,
+                rt_HF_experimental=row.get("rt_HF_experimental") if row.get("rt_HF_experimental") != "" else None,
+            )
+            for row in rows
+        ]
+        return ProteinResult(protein["ProteinID"], description, protein["Species"], protein["TaxonID"],
+                             protein["GeneName"], peptides, glycopeptides)
+
+    def iter_proteins(self, records):
+        """Yields the ProteinResult of every (protein_id, description, sequence) record."""
+        for protein_id, description, sequence in records:
+            protein = digest_proteins([(protein_id, description, sequence)], self.protease, self.missed_cleavages,
+                                      self.glycosylation_type)[0]
+            yield self.digest_protein(protein, description)
+
+    def iter_peptides(self, records):
+        """Yields the PeptideRecords of every (protein_id, description, sequence) record."""
+        for protein in self.iter_proteins(records):
+            yield from protein.Peptides
+
+    def iter_glycopeptides(self, records):
+        """Yields the GlycopeptideRecords of every (protein_id, description, sequence) record."""
+        for protein in self.iter_proteins(records):
+            yield from protein.Glycopeptides
+
+    def digest_sequence(self, sequence, protein_id="", description=""):
+        """Digests a single protein sequence and returns its ProteinResult."""
+        return next(self.iter_proteins([(protein_id, description or protein_id, sequence)]))
+
+    def iter_fasta(self, source):
+        """Yields the ProteinResult of every protein of a FASTA file path, open stream or bytes buffer."""
+        return self.iter_proteins(fasta_records(source))
+
+    def run(self, records):
+        """Digests all (protein_id, description, sequence) records and returns a FinderResult."""
+        proteins = 0
+        peptides = []
+        glycopeptides = []
+        for protein in self.iter_proteins(records):
+            proteins += 1
+            peptides.extend(protein.Peptides)
+            glycopeptides.extend(protein.Glycopeptides)
+        return FinderResult(proteins, peptides, glycopeptides)
+
+    def run_fasta(self, source):
+        """Digests all proteins of a FASTA file path, open stream or bytes buffer and returns a FinderResult."""
+        return self.run(fasta_records(source))
@@ -0,0 +1,372 @@
+"""
+glycopeptide_sequence_finder_server.py
+
+Runs the glycopeptide sequence finder as a long-running local server, so clients (e.g. a LIMS) asking for predictions
+for single proteins or short lists do not pay the process start-up and glycan library loading on every request. The
+glycan library and the configured GlycopeptideFinder objects are kept in memory, and the glycopeptides of FASTA files
+given with -i are held in a precursor mass index for mass lookups.
+
+The server speaks HTTP/1.1 with JSON bodies over TCP (default 127.0.0.1:8765) or a Unix socket (-s), and serves
+requests concurrently with asyncio. Digests run in a thread pool so mass lookups are not blocked behind them. The
+finders of the most recently used configurations are kept (--max_finders), and request bodies larger than
+--max_body bytes are rejected with 413 before they are read.
+
+Endpoints:
+    POST /digest   {"sequence": "...", "protein_id": "..."} or {"proteins": [{"protein_id", "description", "sequence"}]}
+                   or {"fasta": ">...\\n..."}, optional "protease", "missed_cleavages", "charge", "ion_series" and
+                   "include_peptides". Returns the glycopeptides of every protein.
+    POST /mass     {"mass": ...} or {"mz": ..., "charge": ...}, optional "tolerance_ppm" (default 10). Returns the indexed
+                   glycopeptides within the tolerance.
+    GET  /stats    Request counts and p50/p99 latency per endpoint.
+    GET  /health   Server configuration and index size.
+
+Usage:
+    python glycopeptide_sequence_finder_server.py [-i <fasta> ...] -p <protease> -g <glycosylation_type> -c <missed_cleavages> -m <max_peptide_length> -z <max_charge> -y <glycan_file> [--host <host>] [--port <port>] [-s <socket>] [--max_finders <n>] [--max_body <bytes>]
+
+Author:
+    Richard Shipman -- 2025
+"""
+import argparse
+import asyncio
+import bisect
+import json
+import math
+import os
+import signal
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+import glycopeptide_sequence_finder_core as gsf
+
+# Proton mass for converting precursor m/z to neutral mass
+proton = 1.007276
+
+# HTTP reason phrases of the status codes returned by the server
+reasons = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large",
+           500: "Internal Server Error"}
+
+def percentile(values, fraction):
+    """Returns the nearest-rank percentile of a list of values (fraction between 0 and 1)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+class LatencyStats:
+    """Keeps the latencies of the most recent requests per endpoint and reports their count, p50, p99 and max."""
+
+    def __init__(self, window=10000):
+        self.window = window
+        self.latencies = {}
+        self.counts = {}
+        self.errors = {}
+
+    def record(self, endpoint, seconds, error=False):
+        self.latencies.setdefault(endpoint, deque(maxlen=self.window)).append(seconds)
+        self.counts[endpoint] = self.counts.get(endpoint, 0) + 1
+        if error:
+            self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+    def summary(self):
+        """Returns the request count, error count and p50/p99/max latency in milliseconds of every endpoint."""
+        summary = {}
+        for endpoint, latencies in self.latencies.items():
+            values = list(latencies)
+            summary[endpoint] = {
+                "requests": self.counts[endpoint],
+                "errors": self.errors.get(endpoint, 0),
+                "p50_ms": round(percentile(values, 0.50) * 1000, 3),
+                "p99_ms": round(percentile(values, 0.99) * 1000, 3),
+                "max_ms": round(max(values) * 1000, 3),
+            }
+        return summary
+
+class RequestError(Exception):
+    """Error in a client request, returned as a 400 response."""
+
+def number_field(body, field, convert, default=None):
+    """Returns a request field converted with convert (int or float), None if it is missing and has no default."""
+    value = body.get(field, default)
+    if value is None:
+        return None
+    try:
+        return convert(value)
+    except (TypeError, ValueError):
+        raise RequestError(f"The '{field}' field must be a number, got {value!r}.")
+
+class PrecursorIndex:
+    """Glycopeptides sorted by neutral mass for precursor mass lookups within a ppm tolerance."""
+
+    def __init__(self):
+        self.masses = []
+        self.glycopeptides = []
+
+    def add(self, glycopeptides):
+        """Adds glycopeptide records to the index, keeping it sorted by glycopeptide mass."""
+        entries = sorted(zip(self.masses + [record.GlycopeptideMass for record in glycopeptides],
+                             self.glycopeptides + list(glycopeptides)), key=lambda entry: entry[0])
+        self.masses = [mass for mass, _ in entries]
+        self.glycopeptides = [record for _, record in entries]
+
+    def lookup(self, mass, tolerance_ppm):
+        """Returns (ppm error, glycopeptide) pairs of the glycopeptides within tolerance_ppm of the neutral mass."""
+        delta = mass * tolerance_ppm / 1e6
+        low = bisect.bisect_left(self.masses, mass - delta)
+        high = bisect.bisect_right(self.masses, mass + delta)
+        return [((self.masses[i] - mass) / mass * 1e6, self.glycopeptides[i]) for i in range(low, high)]
+
+def record_json(record, ion_series=True):
+    """Converts a glycopeptide or peptide record to a JSON-serializable dict."""
+    row = record._asdict()
+    if "MZ" in row:
+        row["MZ"] = list(row["MZ"])
+    if not ion_series:
+        row.pop("IonSeries", None)
+    return row
+
+class GlycopeptideServer:
+    """Holds the glycan library, the configured finders and the precursor index, and answers the JSON requests."""
+
+    def __init__(self, args):
+        self.args = args
+        self.glycans = gsf.load_glycan_records(args.glycosylation, args.glycan)
+        self.finders = OrderedDict()
+        self.finders_lock = threading.Lock()
+        self.index = PrecursorIndex()
+        self.stats = LatencyStats()
+        self.executor = ThreadPoolExecutor(max_workers=args.threads)
+        self.started = time.time()
+
+    def finder(self, protease=None, missed_cleavages=None, charge=None, ion_series=True):
+        """
+        Returns the cached GlycopeptideFinder of a configuration, creating it on first use. Only the max_finders most
+        recently used configurations are kept, so clients cycling through settings cannot grow the cache without bound.
+        """
+        key = ((protease or self.args.protease).lower(),
+               self.args.missed_cleavages if missed_cleavages is None else int(missed_cleavages),
+               self.args.charge if charge is None else int(charge),
+               bool(ion_series))
+        with self.finders_lock:
+            if key in self.finders:
+                self.finders.move_to_end(key)
+                return self.finders[key]
+        try:
+            finder = gsf.GlycopeptideFinder(key[0], key[1], self.args.glycosylation, self.glycans, key[2],
+                                            self.args.peptide_max_length, key[3])
+        except ValueError as error:
+            raise RequestError(str(error))
+        with self.finders_lock:
+            self.finders[key] = finder
+            while len(self.finders) > self.args.max_finders:
+                self.finders.popitem(last=False)
+        return finder
+
+    def load_index(self, fasta_files):
+        """Digests FASTA files with the server configuration and adds their glycopeptides to the precursor index."""
+        finder = self.finder(ion_series=False)
+        for fasta_file in fasta_files:
+            result = finder.run_fasta(fasta_file)
+            self.index.add(result.glycopeptides)
+            print(f"Indexed {len(result.glycopeptides)} glycopeptides from {result.proteins} proteins of {fasta_file}.")
+
+    def digest(self, body):
+        """Answers a /digest request."""
+        if "proteins" in body:
+            if not isinstance(body["proteins"], list) or not all(isinstance(protein, dict) for protein in body["proteins"]):
+                raise RequestError("The 'proteins' field must be a list of objects.")
+            records = [(protein.get("protein_id", ""), protein.get("description", protein.get("protein_id", "")), protein["sequence"])
+                       for protein in body["proteins"]]
+        elif "fasta" in body:
+            records = list(gsf.fasta_buffer_records(body["fasta"].encode()))
+        elif "sequence" in body:
+            protein_id = body.get("protein_id", "")
+            records = [(protein_id, body.get("description", protein_id), body["sequence"])]
+        else:
+            raise RequestError("A digest request needs a 'sequence', 'proteins' or 'fasta' field.")
+
+        ion_series = body.get("ion_series", True)
+        finder = self.finder(body.get("protease"), number_field(body, "missed_cleavages", int),
+                             number_field(body, "charge", int), ion_series)
+        proteins = []
+        for protein in finder.iter_proteins(records):
+            entry = {
+                "ProteinID": protein.ProteinID,
+                "Description": protein.Description,
+                "Species": protein.Species,
+                "TaxonID": protein.TaxonID,
+                "GeneName": protein.GeneName,
+                "peptides": len(protein.Peptides),
+                "glycopeptides": [record_json(record, ion_series) for record in protein.Glycopeptides],
+            }
+            if body.get("include_peptides"):
+                entry["peptide_records"] = [record_json(record) for record in protein.Peptides]
+            proteins.append(entry)
+        return {"protease": finder.protease, "missed_cleavages": finder.missed_cleavages, "charge": finder.charge,
+                "proteins": proteins}
+
+    def mass(self, body):
+        """Answers a /mass request."""
+        if "mass" in body:
+            mass = number_field(body, "mass", float)
+        elif "mz" in body and "charge" in body:
+            charge = number_field(body, "charge", int)
+            mass = number_field(body, "mz", float) * charge - charge * proton
+        else:
+            raise RequestError("A mass request needs a 'mass' field, or 'mz' and 'charge' fields.")
+        if mass is None or mass <= 0:
+            raise RequestError("The precursor mass must be positive.")
+        tolerance_ppm = number_field(body, "tolerance_ppm", float, 10)
+        matches = self.index.lookup(mass, tolerance_ppm)
+        return {"mass": mass, "tolerance_ppm": tolerance_ppm,
+                "matches": [{"ppm_error": round(ppm, 4), **record_json(record, False)} for ppm, record in matches]}
+
+    def health(self):
+        return {
+            "status": "ok",
+            "uptime_s": round(time.time() - self.started, 1),
+            "protease": self.args.protease,
+            "missed_cleavages": self.args.missed_cleavages,
+            "glycosylation_type": self.args.glycosylation,
+            "charge": self.args.charge,
+            "glycans": len(self.glycans),
+            "indexed_glycopeptides": len(self.index.masses),
+        }
+
+    async def route(self, method, path, body):
+        """Dispatches a request and returns its status code and JSON response."""
+        path = path.split("?", 1)[0]
+        if path == "/health":
+            return 200, self.health()
+        if path == "/stats":
+            return 200, self.stats.summary()
+        if path not in ("/digest", "/mass"):
+            return 404, {"error": f"Unknown endpoint {path}."}
+        if method != "POST":
+            return 405, {"error": f"{path} expects a POST request with a JSON body."}
+        try:
+            request = json.loads(body or b"{}")
+        except ValueError as error:
+            raise RequestError(f"Invalid JSON body: {error}")
+        if not isinstance(request, dict):
+            raise RequestError("The JSON body must be an object.")
+        if path == "/mass":
+            return 200, self.mass(request)
+        loop = asyncio.get_running_loop()
+        return 200, await loop.run_in_executor(self.executor, self.digest, request)
+
+    async def handle(self, reader, writer):
+        """Serves the HTTP/1.1 requests of one (keep-alive) connection."""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                start = time.perf_counter()
+                try:
+                    method, path, _ = request_line.decode("latin-1").split(" ", 2)
+                except ValueError:
+                    break
+
+                # Read the headers and the body
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                # Reject an invalid or oversized body size before reading the body, the connection is closed after the response
+                try:
+                    content_length = int(headers.get("content-length", 0))
+                except ValueError:
+                    content_length = -1
+                if content_length < 0:
+                    status, response, body = 400, {"error": "Invalid Content-Length header."}, None
+                elif content_length > self.args.max_body:
+                    status, response, body = 413, {"error": f"Request body of {content_length} bytes exceeds the limit of {self.args.max_body} bytes."}, None
+                else:
+                    body = await reader.readexactly(content_length)
+
+                try:
+                    if body is not None:
+                        status, response = await self.route(method, path, body)
+                except (RequestError, KeyError, TypeError, ValueError) as error:
+                    status, response = 400, {"error": str(error)}
+                except Exception as error:
+                    status, response = 500, {"error": str(error)}
+
+                payload = json.dumps(response).encode()
+                keep_alive = body is not None and headers.get("connection", "").lower() != "close"
+                writer.write(f"HTTP/1.1 {status} {reasons[status]}\r\nContent-Type: application/json\r\n"
+                             f"Content-Length: {len(payload)}\r\nConnection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + payload)
+                await writer.drain()
+                self.stats.record(path.split("?", 1)[0], time.perf_counter() - start, status != 200)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+async def serve(args):
+    """Starts the server and runs it until SIGINT or SIGTERM."""
+    server = GlycopeptideServer(args)
+    server.load_index(args.input or [])
+
+    if args.socket:
+        listener = await asyncio.start_unix_server(server.handle, path=args.socket)
+        address = args.socket
+    else:
+        listener = await asyncio.start_server(server.handle, args.host, args.port)
+        address = f"http://{args.host}:{args.port}"
+    print(f"Glycopeptide Sequence Finder server listening on {address} ({len(server.glycans)} glycans, "
+          f"{len(server.index.masses)} indexed glycopeptides).")
+
+    # Stop on SIGINT or SIGTERM
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signal_number in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signal_number, stop.set)
+    async with listener:
+        await stop.wait()
+
+    # Report the latency of the served requests
+    server.executor.shutdown(wait=False)
+    if args.socket and os.path.exists(args.socket):
+        os.remove(args.socket)
+    print("Server stopped. Latency per endpoint:")
+    for endpoint, summary in server.stats.summary().items():
+        print(f"  {endpoint}: {summary['requests']} requests, p50 {summary['p50_ms']} ms, p99 {summary['p99_ms']} ms, max {summary['max_ms']} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description="Glycopeptide Finder server with libraries held in memory.")
+    parser.add_argument("-i", "--input", nargs="+", help="FASTA files whose glycopeptides are indexed for mass lookups.")
+    parser.add_argument("-g", "--glycosylation", default="N", help="Glycosylation type (N, O, or C). Default is N.")
+    parser.add_argument("-p", "--protease", default="trypsin", help="Default protease to use for cleavage. Default is trypsin.")
+    parser.add_argument("-c", "--missed_cleavages", type=int, default=0, help="Default number of missed cleavages allowed. Default is 0.")
+    parser.add_argument("-m", "--peptide_max_length", type=int, default=25, help="Max peptide length from digestion (default is 25).")
+    parser.add_argument("-y", "--glycan", default=None, help="Path to glycan file (CSV). Default is the built-in library of the glycosylation type.")
+    parser.add_argument("-z", "--charge", type=int, default=3, help="Default maximum charge state (default: 3).")
+    parser.add_argument("--host", default="127.0.0.1", help="Host to listen on (default: 127.0.0.1).")
+    parser.add_argument("--port", type=int, default=8765, help="Port to listen on (default: 8765).")
+    parser.add_argument("-s", "--socket", help="Listen on this Unix socket path instead of TCP.")
+    parser.add_argument("-t", "--threads", type=int, default=4, help="Threads running digest requests (default: 4).")
+    parser.add_argument("--max_finders", type=int, default=16, help="Number of most recently used finder configurations kept in memory (default: 16).")
+    parser.add_argument("--max_body", type=int, default=16 * 1024 * 1024, help="Largest accepted request body in bytes (default: 16 MiB).")
+    args = parser.parse_args()
+
+    # Check the configuration before starting the server
+    try:
+        gsf.GlycopeptideFinder(args.protease, args.missed_cleavages, args.glycosylation, args.glycan, args.charge)
+    except ValueError as error:
+        print(error)
+        return
+
+    asyncio.run(serve(args))
+
+if __name__ == "__main__":
+    main()
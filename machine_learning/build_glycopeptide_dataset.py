@@ -0,0 +1,232 @@
+"""
+build_glycopeptide_dataset.py
+
+Builds a sharded, memory-mapped machine learning dataset from glycopeptide libraries. Every library is streamed in
+chunks through the one-hot encoder (glycopeptide_composition_one_hot_encoder.py) into fixed-size uint8 shards, with
+the protein and organism of every row and optional target columns in shards of the same size, and a manifest.json
+describing them. Only one shard is held in memory while building.
+
+ShardedDataset reads the manifest and memory-maps the shards. It splits the rows into training and validation sets by
+protein or organism (all rows of a group fall on the same side) and iterates deterministic shuffled mini-batches,
+gathering only the rows of each batch from the shards.
+
+    dataset = ShardedDataset("machine_learning/datasets/glycopeptides")
+    train, validation = dataset.split(by="organism", validation_fraction=0.1, seed=0)
+    for x, y in dataset.batches(train, batch_size=256, seed=0, epoch=0):
+        ...
+
+The organism of a library is the first part of its file name (e.g. human_uniprotkb_proteome_..._N-glycopeptides.csv).
+
+Usage:
+    python machine_learning/build_glycopeptide_dataset.py [-i <input_csv> ...] [-o <output_dir>] [--shard_size <rows>] [--chunk_size <rows>] [-t <target_column> ...] [-g <glycan_column>] [--split_by protein|organism] [--validation_fraction <fraction>] [--seed <seed>]
+
+Author:
+    Richard Shipman -- 2025
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+# Import the encoder from the same directory
+script_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, script_dir)
+
+from glycopeptide_composition_one_hot_encoder import ENCODING_SIZE, encode_dense, encode_indices
+
+# Group columns stored with every row
+GROUPS = ["protein", "organism"]
+
+def library_organism(csv_file):
+    """Returns the organism of a library, the first part of its file name."""
+    return os.path.basename(csv_file).split("_")[0]
+
+class ShardWriter:
+    """Collects encoded rows and writes them as fixed-size .npy shards (features, groups and targets)."""
+
+    def __init__(self, output_dir, shard_size, targets):
+        self.output_dir = output_dir
+        self.shard_size = shard_size
+        self.targets = targets
+        self.pending = []
+        self.pending_rows = 0
+        self.shards = []
+
+    def add(self, features, groups, target_values):
+        """Adds encoded rows and writes every full shard."""
+        self.pending.append((features, groups, target_values))
+        self.pending_rows += len(features)
+        while self.pending_rows >= self.shard_size:
+            self.write(self.shard_size)
+
+    def write(self, rows):
+        """Writes the first rows of the pending chunks as one shard."""
+        features, groups, target_values = (np.concatenate(arrays) for arrays in zip(*self.pending))
+        name = f"shard_{len(self.shards):05d}"
+        shard = {"rows": rows, "features": f"{name}_x.npy", "groups": f"{name}_groups.npy"}
+        np.save(os.path.join(self.output_dir, shard["features"]), features[:rows])
+        np.save(os.path.join(self.output_dir, shard["groups"]), groups[:rows])
+        if self.targets:
+            shard["targets"] = f"{name}_y.npy"
+            np.save(os.path.join(self.output_dir, shard["targets"]), target_values[:rows])
+        self.shards.append(shard)
+
+        # Keep the remaining rows for the next shard
+        self.pending = [(features[rows:], groups[rows:], target_values[rows:])] if rows < len(features) else []
+        self.pending_rows = len(features) - rows
+
+    def close(self):
+        """Writes the last, partial shard."""
+        if self.pending_rows:
+            self.write(self.pending_rows)
+
+def build_dataset(input_files, output_dir, shard_size=100000, chunk_size=50000, targets=(),
+                  glycan_col="ShorthandGlycan"):
+    """
+    Streams the libraries through the one-hot encoder into shards and writes the manifest. Libraries without the
+    required columns are skipped. Returns the manifest.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    targets = list(targets)
+    columns = ["ProteinID", "Peptide", glycan_col, "Charge"] + targets
+    writer = ShardWriter(output_dir, shard_size, targets)
+    proteins, organisms = {}, {}
+    sources = []
+
+    for csv_file in input_files:
+        missing = [column for column in columns if column not in pd.read_csv(csv_file, nrows=0).columns]
+        if missing:
+            print(f"Skipping {csv_file}: missing columns {', '.join(missing)}")
+            continue
+        organism = organisms.setdefault(library_organism(csv_file), len(organisms))
+        rows = 0
+        for df in pd.read_csv(csv_file, usecols=columns, chunksize=chunk_size):
+            features = encode_dense(encode_indices(df["Peptide"].astype(str).tolist(), df[glycan_col].tolist(),
+                                                   df["Charge"].to_numpy()))
+
+            # Global protein codes, assigned in order of appearance
+            codes, unique_proteins = pd.factorize(df["ProteinID"])
+            protein_codes = np.array([proteins.setdefault(protein, len(proteins)) for protein in unique_proteins],
+                                     dtype=np.int32)
+            groups = np.stack([protein_codes[codes], np.full(len(df), organism, dtype=np.int32)], axis=1)
+
+            target_values = df[targets].to_numpy(dtype=np.float32) if targets else np.zeros((len(df), 0), np.float32)
+            writer.add(features, groups, target_values)
+            rows += len(df)
+        sources.append({"file": os.path.basename(csv_file), "organism": library_organism(csv_file), "rows": rows})
+    writer.close()
+
+    manifest = {
+        "encoding_size": ENCODING_SIZE,
+        "shard_size": shard_size,
+        "rows": sum(shard["rows"] for shard in writer.shards),
+        "groups": GROUPS,
+        "targets": targets,
+        "shards": writer.shards,
+        "proteins": list(proteins),
+        "organisms": list(organisms),
+        "sources": sources,
+    }
+    with open(os.path.join(output_dir, "manifest.json"), "w") as file:
+        json.dump(manifest, file, indent=1)
+    return manifest
+
+class ShardedDataset:
+    """Memory-mapped dataset of the shards of a manifest, with group splits and shuffled mini-batches."""
+
+    def __init__(self, dataset_dir):
+        self.dataset_dir = dataset_dir
+        with open(os.path.join(dataset_dir, "manifest.json")) as file:
+            self.manifest = json.load(file)
+        self.shards = self.manifest["shards"]
+        self.offsets = np.concatenate([[0], np.cumsum([shard["rows"] for shard in self.shards])]).astype(np.int64)
+        self.cache = {}
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    def shard_array(self, shard, kind):
+        """Returns the memory-mapped features, groups or targets array of a shard."""
+        key = (shard, kind)
+        if key not in self.cache:
+            self.cache[key] = np.load(os.path.join(self.dataset_dir, self.shards[shard][kind]), mmap_mode="r")
+        return self.cache[key]
+
+    def groups(self, by="protein"):
+        """Returns the protein or organism code of every row, read shard by shard."""
+        column = GROUPS.index(by)
+        return np.concatenate([self.shard_array(shard, "groups")[:, column] for shard in range(len(self.shards))])
+
+    def split(self, by="protein", validation_fraction=0.1, seed=0):
+        """
+        Splits the row indices into training and validation sets by protein or organism: the groups are shuffled with
+        the seed and the first validation_fraction of them (at least one) make up the validation set.
+        """
+        groups = self.groups(by)
+        group_count = len(self.manifest["proteins" if by == "protein" else "organisms"])
+        order = np.random.default_rng(seed).permutation(group_count)
+        validation_groups = np.zeros(group_count, dtype=bool)
+        validation_groups[order[:max(1, round(group_count * validation_fraction))]] = True
+        is_validation = validation_groups[groups]
+        return np.flatnonzero(~is_validation), np.flatnonzero(is_validation)
+
+    def gather(self, indices, kind="features"):
+        """Returns the rows of the given indices, reading every shard once."""
+        shards = np.searchsorted(self.offsets, indices, side="right") - 1
+        first = self.shard_array(0, kind)
+        rows = np.empty((len(indices),) + first.shape[1:], dtype=first.dtype)
+        for shard in np.unique(shards):
+            positions = np.flatnonzero(shards == shard)
+            local = indices[positions] - self.offsets[shard]
+            order = np.argsort(local)  # Read in file order
+            rows[positions[order]] = self.shard_array(shard, kind)[local[order]]
+        return rows
+
+    def batches(self, indices=None, batch_size=256, seed=0, epoch=0, shuffle=True):
+        """
+        Yields (features, targets) mini-batches of the given row indices (default: all rows). The order is a
+        permutation seeded by (seed, epoch), so every epoch is shuffled differently and reproducibly. Targets are None
+        when the dataset has none.
+        """
+        indices = np.arange(len(self)) if indices is None else np.asarray(indices, dtype=np.int64)
+        if shuffle:
+            indices = np.random.default_rng([seed, epoch]).permutation(indices)
+        for start in range(0, len(indices), batch_size):
+            batch = indices[start:start + batch_size]
+            targets = self.gather(batch, "targets") if self.manifest["targets"] else None
+            yield self.gather(batch), targets
+
+def main():
+    default_inputs = os.path.join(os.path.dirname(script_dir), "digested_glycopeptide_library", "*.csv")
+    parser = argparse.ArgumentParser(description="Build a sharded, memory-mapped one-hot encoded glycopeptide dataset.")
+    parser.add_argument("-i", "--input", nargs="+", help="Input glycopeptide library CSV files (default: digested_glycopeptide_library/*.csv).")
+    parser.add_argument("-o", "--output", default=os.path.join(script_dir, "datasets", "glycopeptides"), help="Output dataset directory (default: machine_learning/datasets/glycopeptides).")
+    parser.add_argument("--shard_size", type=int, default=100000, help="Rows per shard (default: 100000).")
+    parser.add_argument("--chunk_size", type=int, default=50000, help="Rows read and encoded at a time (default: 50000).")
+    parser.add_argument("-t", "--targets", nargs="*", default=[], help="Numeric columns stored as targets, e.g. Hydrophobicity GlycopeptideMass.")
+    parser.add_argument("-g", "--glycan", default="ShorthandGlycan", help="Column name for glycan composition (default: 'ShorthandGlycan').")
+    parser.add_argument("--split_by", choices=GROUPS, help="Print the training and validation sizes of a split by protein or organism.")
+    parser.add_argument("--validation_fraction", type=float, default=0.1, help="Fraction of groups in the validation set (default: 0.1).")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the split (default: 0).")
+    args = parser.parse_args()
+
+    input_files = args.input or sorted(glob.glob(default_inputs))
+    if not input_files:
+        parser.error("No input files.")
+
+    start_time = time.perf_counter()
+    manifest = build_dataset(input_files, args.output, args.shard_size, args.chunk_size, args.targets, args.glycan)
+    print(f"{manifest['rows']} glycopeptides from {len(manifest['sources'])} libraries written to {len(manifest['shards'])} shards "
+          f"in {args.output} in {time.perf_counter() - start_time:.2f} seconds.")
+
+    if args.split_by:
+        train, validation = ShardedDataset(args.output).split(args.split_by, args.validation_fraction, args.seed)
+        print(f"Split by {args.split_by}: {len(train)} training, {len(validation)} validation glycopeptides.")
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,29 @@
+"""
+glycopeptide_composition_one_hot_encoder.py
+
+One-hot encodes glycopeptides (peptide sequence, glycan composition and charge state) for machine learning. Each
+glycopeptide is a vector of MAX_PEPTIDE_LENGTH x 20 amino acid positions, MAX_GLYCAN_LENGTH x 4 monosaccharide
+positions and MAX_CHARGE charge states.
+
+The encoder works in batch: peptides are byte-encoded into a fixed-width array and mapped to column indices with a
+lookup table, glycan compositions are parsed once per distinct glycan, and the input is read in chunks. The output is
+the original CSV with the encodings as lists (csv), a sparse CSR matrix (npz, loadable with scipy.sparse.load_npz) or
+a uint8 memory-mapped matrix (npy, loadable with numpy.load(mmap_mode="r")), with rows in input order.
+
+Usage:
+    python machine_learning/glycopeptide_composition_one_hot_encoder.py -i <input_csv> [-o <output_file>] [-f csv|npz|npy] [--chunk_size <rows>] [-p <peptide_column>] [-g <glycan_column>] [-z <charge_column>] [-d [<definition_file>]]
+
+Author:
+    Richard Shipman -- 2025
+"""
 import numpy as np
 import pandas as pd
 import re
 import argparse
 import os
+import tempfile
+import time
+import zipfile
 
 # Define Encoding Definitions
 
@@ -17,17 +38,15 @@ MAX_GLYCAN_LENGTH = 30 # defines the maximum length of the glycan sequence
 # Charge states (Max charge = 5)
 MAX_CHARGE = 5 # defines max charge state in the encoding
 
-def encode_peptide(peptide):
-    """Encode peptide composition as a 50x20 matrix."""
-    
-    # Initialize the encoding matrix
-    encoding = np.zeros((MAX_PEPTIDE_LENGTH, len(AA_DICT)))
-    
-    # Encode each amino acid in the peptide sequence
-    for i, aa in enumerate(peptide[:MAX_PEPTIDE_LENGTH]):
-        if aa in AA_DICT:
-            encoding[i, AA_DICT[aa]] = 1
-    return encoding
+# Total size of the encoding and the first column of the glycan and charge blocks
+GLYCAN_OFFSET = MAX_PEPTIDE_LENGTH * len(AA_DICT)
+CHARGE_OFFSET = GLYCAN_OFFSET + MAX_GLYCAN_LENGTH * len(GLYCAN_MONOSACCHARIDES)
+ENCODING_SIZE = CHARGE_OFFSET + MAX_CHARGE
+
+# Amino acid index of every byte value (-1 for padding and unknown residues)
+AA_LOOKUP = np.full(256, -1, dtype=np.int32)
+for aa, index in AA_DICT.items():
+    AA_LOOKUP[ord(aa)] = index
 
 def glycan_composition_to_sequence(glycan_composition):
     # Define the mapping for the monosaccharides
@@ -54,44 +73,111 @@ def glycan_composition_to_sequence(glycan_composition):
     
     return glycan_sequence
 
-def encode_glycan(glycan_sequence):
-    # Define the possible monosaccharides and their corresponding index
-    monosaccharides = GLYCAN_MONOSACCHARIDES
-    encoding = np.zeros((MAX_GLYCAN_LENGTH, len(GLYCAN_MONOSACCHARIDES)), dtype=int)  # Initialize the encoding matrix
-    
-    # Iterate through the sequence and encode each monosaccharide
-    position = 0
-    for i, monosaccharide in enumerate(glycan_sequence):
-        if position >= MAX_GLYCAN_LENGTH:
-            break  # Stop encoding if we exceed the maximum length
-        # Set the correct column for the current monosaccharide
-        if monosaccharide in monosaccharides:
-            # The index of the monosaccharide in the row (N=0, H=1, F=2, A=3)
-            monosaccharide_idx = monosaccharides.index(monosaccharide)
-            encoding[position, monosaccharide_idx] = 1
-            position += 1
-    
-    return encoding
+def glycan_counts(glycans):
+    """Returns the monosaccharide counts (rows x GLYCAN_MONOSACCHARIDES) of glycan compositions, parsing each distinct glycan once."""
+    codes, unique_glycans = pd.factorize(pd.Series(glycans, dtype=object).fillna(""))
+    pattern = '|'.join(GLYCAN_MONOSACCHARIDES)
+    unique_counts = np.zeros((len(unique_glycans), len(GLYCAN_MONOSACCHARIDES)), dtype=np.int32)
+    for row, glycan in enumerate(unique_glycans):
+        for monosaccharide, count in re.findall(rf'({pattern})(\d+)', str(glycan)):
+            unique_counts[row, GLYCAN_MONOSACCHARIDES.index(monosaccharide)] += int(count)
+    return unique_counts[codes]
 
-def encode_charge(charge):
-    """Encode charge state (Z) as a one-hot vector with 10 columns."""
-    encoding = np.zeros((1, MAX_CHARGE))
-    if 1 <= charge <= MAX_CHARGE:
-        encoding[0, charge - 1] = 1
-    return encoding
+def encode_indices(peptides, glycans, charges):
+    """
+    Returns the column indices of the ones of every glycopeptide as a rows x (MAX_PEPTIDE_LENGTH + MAX_GLYCAN_LENGTH + 1)
+    array, -1 where a position is empty. Every amino acid of the peptide (up to MAX_PEPTIDE_LENGTH), every monosaccharide
+    of glycan_composition_to_sequence(glycan) (up to MAX_GLYCAN_LENGTH) and a charge from 1 to MAX_CHARGE sets one column.
+    """
+    # Peptide positions: byte-encode as a fixed-width array (truncated and zero padded) and look up the amino acids
+    peptide_bytes = np.array(list(peptides), dtype=f"S{MAX_PEPTIDE_LENGTH}")
+    residues = AA_LOOKUP[peptide_bytes.view(np.uint8).reshape(len(peptide_bytes), -1)]
+    residues = np.pad(residues, ((0, 0), (0, MAX_PEPTIDE_LENGTH - residues.shape[1])), constant_values=-1)
+    positions = np.arange(MAX_PEPTIDE_LENGTH) * len(AA_DICT)
+    peptide_columns = np.where(residues >= 0, positions + residues, -1)
 
-def encode_glycopeptide(peptide, glycan, charge):
-    """Create a feature vector from peptide composition, glycan composition, and charge state."""
-    
-    # Encode peptide, glycan, and charge
-    peptide_encoded = encode_peptide(peptide)
-    glycan_encoded = encode_glycan(glycan)
-    charge_encoded = encode_charge(charge)
+    # Glycan positions: the sequence is every monosaccharide repeated by its count, in GLYCAN_MONOSACCHARIDES order
+    boundaries = np.cumsum(glycan_counts(glycans), axis=1)
+    glycan_positions = np.arange(MAX_GLYCAN_LENGTH)
+    monosaccharides = (glycan_positions[None, :, None] >= boundaries[:, None, :]).sum(axis=2)
+    glycan_columns = np.where(monosaccharides < len(GLYCAN_MONOSACCHARIDES),
+                              GLYCAN_OFFSET + glycan_positions * len(GLYCAN_MONOSACCHARIDES) + monosaccharides, -1)
 
-    # Concatenate the encoded features into a single vector
-    feature_vector = np.concatenate([peptide_encoded.flatten(), glycan_encoded.flatten(), charge_encoded.flatten()])
-    
-    return feature_vector
+    # Charge state
+    charges = np.asarray(charges, dtype=np.int64)
+    charge_columns = np.where((charges >= 1) & (charges <= MAX_CHARGE), CHARGE_OFFSET + charges - 1, -1)
+
+    return np.concatenate([peptide_columns, glycan_columns, charge_columns[:, None]], axis=1).astype(np.int32)
+
+def encode_dense(indices, dtype=np.uint8):
+    """Returns the dense one-hot matrix of encode_indices output."""
+    encoded = np.zeros((len(indices), ENCODING_SIZE), dtype=dtype)
+    rows, positions = np.nonzero(indices >= 0)
+    encoded[rows, indices[rows, positions]] = 1
+    return encoded
+
+def read_chunks(input_file, columns, chunk_size):
+    """Yields the peptide, glycan and charge columns of the input CSV in chunks."""
+    peptide_col, glycan_col, charge_col = columns
+    for df in pd.read_csv(input_file, usecols=list(columns), chunksize=chunk_size):
+        yield df[peptide_col].astype(str).tolist(), df[glycan_col].tolist(), df[charge_col].to_numpy()
+
+def write_npz_member(archive, name, chunks, dtype, length):
+    """Writes a 1-D array of the given dtype and length to an npz archive, chunk by chunk."""
+    dtype = np.dtype(dtype)
+    with archive.open(f"{name}.npy", "w", force_zip64=True) as member:
+        np.lib.format.write_array_header_1_0(member, {"descr": np.lib.format.dtype_to_descr(dtype),
+                                                      "fortran_order": False, "shape": (length,)})
+        for chunk in chunks:
+            member.write(np.asarray(chunk, dtype=dtype).tobytes())
+
+def read_spool(spool, dtype, block=1 << 20):
+    """Yields the values of a spool file in blocks."""
+    dtype = np.dtype(dtype)
+    spool.seek(0)
+    while data := spool.read(block * dtype.itemsize):
+        yield np.frombuffer(data, dtype=dtype)
+
+def write_csr(input_file, output_file, columns, chunk_size):
+    """
+    Encodes the input in chunks and writes a sparse CSR matrix in the scipy.sparse.save_npz format (data, indices,
+    indptr, format, shape), without requiring scipy. The indices and row pointers of every chunk are appended to spool
+    files, and the archive is written from them once the shape is known, so memory stays bounded by the chunk size.
+    Returns the number of rows.
+    """
+    rows = nonzeros = 0
+    with tempfile.TemporaryFile() as indices_spool, tempfile.TemporaryFile() as indptr_spool:
+        indptr_spool.write(np.zeros(1, dtype=np.int64).tobytes())
+        for peptides, glycans, charges in read_chunks(input_file, columns, chunk_size):
+            chunk = encode_indices(peptides, glycans, charges)
+            mask = chunk >= 0
+            indices_spool.write(chunk[mask].tobytes())  # Row-major, so the columns of every row are sorted
+            indptr_spool.write((nonzeros + np.cumsum(mask.sum(axis=1), dtype=np.int64)).tobytes())
+            nonzeros += int(mask.sum())
+            rows += len(chunk)
+
+        indptr_dtype = np.int32 if nonzeros < 2**31 else np.int64
+        with zipfile.ZipFile(output_file, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+            ones = (np.ones(len(block), dtype=np.uint8) for block in read_spool(indices_spool, np.int32))
+            write_npz_member(archive, "data", ones, np.uint8, nonzeros)
+            write_npz_member(archive, "indices", read_spool(indices_spool, np.int32), np.int32, nonzeros)
+            write_npz_member(archive, "indptr", read_spool(indptr_spool, np.int64), indptr_dtype, rows + 1)
+            with archive.open("format.npy", "w") as member:
+                np.lib.format.write_array(member, np.array(b"csr"))
+            with archive.open("shape.npy", "w") as member:
+                np.lib.format.write_array(member, np.array([rows, ENCODING_SIZE]))
+    return rows
+
+def write_memmap(input_file, output_file, columns, chunk_size):
+    """Encodes the input in chunks into a uint8 memory-mapped .npy matrix. Returns the number of rows."""
+    rows = sum(len(df) for df in pd.read_csv(input_file, usecols=[columns[0]], chunksize=chunk_size))
+    encoded = np.lib.format.open_memmap(output_file, mode="w+", dtype=np.uint8, shape=(rows, ENCODING_SIZE))
+    start = 0
+    for peptides, glycans, charges in read_chunks(input_file, columns, chunk_size):
+        encoded[start:start + len(peptides)] = encode_dense(encode_indices(peptides, glycans, charges))
+        start += len(peptides)
+    encoded.flush()
+    return rows
 
 def generate_encoding_definition(output_file):
     """Generate a CSV file that defines the encoding format."""
@@ -118,12 +204,6 @@ def generate_encoding_definition(output_file):
     df_definitions.to_csv(output_file, index=False)
     print(f"Encoding definition saved as '{output_file}', total encoding size: {encoding_size}")
 
-def count_ones_zeros(one_hot_vector):
-    """Count the number of 1s and 0s in a one-hot encoded vector."""
-    ones_count = np.sum(one_hot_vector)  # Count total 1s
-    zeros_count = len(one_hot_vector) - ones_count  # Total size - 1s gives 0s
-    return ones_count, zeros_count
-
 def main():
     parser = argparse.ArgumentParser(description="Encode glycopeptides with one-hot encoding.")
     parser.add_argument('-i', '--input', required=True, help="Input CSV file")
@@ -132,6 +212,8 @@ def main():
     parser.add_argument('-g', '--glycan', default='ShorthandGlycan', help="Column name for glycan composition (default: 'glycan')")
     parser.add_argument('-z', '--charge', default='Charge', help="Column name for charge state (default: 'charge')")
     parser.add_argument('-d', '--definition', nargs='?', const=os.path.join('one_hot_encodings', 'encoding_definition.txt'), help="Output CSV file for encoding definition (default: 'one_hot_encodings/encoding_definition.txt')")
+    parser.add_argument('-f', '--format', choices=['csv', 'npz', 'npy'], default='csv', help="Output format: the input CSV with encoding lists (csv), a sparse CSR matrix (npz) or a uint8 memory-mapped matrix (npy) (default: csv)")
+    parser.add_argument('--chunk_size', type=int, default=100000, help="Rows encoded at a time for npz and npy output (default: 100000)")
 
     # Parse arguments
     args = parser.parse_args()
@@ -139,16 +221,27 @@ def main():
     input_file = args.input
     output_dir = 'one_hot_encodings'
     os.makedirs(output_dir, exist_ok=True)
-    output_file = args.output if args.output else os.path.join(output_dir, os.path.splitext(os.path.basename(input_file))[0] + '_onehotencoded.csv')
+    suffix = '_onehotencoded.csv' if args.format == 'csv' else f'_onehotencoded.{args.format}'
+    output_file = args.output if args.output else os.path.join(output_dir, os.path.splitext(os.path.basename(input_file))[0] + suffix)
     peptide_col = args.peptide
     glycan_col = args.glycan
     charge_col = args.charge
+
+    # Sparse or memory-mapped output, encoded in chunks
+    if args.format != 'csv':
+        start_time = time.perf_counter()
+        writer = write_csr if args.format == 'npz' else write_memmap
+        rows = writer(input_file, output_file, (peptide_col, glycan_col, charge_col), args.chunk_size)
+        print(f"Encoded {rows} glycopeptides ({ENCODING_SIZE} features) in {time.perf_counter() - start_time:.2f} seconds, saved as '{output_file}'")
+        if args.definition:
+            generate_encoding_definition(args.definition)
+        return
     
     # Read input data
     df = pd.read_csv(input_file)
     
     # Encode all glycopeptides
-    encoded_data = np.array([encode_glycopeptide(row[peptide_col], glycan_composition_to_sequence(row[glycan_col]), row[charge_col]) for _, row in df.iterrows()])
+    encoded_data = encode_dense(encode_indices(df[peptide_col].astype(str), df[glycan_col], df[charge_col]), dtype=np.float64)
     
     # Add glycan composition sequence as a new column
     df['Glycan_Composition_Sequence'] = df[glycan_col].apply(glycan_composition_to_sequence)
@@ -162,8 +255,9 @@ def main():
     df['One_Hot_Encoding'] = [list(encoded_data[i]) for i in range(len(df))]
 
     # Add the number of 1s and 0s in the one-hot encoding
-    df['Ones_Count'] = df['One_Hot_Encoding'].apply(lambda x: count_ones_zeros(x)[0])
-    df['Zeros_Count'] = df['One_Hot_Encoding'].apply(lambda x: count_ones_zeros(x)[1])
+    ones_count = encoded_data.sum(axis=1)
+    df['Ones_Count'] = ones_count
+    df['Zeros_Count'] = ENCODING_SIZE - ones_count
     
     # Save the output
     df.to_csv(output_file, index=False)
@@ -0,0 +1,46 @@
+"""
+mock_mass_spectra_core.py
+
+Ion labels, mock intensities and titles of the mock mass spectra of glycopeptide library rows, shared by
+plot_mock_mass_spectra.py and export_mock_mass_spectra.py. It depends on the standard library only, so the exporter
+does not import matplotlib.
+
+Author:
+    Richard Shipman -- 2025
+"""
+
+# Line lengths (mock intensities) of the ion types
+ion_length_map = {'b': 10, 'y': 20, 'c': 30, 'z': 40, 'Y': 60, '2Y': 65, 'B': 50, 'oxonium': 70}
+
+# Columns read from the glycopeptide library
+plot_columns = ['ProteinID', 'Site', 'Peptide', 'Composition', 'GlyToucan_AC', 'GlycopeptideMass', 'GlycanMass',
+                'PeptideMass', 'IonSeries']
+
+def ion_labels(ion_series):
+    """Returns the m/z values and labels of every ion type of an ion series."""
+    ions = {}
+    for ion_type, values in ion_series.items():
+        if isinstance(values, list):  # For b, y, c, z ions
+            ions[ion_type] = (values, [f"{ion_type}{i + 1}" for i in range(len(values))])
+        elif isinstance(values, dict):  # For Y, B, oxonium ions
+            ions[ion_type] = (list(values.values()), list(values.keys()))
+    return ions
+
+def site_label(site):
+    """Returns the site as an integer when it is a whole number (Site is read as float from older libraries)."""
+    try:
+        value = float(site)
+    except (TypeError, ValueError):
+        return site
+    return int(value) if value.is_integer() else value
+
+def plot_title(row):
+    """Returns the title and output file name of a glycopeptide row."""
+    protein = row['ProteinID']
+    site = site_label(row['Site'])
+    title = (f"Glycopeptide Sequence Finder: Mock Glycopeptide Mass Spectrum (HCD: b, y ions / ETD: c, z ions)\n"
+             f"Protein Identifer: {protein}, Glycopeptide Mass: {row['GlycopeptideMass']}\n"
+             f"Site: {site}, Peptide: {row['Peptide']}, Peptide Mass: {row['PeptideMass']}\n"
+             f"Glycan Composition: {row['Composition']}, GlyToucan: {row['GlyToucan_AC']}, Glycan Mass: {row['GlycanMass']}")
+    file_name = f"{protein}_{site}_{row['Peptide']}_{row['GlyToucan_AC']}_mock_mass_spectrum.png".replace('|', '_')
+    return title, file_name
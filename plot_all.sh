@@ -1,7 +1,5 @@
-
 input_dir="digested_glycopeptide_library"
 cores=4
 
-ls ${input_dir}/*.csv | xargs -I {} -P ${cores} python plot_mock_mass_spectra.py -i "{}"
-
-#
\ No newline at end of file
+# One interpreter and one pool of rendering processes for every CSV file; plots newer than their CSV are skipped
+python plot_mock_mass_spectra.py -i ${input_dir}/*.csv -w ${cores}
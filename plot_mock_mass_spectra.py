@@ -1,246 +1,256 @@
+"""
+plot_mock_mass_spectra.py
+
+Plots mock mass spectra from the IonSeries of glycopeptide library CSV files, one PNG per glycopeptide. Rows are
+rendered in batch on the Agg backend: every worker process of a persistent pool keeps one figure with its static axes
+drawn once, draws the ions of each type and their labels as collections, and plots that are newer than their input
+CSV are skipped.
+
+Usage:
+    python plot_mock_mass_spectra.py -i <input_csv> [<input_csv> ...] [-o <output_dir>] [-w <workers>] [--chunk_size <rows>] [--force]
+
+Author:
+    Richard Shipman -- 2025
+"""
+import matplotlib
+matplotlib.use("Agg")  # Render without a display
+
 import pandas as pd
 import matplotlib.pyplot as plt
-import matplotlib.patheffects as path_effects
+from matplotlib.lines import Line2D
+from matplotlib.collections import PathCollection
+from matplotlib.font_manager import FontProperties
+from matplotlib.textpath import TextPath
+from matplotlib.transforms import Affine2D
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
 import os
 import argparse
 import ast  # To safely parse the IonSeries string into a dictionary
+import time
+import zlib
 
-def read_input_data(csv_file):
-  """"""
-  return pd.read_csv(csv_file)
+import numpy as np
+from PIL import Image
+
+from mock_mass_spectra_core import ion_labels, ion_length_map, plot_columns, plot_title
 
 def create_output_directory(output_dir):
   """Create output directory function"""
   if not os.path.exists(output_dir):
     os.makedirs(output_dir)
 
-def define_colors(df):
-    """Define a color mapping function for ion types in mass spectrometry data."""
-    
-    # Predefined color mapping for common ion types
-    color_mapping = {
-        "b": "blue",      # HCD
-        "y": "green",     # HCD
-        "c": "gold",      # ETD
-        "z": "hotpink",   # ETD
-        "Y": "red",       # Large fragment
-        "B": "darkorange",# Large fragment
-        "oxonium": "purple" # Small diagnostic ions
-    }
-    
-    # Convert IonSeries from string to dictionary if necessary
-    df['IonSeries'] = df['IonSeries'].apply(lambda x: ast.literal_eval(x) if isinstance(x, str) else x)
-
-    # Identify unique ion types present in the dataset
-    unique_ions = {ion for ion_series in df['IonSeries'] for ion in ion_series.keys()}
-
-    # Additional colors for unknown ion types
-    additional_colors = [
-        "cyan", "magenta", "lime", "brown", "gray", "teal"
-    ]
-
-    # Assign colors to any new ion types
-    for ion in unique_ions:
-        if ion not in color_mapping:
-            color_mapping[ion] = additional_colors.pop(0) if additional_colors else "black"
-
-    return color_mapping
-
-def compute_ion_number(row):
-    """Compute Ion numbers for each ion series and return in a formatted string"""
-    ion_series = row['IonSeries']
-    ion_numbers = []
-
-    # Process b ions
-    if 'b' in ion_series:
-        b_ions = [f"b{i+1}" for i in range(len(ion_series['b']))]
-        ion_numbers.extend(b_ions)
-    
-    # Process y ions 
-    if 'y' in ion_series:
-        y_ions = [f"y{i+1}" for i in range(len(ion_series['y']))]
-        ion_numbers.extend(y_ions)  
-    
-    # Process c ions
-    if 'c' in ion_series:
-        c_ions = [f"c{i+1}" for i in range(len(ion_series['c']))]
-        ion_numbers.extend(c_ions)
-    
-    # Process z ions 
-    if 'z' in ion_series:
-        z_ions = [f"z{i+1}" for i in range(len(ion_series['z']))]
-        ion_numbers.extend(z_ions)
-    
-    # Process Y ions
-    if 'Y' in ion_series:
-        Y_ions = [f"Y{i}" for i in range(len(ion_series['Y']))]
-        ion_numbers.extend(Y_ions)
-    
-    # Process B ions
-    if 'B' in ion_series:
-        B_ions = [f"B{i}" for i in range(len(ion_series['B']))]
-        ion_numbers.extend(B_ions)
-    
-    # Process Oxonium ions
-    if 'oxonium' in ion_series:
-        oxonium_ions = [f"ox{i}" for i in range(len(ion_series['oxonium']))]
-        ion_numbers.extend(oxonium_ions)
-
-    return ', '.join(ion_numbers)
-
-def create_mass_spectrum_plot(df, color_mapping, title):
-    """Plot mass spectrum with ion numbers as labels and variable ion line length, distinguishing ETD and HCD ions."""
-    fig, ax = plt.subplots(figsize=(12, 8))
-
-    # Define custom line lengths for each ion type
-    ion_length_map = {
-        'b': 10,  # b ions (HCD)
-        'y': 20,  # y ions (HCD)
-        'c': 30,  # c ions (ETD)
-        'z': 40,   # z ions (ETD)
-        'Y': 60,  # Y ions
-        '2Y':65, # Y ions 2+ charge state
-        'B': 50,  # B ions
-        'oxonium': 70,  # Oxonium ions
-    }
-
-    # Define line styles to differentiate ion types
-    ion_style_map = {
-        'b': '-',  # Solid line for HCD
-        'y': '-',  # Solid line for HCD
-        'c': '--', # Dashed line for ETD
-        'z': '--', # Dashed line for ETD
-        'Y': ':',  # Dotted line
-        '2Y': ':', # Plus for 2Y+ plus charge state
-        'B': '-.', # Dash-dot line
-        'oxonium': ':' # Dotted line
-    }
-
-    # Store legend handles
-    legend_handles = {}
-
-    # Iterate over the DataFrame
-    for _, row in df.iterrows():
-        ion_series = row['IonSeries']
-
-        for ion_type, values in ion_series.items():
-            if isinstance(values, list):  # For b, y, c, z ions
-                total_length = len(values)
-
-                for i, mz in enumerate(values, start=0):
-                    ion_number = i + 1
-                    ion_label = f"{ion_type}{ion_number}"
-                    line_length = ion_length_map.get(ion_type, 50)
-                    color = color_mapping.get(ion_type, "black")
-                    linestyle = ion_style_map.get(ion_type, "-")  # Default to solid
-
-                    ax.vlines(mz, 0, line_length, color=color, lw=2, linestyle=linestyle)
-
-                    # Add text label with white outline
-                    text = ax.text(mz, line_length, ion_label, rotation=90, verticalalignment='bottom', fontsize=8, color='black')
-                    text.set_path_effects([path_effects.Stroke(linewidth=3, foreground="white"), path_effects.Normal()])
-
-                    # Add to legend if not already present
-                    if ion_type not in legend_handles:
-                        label = f"{ion_type} ({'HCD' if ion_type in ['b', 'y'] else 'ETD'})"
-                        legend_handles[ion_type] = plt.Line2D([0], [0], color=color, lw=2, linestyle=linestyle, label=label)
-
-            elif isinstance(values, dict):  # For Y, B, oxonium ions
-                for ion_name, mz in values.items():
-                    line_length = ion_length_map.get(ion_type, 50)
-                    color = color_mapping.get(ion_type, "black")
-                    linestyle = ion_style_map.get(ion_type, "-")
-
-                    ax.vlines(mz, 0, line_length, color=color, lw=2, linestyle=linestyle)
-
-                    # Add text label with white outline
-                    text = ax.text(mz, line_length, ion_name, rotation=90, verticalalignment='bottom', fontsize=8, color='black')
-                    text.set_path_effects([path_effects.Stroke(linewidth=3, foreground="white"), path_effects.Normal()])
-
-                    # Add to legend if not already present
-                    if ion_type not in legend_handles:
-                        legend_handles[ion_type] = plt.Line2D([0], [0], color=color, lw=2, linestyle=linestyle, label=ion_type)
-
-    # Add the legend
-    ax.legend(handles=legend_handles.values(), title="Ion Types", loc="upper right", fontsize=8)
-
-    ax.set_xlabel("Calculated m/z values (Da)")
-    ax.set_ylabel("Intensity (%) (Mock values)")
-    ax.set_title(title)
-    ax.set_ylim(0, 100)  # Adjust based on the plot
-    plt.tight_layout()
-    return fig, ax
-
-def save_plot(fig, output_file):
-  """Save plot to output location"""
-  fig.savefig(output_file)
-  plt.close(fig)
-  print(f"Plot saved to {output_file}")
+# Colors of the common ion types; other ion types get an additional color chosen from their name, so every plot and
+# worker process colors them the same
+color_mapping = {
+    "b": "blue",      # HCD
+    "y": "green",     # HCD
+    "c": "gold",      # ETD
+    "z": "hotpink",   # ETD
+    "Y": "red",       # Large fragment
+    "B": "darkorange",# Large fragment
+    "oxonium": "purple" # Small diagnostic ions
+}
+additional_colors = ["cyan", "magenta", "lime", "brown", "gray", "teal"]
+
+def ion_color(ion_type):
+    """Returns the color of an ion type."""
+    if ion_type in color_mapping:
+        return color_mapping[ion_type]
+    return additional_colors[zlib.crc32(ion_type.encode()) % len(additional_colors)]
+
+# Line styles of the ion types
+# (HCD b/y ions solid, ETD c/z ions dashed, glycan Y ions and 2+ Y ions dotted, B ions dash-dot, oxonium ions dotted)
+ion_style_map = {'b': '-', 'y': '-', 'c': '--', 'z': '--', 'Y': ':', '2Y': ':', 'B': '-.', 'oxonium': ':'}
+
+@lru_cache(maxsize=None)
+def label_path(label, fontsize=8):
+    """Returns the glyph outline of a label rotated by 90 degrees, in points with its lower left corner at the origin."""
+    path = TextPath((0, 0), label, prop=FontProperties(size=fontsize))
+    path = path.transformed(Affine2D().rotate_deg(90))
+    extents = path.get_extents()
+    return path.transformed(Affine2D().translate(-extents.x0, -extents.y0))
+
+class SpectrumRenderer:
+    """
+    Renders mock mass spectra into one reused Agg figure. The axes are drawn once and kept as a background; every
+    spectrum restores it and draws one line collection per ion type, its ion labels as two path collections (white
+    outline, then black text) instead of one text artist per ion, the m/z axis, the legend and the title.
+    """
+
+    def __init__(self):
+        self.fig, self.ax = plt.subplots(figsize=(12, 8))
+        self.artists = []
+        self.background = None
+        self.legend_types = None
+
+        # Label paths are in points
+        self.label_transform = Affine2D().scale(self.fig.dpi / 72)
+
+        self.ax.set_xlabel("Calculated m/z values (Da)")
+        self.ax.set_ylabel("Intensity (%) (Mock values)")
+        self.ax.set_ylim(0, 100)
+
+    def set_legend(self, ion_types):
+        """Sets the legend to the (ion type, is list) entries of a spectrum, HCD or ETD for the peptide ions."""
+        if ion_types == self.legend_types:
+            return
+        handles = []
+        for ion_type, is_list in ion_types:
+            label = f"{ion_type} ({'HCD' if ion_type in ['b', 'y'] else 'ETD'})" if is_list else ion_type
+            handles.append(Line2D([0], [0], color=ion_color(ion_type), lw=2,
+                                  linestyle=ion_style_map.get(ion_type, "-"), label=label))
+        self.ax.legend(handles=handles, title="Ion Types", loc="upper right", fontsize=8)
+        self.legend_types = ion_types
+
+    def label_collection(self, paths, offsets, **kwargs):
+        """Adds the label paths at their data offsets as one collection."""
+        collection = PathCollection(paths, offsets=offsets, offset_transform=self.ax.transData, clip_on=False, zorder=3,
+                                    **kwargs)
+        collection.set_transform(self.label_transform)
+        return self.ax.add_collection(collection, autolim=False)
+
+    def capture_background(self, title):
+        """Lays the figure out for a title and keeps the pixels of everything that is the same in every spectrum."""
+        self.ax.set_title(title)
+        self.fig.tight_layout()
+        dynamic = [self.ax.title, self.ax.xaxis, self.ax.get_legend()] + list(self.ax.spines.values())
+        for artist in dynamic:
+            artist.set_visible(False)
+        self.fig.canvas.draw()
+        self.background = self.fig.canvas.copy_from_bbox(self.fig.bbox)
+        for artist in dynamic:
+            artist.set_visible(True)
+
+    def render(self, ion_series, title, output_file):
+        """Draws the spectrum of an ion series and saves it to output_file."""
+        # The legend lists the ion types of this spectrum; it is drawn over the background like the title
+        self.set_legend(tuple((ion_type, isinstance(values, list)) for ion_type, values in ion_series.items()))
+        if self.background is None:
+            self.capture_background(title)
+        for artist in self.artists:
+            artist.remove()
+        self.artists = []
+
+        paths = []
+        offsets = []
+        for ion_type, (mz_values, names) in ion_labels(ion_series).items():
+            if not mz_values:
+                continue
+            line_length = ion_length_map.get(ion_type, 50)
+            self.artists.append(self.ax.vlines(mz_values, 0, line_length, color=ion_color(ion_type),
+                                               lw=2, linestyle=ion_style_map.get(ion_type, "-")))
+            paths.extend(label_path(name) for name in names)
+            offsets.extend((mz, line_length) for mz in mz_values)
+
+        if offsets:
+            self.artists.append(self.label_collection(paths, offsets, facecolor="white", edgecolor="white", linewidth=3))
+            self.artists.append(self.label_collection(paths, offsets, facecolor="black", edgecolor="none"))
+
+            # Scale the m/z axis to the ions, with the default 5% margins
+            low = min(mz for mz, _ in offsets)
+            high = max(mz for mz, _ in offsets)
+            margin = (high - low) * 0.05 or 1
+            self.ax.set_xlim(low - margin, high + margin)
+        self.ax.set_title(title)
+
+        # Draw the spectrum over the background in the order of a full draw
+        self.fig.canvas.restore_region(self.background)
+        axes_artists = self.artists + list(self.ax.spines.values()) + [self.ax.xaxis]
+        for artist in sorted(axes_artists, key=lambda artist: artist.get_zorder()) + [self.ax.get_legend(), self.ax.title]:
+            self.ax.draw_artist(artist)
+
+        # Save as RGB (the figure is opaque) with fast compression. Write to a temporary file first, so an interrupted
+        # run leaves no partial plot behind
+        temporary_file = f"{output_file}.tmp"
+        pixels = np.ascontiguousarray(np.asarray(self.fig.canvas.buffer_rgba())[..., :3])
+        Image.fromarray(pixels).save(temporary_file, format="png", compress_level=3)
+        os.replace(temporary_file, output_file)
+
+# Renderer of a worker process
+renderer = None
+
+def init_renderer():
+    """Creates the renderer of a worker process."""
+    global renderer
+    renderer = SpectrumRenderer()
+
+def render_chunk(jobs):
+    """Renders a chunk of (IonSeries string, title, output file) jobs and returns the number of plots."""
+    for ion_series, title, output_file in jobs:
+        renderer.render(ast.literal_eval(ion_series), title, output_file)
+    return len(jobs)
+
+def plot_chunks(csv_file, output_dir, chunk_size, force=False, stats=None):
+    """
+    Yields the plot jobs of a glycopeptide library CSV in chunks, reading it chunk by chunk. Rows whose plot is newer
+    than the CSV are skipped unless force is set, and counted in stats["skipped"].
+    """
+    input_time = os.path.getmtime(csv_file)
+    for df in pd.read_csv(csv_file, usecols=plot_columns, chunksize=chunk_size):
+        jobs = []
+        for row in df.to_dict('records'):
+            # Skip peptides longer than 50 residues
+            if len(row['Peptide']) > 50:
+                continue
+            title, file_name = plot_title(row)
+            output_file = os.path.join(output_dir, file_name)
+            if not force and os.path.exists(output_file) and os.path.getmtime(output_file) >= input_time:
+                if stats is not None:
+                    stats["skipped"] += 1
+                continue
+            jobs.append((row['IonSeries'], title, output_file))
+        if jobs:
+            yield jobs
+
+def render_pool(executor, chunks, max_pending):
+    """Renders chunks on the pool with at most max_pending chunks in flight and returns the number of plots."""
+    rendered = 0
+    pending = set()
+    for jobs in chunks:
+        if len(pending) >= max_pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            rendered += sum(future.result() for future in done)
+        pending.add(executor.submit(render_chunk, jobs))
+    return rendered + sum(future.result() for future in pending)
 
 def main():
   """Main function"""
   parser = argparse.ArgumentParser(description="Plot mock mass spectra from glycopeptide ion series CSV file.")
-  parser.add_argument('-i', '--input', required=True, help="Input CSV file containing glycopeptide ion series info.")
+  parser.add_argument('-i', '--input', required=True, nargs='+', help="Input CSV files containing glycopeptide ion series info.")
   parser.add_argument('-o', '--output', default="mock_mass_spectra", help="Output directory to save the plot.")
+  parser.add_argument('-w', '--workers', type=int, default=os.cpu_count(), help="Number of rendering processes (default: all CPU cores).")
+  parser.add_argument('--chunk_size', type=int, default=64, help="Rows per rendering task (default: 64).")
+  parser.add_argument('--force', action='store_true', help="Render plots that are already up to date.")
   args = parser.parse_args()
 
-  # Arguement parser
-  csv_file = args.input
-  output_dir = args.output
-
-  # Read csv to dataframe from input -i flag
-  df = read_input_data(csv_file)
-
-  # Review file for input data
+  # Review files for input data
   required_columns = ['IonSeries', 'ProteinID', 'Peptide', 'Composition', 'GlyToucan_AC']
-  print("Columns in CSV file:", df.columns.tolist())
-  for col in required_columns:
-    if col not in df.columns:
-      raise KeyError(f"Missing required column: {col}")
-
-  # Add ion_number column based on IonSeries
-  # Ensure IonSeries is parsed as dictionary
-  df['IonSeries'] = df['IonSeries'].apply(ast.literal_eval)
-  df['ion_number'] = df.apply(compute_ion_number, axis=1)
+  for csv_file in args.input:
+    columns = pd.read_csv(csv_file, nrows=0).columns
+    for col in required_columns:
+      if col not in columns:
+        raise KeyError(f"Missing required column in {csv_file}: {col}")
 
   # Creat output directory
-  create_output_directory(output_dir)
-  
-  # Define column mapping
-  color_mapping = define_colors(df)
-
-  # Iterate through each row in the dataframe
-  for index, row in df.iterrows():
-    # Extract metadata for plot title and filename
-    protein = row['ProteinID']
-    peptide_sequence = row['Peptide']
-    glytoucan_ac = row['GlyToucan_AC']
-    glycan_composition = row['Composition']
-    glycopeptide_mass = row ['GlycopeptideMass']
-    glycan_mass = row['GlycanMass']
-    peptide_mass = row['PeptideMass']
-    site = pd.to_numeric(row['Site'])
-    if site.is_integer():
-      site = int(site)
-    
-    # Create descriptive title with metadata
-    title = f"Glycopeptide Sequence Finder: Mock Glycopeptide Mass Spectrum (HCD: b, y ions / ETD: c, z ions)\nProtein Identifer: {protein}, Glycopeptide Mass: {glycopeptide_mass}\nSite: {site}, Peptide: {peptide_sequence}, Peptide Mass: {peptide_mass}\nGlycan Composition: {glycan_composition}, GlyToucan: {glytoucan_ac}, Glycan Mass: {glycan_mass}"
-    
-    # Create unique output filename for each row using metadata
-    output_file = os.path.join(output_dir, f"{protein}_{site}_{peptide_sequence}_{glytoucan_ac}_mock_mass_spectrum.png").replace('|', '_') # safe file name
-
-    # Create single row dataframe for plotting
-    row_df = pd.DataFrame([row])
-
-    # If peptide (peptide_sequence) length is greater than 50 stop for loop
-    if len(peptide_sequence) > 50:
-       continue
-    
-    # Generate plot for this specific row
-    fig, _ = create_mass_spectrum_plot(row_df, color_mapping, title)
-    
-    # Save plot to unique filename
-    save_plot(fig, output_file)
+  create_output_directory(args.output)
+
+  start_time = time.perf_counter()
+  stats = {"skipped": 0}
+  rendered = 0
+  if args.workers > 1:
+    # One persistent pool renders the rows of every input file
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=init_renderer) as executor:
+      for csv_file in args.input:
+        rendered += render_pool(executor, plot_chunks(csv_file, args.output, args.chunk_size, args.force, stats), 4 * args.workers)
+        print(f"Plotted {csv_file}")
+  else:
+    init_renderer()
+    for csv_file in args.input:
+      rendered += sum(render_chunk(jobs) for jobs in plot_chunks(csv_file, args.output, args.chunk_size, args.force, stats))
+      print(f"Plotted {csv_file}")
+
+  print(f"{rendered} plots saved to {args.output} in {time.perf_counter() - start_time:.2f} seconds ({stats['skipped']} up to date).")
 
 if __name__ == "__main__":
-  main()
\ No newline at end of file
+  main()
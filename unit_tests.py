@@ -1,6 +1,18 @@
 import unittest
 import pandas as pd
+import numpy as np
+import argparse
+import ast
+import bz2
+import gzip
+import lzma
+import io
+import json
 import os
+import subprocess
+import sys
+import tempfile
+from Bio import SeqIO
 
 # Import functions
 from glycopeptide_sequence_finder_cmd import (
@@ -12,7 +24,48 @@ from glycopeptide_sequence_finder_cmd import (
     compute_mz,
     process_glycopeptides,
     process_fasta,
-    write_csv
+    read_fasta_records,
+    write_csv,
+    StageProfiler,
+    ProgressMeter,
+    metrics_logger,
+    GlycopeptideFinder,
+    GlycopeptideRecord,
+    RowWriter,
+    stream_record_rows,
+    write_record_chunks,
+    open_library_output,
+    fasta_stream_records,
+    fasta_records,
+    fasta_chunk_records,
+    library_output_files,
+    glycopeptide_library_fields,
+    default_n_glycans,
+    GlycanLibrary,
+    load_glycan_records,
+    calculate_n_glycopeptide_ions,
+    generate_all_y_ions,
+    add_ion_rows,
+    glycopeptide_ion_table,
+    isotope_envelope,
+    add_isotope_rows,
+    compute_hf_experimental,
+    load_glycan_hydrophobicity,
+    add_hf_experimental_rows
+)
+from batch_glycopeptide_sequence_finder import list_fasta_files, iter_work_units, split_work_units, write_proteome_units
+from glycopeptide_sequence_finder_server import PrecursorIndex, LatencyStats, GlycopeptideServer
+from glycopeptide_sequence_finder_client import GlycopeptideClient
+from export_mock_mass_spectra import library_spectra, unique_spectrum_ids, write_mgf, write_npz, load_spectra
+from plot_mock_mass_spectra import plot_chunks, init_renderer, render_chunk
+sys.path.insert(0, "machine_learning")
+from build_glycopeptide_dataset import build_dataset, ShardedDataset
+sys.path.insert(0, "benchmarks")
+from benchmark_glycopeptide_sequence_finder import benchmark_input, compare_to_baseline
+sys.path.insert(0, "glycopeptide_hydrophobicity_library")
+from compute_glycopeptide_hydrophobicity import build_glycan_hf_table, score_library
+from compute_glycan_hydrophobicity import (
+    rank_glycans_by_hydrophobicity, accumulate_moments, merge_moments, save_moments, load_moments, rank_glycans_from_moments
 )
 
 class TestGlycopeptideSequenceFinder(unittest.TestCase):
@@ -157,5 +210,547 @@ MKWVTFISLLFLFSSAYSRGVFRRDTHKSEIAHRFKDLGE
 
         os.remove(output_file)
 
+    def test_benchmark_smoke(self):
+        """Test the benchmark times every stage of a toy FASTA and round-trips the JSON baseline comparison."""
+        with tempfile.TemporaryDirectory() as output_dir:
+            fasta_file = os.path.join(output_dir, "toy.fasta")
+            with open(fasta_file, "w") as f:
+                f.write(">sp|P1|TEST1\nMKNGTAKRLLNESQRK\n")
+            entries = benchmark_input(fasta_file, "trypsin", 0, load_glycan_records("N"), 3, 25, 1, output_dir)
+            self.assertIn("ion_series", [entry["stage"] for entry in entries])
+
+            results_file = os.path.join(output_dir, "results.json")
+            with open(results_file, "w") as f:
+                json.dump({"results": entries}, f)
+            with open(results_file) as f:
+                baseline = json.load(f)
+        self.assertEqual(compare_to_baseline({"results": entries}, baseline, 0.2), [])
+        slower = [{**entry, "min_seconds": entry["min_seconds"] * 2 + 1} for entry in entries]
+        self.assertEqual(len(compare_to_baseline({"results": slower}, baseline, 0.2)), len(entries))
+
+    def test_stage_profiler(self):
+        """Test StageProfiler records stages per stage and per protease."""
+        profiler = StageProfiler()
+        with profiler.stage("digest", "trypsin"):
+            cleave_sequence("MKWVTFISLLFLFSSAYSRGVFRRDTHKSEIAHRFKDLGE", "trypsin")
+        with profiler.stage("digest", "lys-c"):
+            cleave_sequence("MKWVTFISLLFLFSSAYSRGVFRRDTHKSEIAHRFKDLGE", "lys-c")
+        summary = profiler.summary()
+        self.assertEqual(len(summary["stages"]), 2)
+        self.assertEqual(list(summary["per_stage"]), ["digest"])
+        self.assertEqual(list(summary["per_protease"]), ["trypsin", "lys-c"])
+        self.assertIn("max_rss_mb", summary["stages"][0])
+        self.assertNotIn("peak_memory_mb", summary["stages"][0])  # tracemalloc is opt-in
+
+    def test_progress_meter(self):
+        """Test ProgressMeter emits counters and rates as JSON lines."""
+        progress = ProgressMeter(interval=3600)
+        progress.start(protease="trypsin")
+        with self.assertLogs(metrics_logger, level="INFO") as logs:
+            progress.update(proteins=2, peptides=10)
+            progress.update(glycopeptides=3, rows_written=13)
+            progress.emit(final=True)
+        self.assertEqual(len(logs.records), 1)  # Rate limited, only the final line
+        metrics = json.loads(logs.records[0].getMessage())
+        self.assertEqual(metrics["protease"], "trypsin")
+        self.assertEqual((metrics["proteins"], metrics["peptides"], metrics["glycopeptides"], metrics["rows_written"]), (2, 10, 3, 13))
+        self.assertTrue(metrics["final"])
+
+    def test_list_fasta_files(self):
+        """Test list_fasta_files orders FASTA files largest first."""
+        os.makedirs('test_batch', exist_ok=True)
+        with open('test_batch/small.fasta', 'w') as f:
+            f.write(">sp|P1|SMALL\nMK\n")
+        with open('test_batch/large.fasta', 'w') as f:
+            f.write(">sp|P2|LARGE\nMKWVTFISLLFLFSSAYSRGVFRRDTHKSEIAHRFKDLGE\n")
+
+        result = list_fasta_files('test_batch')
+        self.assertEqual([os.path.basename(f) for f in result], ['large.fasta', 'small.fasta'])
+
+        os.remove('test_batch/small.fasta')
+        os.remove('test_batch/large.fasta')
+        os.rmdir('test_batch')
+
+    def test_split_work_units(self):
+        """Test split_work_units splits a FASTA file into ordered units of protein records."""
+        with open('test_units.fasta', 'w') as f:
+            for i in range(5):
+                f.write(f">sp|P{i}|TEST{i}\nMKWVTFISLLFLFSSAYSR\n")
+
+        result = split_work_units('test_units.fasta', 2)
+        self.assertEqual([len(unit) for unit in result], [2, 2, 1])
+        self.assertEqual([record[0] for unit in result for record in unit], [f"sp|P{i}|TEST{i}" for i in range(5)])
+
+        os.remove('test_units.fasta')
+
+    def test_work_unit_failures(self):
+        """Test unreadable FASTA files are reported per file and failed files are not read any further."""
+        with tempfile.TemporaryDirectory() as directory:
+            good_file = os.path.join(directory, "good.fasta")
+            bad_file = os.path.join(directory, "bad.fasta.gz")
+            with open(good_file, "w") as f:
+                for i in range(5):
+                    f.write(f">sp|P{i}|TEST{i}\nMKWVTFISLLFLFSSAYSR\n")
+            with open(bad_file, "wb") as f:
+                f.write(b"\x1f\x8b\x08\x00 not gzip data")
+
+            errors = []
+            units = [(os.path.basename(fasta_file), unit_index) for fasta_file, unit_index, _, _ in
+                     iter_work_units([bad_file, good_file], 2, on_error=lambda fasta_file, error: errors.append(fasta_file))]
+            self.assertEqual(errors, [bad_file])
+            self.assertEqual(units, [("good.fasta", 0), ("good.fasta", 1), ("good.fasta", 2)])
+
+            skip = set()
+            units = []
+            for fasta_file, unit_index, _, _ in iter_work_units([good_file], 2, skip):
+                units.append(unit_index)
+                skip.add(fasta_file)  # The first unit failed
+            self.assertEqual(units, [0])
+
+        result = subprocess.run([sys.executable, "batch_glycopeptide_sequence_finder.py", "--fragment_charges", "2", "1"],
+                                capture_output=True, text=True)
+        self.assertEqual(result.returncode, 2)
+        self.assertIn("--fragment_charges", result.stderr)
+
+    def test_write_proteome_units(self):
+        """Test write_proteome_units appends work units in unit order as soon as the earlier units are written."""
+        def unit(peptide):
+            return {"peptide_library": [{"Peptide": peptide}], "glycopeptide_library": [], "glycopeptide_fields": ["Peptide"]}
+        proteome = {"units": 2, "next_unit": 0, "parts": {1: unit("LATER")}, "peptides": 0, "glycopeptides": 0,
+                    "peptide_file": "test_units_peptides.csv", "glycopeptide_file": "test_units_glycopeptides.csv"}
+
+        self.assertFalse(write_proteome_units(proteome))
+        self.assertFalse(os.path.exists('test_units_peptides.csv'))
+        proteome["parts"][0] = unit("FIRST")
+        self.assertTrue(write_proteome_units(proteome))
+        with open('test_units_peptides.csv') as f:
+            self.assertEqual([line.split(",")[0] for line in f.read().splitlines()], ["Peptide", "FIRST", "LATER"])
+        self.assertEqual(proteome["peptides"], 2)
+
+        os.remove('test_units_peptides.csv')
+        os.remove('test_units_glycopeptides.csv')
+
+    def test_read_fasta_records(self):
+        """Test read_fasta_records yields the same records as Bio.SeqIO."""
+        with open('test_reader.fasta', 'wb') as f:
+            f.write(b"comment before the first record\n"
+                    b">sp|P1|TEST1 Test protein OS=Homo sapiens OX=9606 GN=T1 PE=1 SV=1  \r\n"
+                    b"MKWVT FISLL\r\nFLFSSAYSR\r\n\r\n"
+                    b">sp|P2|TEST2\n"
+                    b">\n"
+                    b"NGTNVS\nNAT")
+
+        expected = [(record.id, record.description, str(record.seq)) for record in SeqIO.parse('test_reader.fasta', 'fasta')]
+        self.assertEqual(list(read_fasta_records('test_reader.fasta')), expected)
+
+        os.remove('test_reader.fasta')
+
+    def test_import_without_pandas(self):
+        """Test importing the command line module does not import pandas."""
+        code = "import sys, glycopeptide_sequence_finder_cmd; print('pandas' in sys.modules)"
+        result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+        self.assertEqual(result.stdout.strip(), "False")
+
+    def test_glycopeptide_finder(self):
+        """Test GlycopeptideFinder returns typed glycopeptide records in memory without writing files."""
+        files_before = set(os.listdir('.'))
+        finder = GlycopeptideFinder("trypsin", missed_cleavages=0, glycosylation_type="N", charge=3)
+        fasta = b">sp|P1|TEST1 Test OS=Homo sapiens OX=9606 GN=T1 PE=1 SV=1\nMKNGTAKR\n"
+
+        result = finder.run_fasta(fasta)
+        self.assertEqual(result.proteins, 1)
+        self.assertEqual([peptide.Peptide for peptide in result.peptides], ["MK", "NGTAK", "R"])
+        self.assertEqual(len(result.glycopeptides), 1)
+        glycopeptide = result.glycopeptides[0]
+        self.assertIsInstance(glycopeptide, GlycopeptideRecord)
+        self.assertEqual((glycopeptide.Peptide, glycopeptide.Site, glycopeptide.Sequon), ("NGTAK", 3, "NGT"))
+        self.assertEqual(len(glycopeptide.MZ), 2)
+        self.assertEqual(finder.digest_sequence("MKNGTAKR", "sp|P1|TEST1").Glycopeptides, result.glycopeptides)
+        self.assertEqual(set(os.listdir('.')), files_before)
+
+    def test_precursor_index(self):
+        """Test the server precursor index finds glycopeptides within the ppm tolerance and reports p99 latency."""
+        result = GlycopeptideFinder("trypsin", charge=3, ion_series=False).run_fasta(b">P1\nMKNGTAKRLLNESQRK\n")
+        index = PrecursorIndex()
+        index.add(result.glycopeptides)
+        target = result.glycopeptides[0]
+
+        matches = index.lookup(target.GlycopeptideMass + target.GlycopeptideMass * 5e-6, 10)
+        self.assertEqual([record for _, record in matches], [target])
+        self.assertEqual(index.lookup(target.GlycopeptideMass + 1.0, 10), [])
+
+        stats = LatencyStats()
+        for milliseconds in range(1, 101):
+            stats.record("/mass", milliseconds / 1000)
+        self.assertEqual(stats.summary()["/mass"]["p99_ms"], 99.0)
+
+    def test_server_finder_cache(self):
+        """Test the server keeps only the most recently used finder configurations."""
+        args = argparse.Namespace(glycosylation="N", glycan=None, protease="trypsin", missed_cleavages=0, charge=3,
+                                  peptide_max_length=25, threads=1, max_finders=2)
+        server = GlycopeptideServer(args)
+        trypsin = server.finder()
+        server.finder("chymotrypsin")
+        self.assertIs(server.finder(), trypsin)
+        server.finder("lys-c")
+        self.assertEqual([key[0] for key in server.finders], ["trypsin", "lys-c"])
+        server.executor.shutdown()
+
+    def test_server_client(self):
+        """Test the server answers valid requests, rejects invalid and oversized bodies over a Unix socket."""
+        with tempfile.TemporaryDirectory() as directory:
+            socket_path = os.path.join(directory, "server.sock")
+            server = subprocess.Popen([sys.executable, "glycopeptide_sequence_finder_server.py", "-s", socket_path,
+                                       "--max_body", "1000"], stdout=subprocess.PIPE, text=True)
+            try:
+                self.assertIn("listening", server.stdout.readline())
+                client = GlycopeptideClient(socket_path=socket_path)
+                status, response = client.digest(sequence="MKNGTAKRLLNESQRK", protein_id="P1")
+                self.assertEqual(status, 200)
+                self.assertEqual([record["Peptide"] for record in response["proteins"][0]["glycopeptides"]], ["NGTAK", "LLNESQR"])
+                self.assertEqual(client.mass(mass=1381.57192)[0], 200)
+                for path, body in (("/mass", []), ("/digest", 3), ("/mass", {"mass": "heavy"}),
+                                   ("/mass", {"mz": 700, "charge": "two"}), ("/mass", {"mass": 1000, "tolerance_ppm": "x"}),
+                                   ("/digest", {"sequence": "MKNGTAK", "charge": "x"}), ("/digest", {"proteins": ["MKNGTAK"]})):
+                    status, response = client.request("POST", path, body)
+                    self.assertEqual(status, 400, body)
+                    self.assertIn("error", response)
+                self.assertEqual(client.digest(sequence="M" * 2000)[0], 413)
+                self.assertEqual(client.request("GET", "/health")[0], 200)  # A new connection after the 413
+                client.close()
+            finally:
+                server.terminate()
+                server.communicate(timeout=10)
+
+    def test_stream_record_rows(self):
+        """Test stream_record_rows writes every protein's glycopeptide rows as NDJSON as it is processed."""
+        stdin = io.BytesIO(b">P1\nMKNGTAKR\n>P2\nMKLLR\n>P3\nLNESQRK\n")
+        stdout = io.StringIO()
+        writer = RowWriter(stdout, glycopeptide_library_fields(3), "ndjson", flush=True)
+
+        counts = stream_record_rows(fasta_stream_records(stdin), "trypsin", 0, "N", default_n_glycans, 3, 25, writer)
+        rows = [json.loads(line) for line in stdout.getvalue().splitlines()]
+        self.assertEqual(counts, {"proteins": 3, "peptides": 7, "glycopeptides": 2})
+        self.assertEqual([(row["ProteinID"], row["Peptide"]) for row in rows], [("P1", "NGTAK"), ("P3", "LNESQR")])
+
+    def test_write_record_chunks(self):
+        """Test chunked writing to a parallel gzip file gives the CSV of the protein by protein stream."""
+        fasta = b">P1\nMKNGTAKRLLNESQRK\n>P2\nMKLLR\n>P3\nLNESQRKNCTWR\n"
+        expected = io.StringIO()
+        expected_counts = stream_record_rows(fasta_stream_records(io.BytesIO(fasta)), "trypsin", 0, "N", default_n_glycans,
+                                             3, 25, RowWriter(expected, glycopeptide_library_fields(3)))
+        with tempfile.TemporaryDirectory() as output_dir:
+            output_file = os.path.join(output_dir, "library.csv.gz")
+            with open_library_output(output_file, threads=2) as stream:
+                stream.buffer.block_size = 1000  # Several gzip members
+                counts = write_record_chunks(fasta_stream_records(io.BytesIO(fasta)), "trypsin", 0, "N", default_n_glycans,
+                                             3, 25, RowWriter(stream, glycopeptide_library_fields(3)), chunk_size=1)
+            blocks = stream.buffer.blocks
+            with gzip.open(output_file, "rt", newline="") as file:
+                chunked = file.read()
+        self.assertEqual(counts, expected_counts)
+        self.assertGreater(blocks, 1)
+        self.assertEqual(chunked, expected.getvalue())
+
+    def test_compressed_fasta_records(self):
+        """Test gzip, bzip2 and xz FASTA files and streams are detected by magic bytes and read like plain FASTA."""
+        fasta = b">sp|P1|TEST1 Protein 1\nMKNGTAKR\nLLNESQRK\n>sp|P2|TEST2 Protein 2\nMKLLR\n" * 50
+        expected = list(fasta_records(fasta))
+        with tempfile.TemporaryDirectory() as output_dir:
+            for extension, compress in ((".gz", gzip.compress), (".bz2", bz2.compress), (".xz", lzma.compress)):
+                fasta_file = os.path.join(output_dir, f"proteome.fasta{extension}")
+                with open(fasta_file, "wb") as file:
+                    file.write(compress(fasta))
+                self.assertEqual(list(read_fasta_records(fasta_file)), expected)
+                with open(fasta_file, "rb") as handle:
+                    self.assertEqual(list(fasta_stream_records(handle)), expected)
+                self.assertEqual(list(fasta_records(compress(fasta))), expected)
+        self.assertEqual(list(fasta_chunk_records([fasta[i:i + 7] for i in range(0, len(fasta), 7)])), expected)
+
+        # A pipe delivering two bytes at a time, shorter than the magic bytes on the first peek
+        class Pipe(io.RawIOBase):
+            def __init__(self, data):
+                self.data = data
+            def readable(self):
+                return True
+            def readinto(self, buffer):
+                chunk, self.data = self.data[:2], self.data[2:]
+                buffer[:len(chunk)] = chunk
+                return len(chunk)
+        for data in (fasta, gzip.compress(fasta), lzma.compress(fasta)):
+            self.assertEqual(list(fasta_stream_records(io.BufferedReader(Pipe(data)))), expected)
+        self.assertEqual(library_output_files("proteome.fasta.gz", "trypsin", 0, 3, "N"),
+                         library_output_files("proteome.fasta", "trypsin", 0, 3, "N"))
+
+    def test_glycan_library(self):
+        """Test GlycanLibrary parses compositions once, recomputes and validates masses and derives shorthand names."""
+        glycans = [
+            {"glytoucan_ac": "G1", "composition": "HexNAc(2)Hex(9)", "mass": "1864.634157"},
+            {"glytoucan_ac": "G2", "composition": "HexNAc(1)", "mass": 221.089937305, "converted_glycan": "N1"},
+            {"glytoucan_ac": "G3", "composition": "HexNAc(2)Hex(3)", "mass": 1216.422863},
+        ]
+        with self.assertLogs("glycopeptide_sequence_finder_core", level="DEBUG"):
+            library = GlycanLibrary(glycans)
+
+        self.assertEqual([glycan["glycan_id"] for glycan in library], [0, 1, 2])
+        self.assertEqual([glycan["shorthand_glycan"] for glycan in library], ["N2H9", "N1", "N2H3"])
+        self.assertEqual(library.counts[0][library.monosaccharides.index("Hex")], 9)
+        self.assertAlmostEqual(library.computed_masses[0], 1864.634, places=3)
+        self.assertEqual([mismatch["glytoucan_ac"] for mismatch in library.mismatches], ["G3"])
+        self.assertEqual(library[2]["mass"], 1216.422863)  # Listed masses are kept
+        for glycosylation_type in ("N", "O", "C"):  # The default libraries are validated like any other
+            self.assertEqual(load_glycan_records(glycosylation_type).mismatches, [])
+        self.assertEqual(calculate_n_glycopeptide_ions("NGTAK", library.composition("HexNAc(2)Hex(9)")),
+                         calculate_n_glycopeptide_ions("NGTAK", "HexNAc(2)Hex(9)"))
+
+    def test_generate_glycan_library(self):
+        """Test the generated glycan library follows the bounds and rules, is sorted by mass and loads with -y."""
+        output_file = "test_generated_glycans.csv"
+        script = os.path.join("glycan_mass_library", "generate_glycan_library.py")
+        subprocess.run([sys.executable, script, "--hexnac", "2", "4", "--hex", "3", "5", "--fuc", "0", "1",
+                        "--neuac", "0", "2", "-o", output_file], capture_output=True, check=True)
+        try:
+            library = load_glycan_records("N", output_file)
+        finally:
+            os.remove(output_file)
+
+        compositions = [glycan["composition"] for glycan in library]
+        self.assertEqual(compositions[0], "HexNAc(2)Hex(3)")
+        self.assertIn("HexNAc(4)Hex(5)dHex(1)NeuAc(2)", compositions)
+        self.assertNotIn("HexNAc(2)Hex(3)NeuAc(1)", compositions)  # sialic rule
+        self.assertEqual(len(set(compositions)), len(compositions))
+        self.assertEqual([glycan["mass"] for glycan in library], sorted(glycan["mass"] for glycan in library))
+        self.assertEqual(library.mismatches, [])
+
+    def test_generate_all_y_ions(self):
+        """Test generate_all_y_ions enumerates the sub-composition lattice with the fragmentation path counts."""
+        y_ions = generate_all_y_ions("NGTAK", "HexNAc(2)Hex(1)", path_counts=True)
+        self.assertEqual(list(y_ions), ["Y0", "Hex(1)", "HexNAc(1)", "HexNAc(1)Hex(1)", "HexNAc(2)", "HexNAc(2)Hex(1)"])
+        self.assertEqual(y_ions["Y0"], (calculate_n_glycopeptide_ions("NGTAK", "HexNAc(2)Hex(1)")["Y"]["Y0"], 3))
+        self.assertEqual(y_ions["HexNAc(1)"][1], 2)
+        self.assertEqual(y_ions["HexNAc(2)Hex(1)"][1], 3)
+
+        # A large sialylated glycan has 560 Y ions, not one series per permutation
+        self.assertEqual(len(generate_all_y_ions("NGTAK", "HexNAc(6)Hex(7)dHex(1)NeuAc(4)")), 560)
+
+    def test_glycan_fragment_table(self):
+        """Test the glycan fragment table is computed once per glycan and gives the same ion series for every peptide."""
+        library = GlycanLibrary(default_n_glycans)
+        fragments = library.fragment_table("HexNAc(2)Hex(3)")
+        self.assertIs(library.fragment_table("HexNAc(2)Hex(3)"), fragments)
+        self.assertEqual(len(fragments["Y"]), 6)
+        self.assertAlmostEqual(fragments["Y"][1], 203.0794)
+
+        rows = add_ion_rows([{"Peptide": peptide, "Composition": "HexNAc(2)Hex(3)"} for peptide in ("NGTAK", "LNESQR")], library)
+        for row in rows:
+            self.assertEqual(row["IonSeries"], calculate_n_glycopeptide_ions(row["Peptide"], "HexNAc(2)Hex(3)", charge=1))
+
+    def test_fragment_charges(self):
+        """Test FragmentIons holds the fragment ions of every charge and charge 1 matches the IonSeries."""
+        library = GlycanLibrary(default_n_glycans)
+        rows = add_ion_rows([{"Peptide": "NGTAK", "Composition": "HexNAc(2)Hex(3)"}], library, fragment_charges=(1, 2, 3))
+        fragment_ions = json.loads(rows[0]["FragmentIons"])
+        ion_series = rows[0]["IonSeries"]
+
+        self.assertEqual(fragment_ions, glycopeptide_ion_table("NGTAK", library.fragment_table("HexNAc(2)Hex(3)"), (1, 2, 3)))
+        self.assertEqual(fragment_ions["charges"], [1, 2, 3])
+        self.assertEqual(fragment_ions["b"][0], ion_series["b"])
+        self.assertEqual(fragment_ions["Y"][0], [ion_series["Y"][f"Y{i}"] for i in range(len(ion_series["Y"]))])
+        self.assertAlmostEqual(fragment_ions["y"][1][0], (ion_series["y"][0] + 1.007276) / 2, places=3)
+
+    def test_isotope_envelope(self):
+        """Test the isotope envelope of C100 and the Isotopes of a glycopeptide row."""
+        envelope = isotope_envelope({"C": 100})
+        self.assertAlmostEqual(envelope[1][0] / envelope[0][0], 100 * 0.0107 / 0.9893, places=6)
+        self.assertAlmostEqual(envelope[0][1], 1200.0, places=6)
+
+        row = {"Peptide": "NGTAK", "Composition": "HexNAc(2)Hex(3)", "GlycopeptideMass": 1706.677568}
+        isotopes = json.loads(add_isotope_rows([row], GlycanLibrary(default_n_glycans), top_n=3, max_charge=3)[0]["Isotopes"])
+        self.assertEqual(isotopes["peaks"], [0, 1, 2])
+        self.assertEqual(isotopes["abundance"][0], 1.0)
+        self.assertAlmostEqual(isotopes["mass"][0], 1706.6776, places=4)
+        self.assertAlmostEqual(isotopes["z2"][1], (isotopes["mass"][1] + 2 * 1.007276) / 2, places=3)
+        self.assertIn("z3", isotopes)
+
+    def test_hf_experimental_rows(self):
+        """Test HF_experimental rows match compute_hf_experimental and glycan HF tables average duplicates."""
+        rows = [{"Hydrophobicity": 0.5, "ShorthandGlycan": "N2H8", "Composition": "HexNAc(2)Hex(8)"},
+                {"Hydrophobicity": -1.2, "ShorthandGlycan": "N2H9", "Composition": "HexNAc(2)Hex(9)"},
+                {"Hydrophobicity": 0.1, "ShorthandGlycan": "N4H5", "Composition": "HexNAc(4)Hex(5)"}]
+        add_hf_experimental_rows(rows)
+        for row in rows[:2]:
+            self.assertEqual((row["HF_experimental"], row["rt_HF_experimental"]),
+                             compute_hf_experimental(row["Hydrophobicity"], row["ShorthandGlycan"]))
+        self.assertEqual((rows[2]["HF_experimental"], rows[2]["rt_HF_experimental"]), ("", ""))
+
+        glycan_hydrophobicity = load_glycan_hydrophobicity(
+            "glycopeptide_hydrophobicity_library/human_serum_csf_milk_mouse_brain_5tissues_HF_library.csv")
+        table = pd.read_csv("glycopeptide_hydrophobicity_library/human_serum_csf_milk_mouse_brain_5tissues_HF_library.csv",
+                            encoding="utf-8-sig")
+        N2H8 = table.loc[table["shorthand_glycan"] == "N2H8", "Scaled_HF"].mean()
+        self.assertAlmostEqual(glycan_hydrophobicity["N2H8"], N2H8)
+        self.assertAlmostEqual(glycan_hydrophobicity["HexNAc(2)Hex(8)"], N2H8)
+        self.assertAlmostEqual(add_hf_experimental_rows(rows[:1], glycan_hydrophobicity)[0]["rt_HF_experimental"],
+                               (N2H8 * 10 + 1) * 30)
+
+        finder = GlycopeptideFinder("trypsin", glycan_hydrophobicity={"N2H3": 0.25}, ion_series=False)
+        glycopeptide = finder.digest_sequence("MKNGTAKR", "P1").Glycopeptides[0]
+        self.assertEqual((glycopeptide.HF_experimental, glycopeptide.rt_HF_experimental),
+                         compute_hf_experimental(glycopeptide.Hydrophobicity, "N2H3", glycan_hydrophobicities={"N2H3": 0.25}))
+        self.assertIsNone(GlycopeptideFinder("trypsin").digest_sequence("MKNGTAKR", "P1").Glycopeptides[0].HF_experimental)
+
+    def test_export_mock_mass_spectra(self):
+        """Test mock spectra are exported as MGF and as an NPZ container fetched by glycopeptide ID."""
+        library = subprocess.run([sys.executable, "glycopeptide_sequence_finder_cmd.py", "-i", "-", "-o", "-"],
+                                 input=b">sp|P1|TEST1\nMKNGTAKRLLNESQRK\n", capture_output=True, check=True).stdout
+        with open("test_spectra.csv", "wb") as file:
+            file.write(library)
+        try:
+            spectra = list(library_spectra("test_spectra.csv"))
+            self.assertEqual(write_mgf(spectra, "test_spectra.mgf"), len(spectra))
+            self.assertEqual(write_npz(spectra, "test_spectra.npz"), len(spectra))
+            with open("test_spectra.mgf") as file:
+                mgf = file.read()
+            loaded = load_spectra("test_spectra.npz")
+        finally:
+            for file_name in ("test_spectra.csv", "test_spectra.mgf", "test_spectra.npz"):
+                if os.path.exists(file_name):
+                    os.remove(file_name)
+
+        self.assertEqual(mgf.count("BEGIN IONS"), len(spectra))
+        self.assertEqual(len(loaded), len(spectra))
+        spectrum = spectra[-1]
+        self.assertTrue(spectrum["id"].startswith("sp_P1_TEST1_"))
+        mz, intensity, labels = loaded[spectrum["id"]]
+        self.assertEqual(mz.tolist(), [peak[0] for peak in spectrum["peaks"]])
+        self.assertEqual(mz.tolist(), sorted(mz.tolist()))
+        self.assertEqual(labels.tolist(), [peak[2] for peak in spectrum["peaks"]])
+        self.assertEqual(intensity[labels.tolist().index("Y0")], 60)
+
+        # Repeated IDs are made unique, and rejected when writing the container
+        repeated = [spectrum, spectrum, {**spectrum, "id": spectrum["id"] + "_2"}]
+        self.assertEqual([unique["id"] for unique in unique_spectrum_ids(repeated)],
+                         [spectrum["id"], spectrum["id"] + "_2", spectrum["id"] + "_2_2"])
+        with tempfile.TemporaryDirectory() as directory:
+            with self.assertRaises(ValueError):
+                write_npz(repeated, os.path.join(directory, "repeated.npz"))
+        self.assertNotIn("matplotlib", subprocess.run(
+            [sys.executable, "-c", "import sys, export_mock_mass_spectra; print(sorted(sys.modules))"],
+            capture_output=True, text=True, check=True).stdout)
+
+    def test_plot_mock_mass_spectra(self):
+        """Test glycopeptide rows are rendered in batch and up to date plots are skipped on a rerun."""
+        library = subprocess.run([sys.executable, "glycopeptide_sequence_finder_cmd.py", "-i", "-", "-o", "-"],
+                                 input=b">sp|P1|TEST1\nMKNGTAKRLLNESQRK\n", capture_output=True, check=True).stdout
+        with tempfile.TemporaryDirectory() as directory:
+            csv_file = os.path.join(directory, "library.csv")
+            pd.read_csv(io.BytesIO(library)).head(2).to_csv(csv_file, index=False)
+            init_renderer()
+            stats = {"skipped": 0}
+            rendered = sum(render_chunk(jobs) for jobs in plot_chunks(csv_file, directory, 1, stats=stats))
+            plots = [file_name for file_name in os.listdir(directory) if file_name.endswith(".png")]
+            rerun = list(plot_chunks(csv_file, directory, 1, stats=stats))
+
+        self.assertEqual(rendered, 2)
+        self.assertEqual(len(plots), 2)
+        self.assertEqual(rerun, [])
+        self.assertEqual(stats["skipped"], 2)
+
+    def test_one_hot_encoder_formats(self):
+        """Test the sparse and memory-mapped one-hot encodings match the reference CSV encoding."""
+        script = os.path.join("machine_learning", "glycopeptide_composition_one_hot_encoder.py")
+        input_file = os.path.join("machine_learning", "glycopeptide_test.csv")
+        reference = pd.read_csv(os.path.join("machine_learning", "one_hot_encodings", "glycopeptide_test_onehotencoded.csv"))
+        expected = np.array([ast.literal_eval(encoding) for encoding in reference["One_Hot_Encoding"]], dtype=np.uint8)
+        try:
+            for output_file in ("test_encoding.npz", "test_encoding.npy"):
+                subprocess.run([sys.executable, script, "-i", input_file, "-o", output_file, "-f", output_file[-3:],
+                                "--chunk_size", "4"], capture_output=True, check=True)
+            with np.load("test_encoding.npz") as csr:
+                self.assertEqual(csr["format"].item(), b"csr")
+                self.assertEqual(csr["shape"].tolist(), list(expected.shape))
+                dense = np.zeros(expected.shape, dtype=np.uint8)
+                for row in range(len(expected)):
+                    dense[row, csr["indices"][csr["indptr"][row]:csr["indptr"][row + 1]]] = 1
+            encoded = np.load("test_encoding.npy", mmap_mode="r")
+            self.assertEqual(encoded.dtype, np.uint8)
+            np.testing.assert_array_equal(encoded, expected)
+            del encoded
+        finally:
+            for output_file in ("test_encoding.npz", "test_encoding.npy"):
+                if os.path.exists(output_file):
+                    os.remove(output_file)
+        np.testing.assert_array_equal(dense, expected)
+
+    def test_sharded_dataset(self):
+        """Test the sharded dataset keeps every row, splits by organism and shuffles batches reproducibly."""
+        libraries = [os.path.join("digested_glycopeptide_library", name) for name in (
+            "SARS-CoV_uniprotkb_proteome_UP000000354_AND_revi_2025_02_01_trypsin_digested_mc0_z2_N-glycopeptides.csv",
+            "orangutan_uniprotkb_proteome_UP000001595_AND_revi_2025_02_01_trypsin_digested_mc0_z2_N-glycopeptides.csv")]
+        rows = sum(len(pd.read_csv(library)) for library in libraries)
+        with tempfile.TemporaryDirectory() as output_dir:
+            manifest = build_dataset(libraries, output_dir, shard_size=1000, chunk_size=300, targets=["Hydrophobicity"])
+            dataset = ShardedDataset(output_dir)
+
+            self.assertEqual(len(dataset), rows)
+            self.assertEqual([shard["rows"] for shard in manifest["shards"]][:-1], [1000] * (len(manifest["shards"]) - 1))
+            self.assertEqual(manifest["organisms"], ["SARS-CoV", "orangutan"])
+
+            train, validation = dataset.split(by="organism", validation_fraction=0.5, seed=0)
+            organisms = dataset.groups("organism")
+            self.assertEqual(len(train) + len(validation), rows)
+            self.assertEqual(len(set(organisms[train]) & set(organisms[validation])), 0)
+
+            first = [x for x, _ in dataset.batches(train, batch_size=64, seed=1, epoch=0)]
+            again = [x for x, _ in dataset.batches(train, batch_size=64, seed=1, epoch=0)]
+            x, y = next(dataset.batches(train, batch_size=64, seed=1, epoch=1))
+            self.assertEqual(sum(len(batch) for batch in first), len(train))
+            np.testing.assert_array_equal(np.concatenate(first), np.concatenate(again))
+            self.assertFalse(np.array_equal(first[0], x))
+            self.assertEqual((x.shape[1], y.shape[1]), (manifest["encoding_size"], 1))
+            dataset.cache.clear()
+
+    def test_score_library(self):
+        """Test chunked glycopeptide hydrophobicity scoring joins the glycan HF table and passes input lines through."""
+        glycan_hf_table = build_glycan_hf_table(pd.DataFrame({
+            'Glycans': ['HexNAc(2)Hex(3)', 'HexNAc(4)Hex(5)'], 'Adjusted_HF': [-1.0, 0.5], 'Weighted_Adjusted_HF': [-2.0, 4.0]}))
+        lines = ['Peptide,Hydrophobicity,composition,IonSeries',
+                 'NGTK,1.5,HexNAc(2)Hex(3),"{\'b\': [115.05, 172.07]}"',
+                 'NESR,-0.25,HexNAc(4)Hex(5),"{\'b\': [115.05]}"',
+                 'NVTK,2.0,Hex(9),"{}"']
+        with tempfile.TemporaryDirectory() as output_dir:
+            input_file = os.path.join(output_dir, "library.csv")
+            output_file = os.path.join(output_dir, "library_HF.csv")
+            with open(input_file, "w") as file:
+                file.write("\n".join(lines) + "\n")
+            rows = score_library(input_file, glycan_hf_table, output_file, chunk_size=2)
+            with open(output_file) as file:
+                output_lines = file.read().splitlines()
+
+        self.assertEqual(rows, 3)
+        self.assertEqual(output_lines[0], lines[0] + ",GlycopeptideHydrophobicity,GlycopeptideHydrophobicityWeighted")
+        self.assertEqual(output_lines[1:], [lines[1] + ",0.5,-0.5", lines[2] + ",0.25,3.75", lines[3] + ",,"])
+
+    def test_merged_glycan_moments(self):
+        """Test merged online glycan HF moments rank glycans as the in-memory ranking of the combined data."""
+        data = pd.read_csv("glycopeptide_hydrophobicity_library/test_data/input/human_serum_glycopeptide_hydrophobicity_data.csv")
+        with tempfile.TemporaryDirectory() as output_dir:
+            data.to_csv(os.path.join(output_dir, "all.csv"), index=False)
+            data[:80].to_csv(os.path.join(output_dir, "first.csv"), index=False)
+            data[80:].to_csv(os.path.join(output_dir, "second.csv"), index=False)
+            rank_glycans_by_hydrophobicity(os.path.join(output_dir, "all.csv"), os.path.join(output_dir, "index.csv"))
+            expected = pd.read_csv(os.path.join(output_dir, "index.csv")).set_index('Glycans').sort_index()
+
+            save_moments(accumulate_moments([os.path.join(output_dir, "first.csv")], chunk_size=30),
+                         os.path.join(output_dir, "state.json"))
+            moments = merge_moments(load_moments(os.path.join(output_dir, "state.json")),
+                                    accumulate_moments([os.path.join(output_dir, "second.csv")]))
+
+        summary = rank_glycans_from_moments(moments)
+        self.assertEqual(list(summary.columns), ['Glycans'] + list(expected.columns))
+        summary = summary.set_index('Glycans').sort_index()
+        self.assertEqual(list(summary.index), list(expected.index))
+        np.testing.assert_allclose(summary.to_numpy(dtype=float), expected.to_numpy(dtype=float), rtol=1e-9, atol=1e-12)
+
 if __name__ == '__main__':
     unittest.main(verbosity=2)